@@ -1,5 +1,8 @@
 from main import create_app
 from main import db
+from main.migraciones import migrar
+from main.models import catalogo
+from main.resources.recolector import iniciar_recolector
 
 import os
 
@@ -8,5 +11,7 @@ app = create_app()
 app.app_context().push()
 
 if __name__ == '__main__':
-    db.create_all()
+    migrar()
+    catalogo.cargar()
+    iniciar_recolector(app)
     app.run(debug=True,port=os.getenv('PORT'))
\ No newline at end of file
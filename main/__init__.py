@@ -25,6 +25,35 @@ def create_app():
     
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER')
 
+    # Background export jobs: finished files are kept in EXPORT_FOLDER for EXPORT_TTL seconds
+    app.config['EXPORT_FOLDER'] = os.getenv('EXPORT_FOLDER', os.path.join(os.getenv('UPLOAD_FOLDER') or '.', 'exports'))
+    app.config['EXPORT_WORKERS'] = int(os.getenv('EXPORT_WORKERS', 2))
+    app.config['EXPORT_TTL'] = int(os.getenv('EXPORT_TTL', 3600))
+
+    # Background import jobs: one worker so imports don't compete for the SQLite write lock
+    app.config['IMPORT_FOLDER'] = os.getenv('IMPORT_FOLDER', os.path.join(os.getenv('UPLOAD_FOLDER') or '.', 'imports'))
+    app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', 1))
+    app.config['IMPORT_TTL'] = int(os.getenv('IMPORT_TTL', 3600))
+
+    # Attachment uploads: size limit for any upload, largest chunk accepted by the chunked
+    # protocol and how long an unfinished chunked upload can be resumed
+    app.config['UPLOAD_MAX_SIZE'] = int(os.getenv('UPLOAD_MAX_SIZE', 200 * 1024 * 1024))
+    app.config['UPLOAD_CHUNK_SIZE'] = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    app.config['UPLOAD_TTL'] = int(os.getenv('UPLOAD_TTL', 86400))
+
+    # Attachment downloads: '' serves the bytes from the worker; 'x-sendfile' (Apache, lighttpd)
+    # or 'x-accel-redirect' (nginx, with an internal location for ATTACHMENT_ACCEL_PREFIX
+    # aliased to UPLOAD_FOLDER) hands the transfer to the front server
+    app.config['ATTACHMENT_OFFLOAD'] = os.getenv('ATTACHMENT_OFFLOAD', '').lower()
+    app.config['ATTACHMENT_ACCEL_PREFIX'] = os.getenv('ATTACHMENT_ACCEL_PREFIX', '/protected-uploads/')
+
+    # Orphaned attachment collection: how often the background collector runs (off unless set),
+    # whether it deletes what it finds or only logs the report, and how old an unreferenced
+    # file must be before it is considered an orphan
+    app.config['ATTACHMENT_GC_INTERVAL'] = int(os.getenv('ATTACHMENT_GC_INTERVAL', 0))
+    app.config['ATTACHMENT_GC_DELETE'] = os.getenv('ATTACHMENT_GC_DELETE', '').lower() in ('1', 'true', 'yes')
+    app.config['ATTACHMENT_GC_GRACE'] = int(os.getenv('ATTACHMENT_GC_GRACE', 86400))
+
     db.init_app(app)
     
     # Import resources directory
@@ -37,7 +66,18 @@ def create_app():
     api.add_resource(resources.OperacionesBulkResource, "/api/operaciones/bulk")
     api.add_resource(resources.ArchivosOperacionesResource, "/api/operaciones/<int:id_operacion>/archivos")
     api.add_resource(resources.ArchivoOperacionResource, "/api/operacion/<int:id_operacion>/archivo/<string:campo_archivo>")
+    api.add_resource(resources.SubidasArchivoResource, "/api/operacion/<int:id_operacion>/archivo/<string:campo_archivo>/subidas")
+    api.add_resource(resources.SubidaResource, "/api/subidas/<string:id>")
+    api.add_resource(resources.FinalizarSubidaResource, "/api/subidas/<string:id>/finalizar")
     api.add_resource(resources.OperacionesExcelResource, "/api/operaciones/excel")
+    api.add_resource(resources.OperacionesExportResource, "/api/operaciones/export")
+    api.add_resource(resources.OperacionesArchivosZipResource, "/api/operaciones/archivos/zip")
+    api.add_resource(resources.TrabajosExportacionResource, "/api/operaciones/export/jobs")
+    api.add_resource(resources.TrabajoExportacionResource, "/api/operaciones/export/jobs/<string:id>")
+    api.add_resource(resources.ArchivoTrabajoExportacionResource, "/api/operaciones/export/jobs/<string:id>/archivo")
+    api.add_resource(resources.TrabajosImportacionResource, "/api/operaciones/import/jobs")
+    api.add_resource(resources.TrabajoImportacionResource, "/api/operaciones/import/jobs/<string:id>")
+    api.add_resource(resources.OperacionesResumenResource, "/api/operaciones/resumen")
     api.add_resource(resources.ConceptosResource,"/api/conceptos")
     api.add_resource(resources.ConceptoResource, "/api/concepto/<int:id>")
     api.add_resource(resources.CategoriasResource,"/api/categorias")
@@ -46,6 +86,9 @@ def create_app():
     api.add_resource(resources.SubcategoriaResource, "/api/subcategoria/<int:id>")
     api.add_resource(resources.PersonasResource,"/api/personas")
     api.add_resource(resources.PersonaResource, "/api/persona/<int:id>")
+    api.add_resource(resources.PersonasAutocompletarResource, "/api/personas/autocompletar")
+    api.add_resource(resources.CatalogoArbolResource, "/api/catalogo/arbol")
+    api.add_resource(resources.CatalogoCacheResource, "/api/catalogo/cache")
 
     api.init_app(app)
     
@@ -58,6 +101,17 @@ def create_app():
     from main.auth import routes
     app.register_blueprint(routes.auth)
 
+    # Schema migration commands
+    from main import migraciones
+    app.cli.add_command(migraciones.migrar_command)
+    app.cli.add_command(migraciones.reconstruir_balances_command)
+    app.cli.add_command(migraciones.verificar_balances_command)
+
+    # Attachment storage maintenance
+    from main.resources import recolector, reorganizacion
+    app.cli.add_command(recolector.reconciliar_command)
+    app.cli.add_command(reorganizacion.migrar_adjuntos_command)
+
     # Flask-Mail configuration for email sending
     app.config['MAIL_HOSTNAME'] = os.getenv('MAIL_HOSTNAME')
     app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
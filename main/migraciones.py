@@ -0,0 +1,51 @@
+from . import db
+from main.models import OperacionModel
+from main.models.busqueda import reindexar_operaciones
+from main.models.balance import inicializar_balances, reconstruir_balances, verificar_balances
+from flask.cli import with_appcontext
+import click
+
+def _agregar_columnas(tabla):
+    """Agrega a una tabla existente las columnas del modelo que le faltan; deben admitir NULL"""
+    existentes = {columna['name'] for columna in db.inspect(db.engine).get_columns(tabla.name)}
+    with db.engine.begin() as conexion:
+        for columna in tabla.columns:
+            if columna.name not in existentes:
+                tipo = columna.type.compile(db.engine.dialect)
+                conexion.execute(db.text(f'ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo}'))
+
+def migrar():
+    """Crea las tablas faltantes, agrega a una base existente las columnas e índices que db.create_all
+    no crea, indexa para búsqueda las operaciones previas y calcula el balance mensual si está vacío"""
+    db.create_all()
+    _agregar_columnas(OperacionModel.__table__)
+    for index in OperacionModel.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    reindexar_operaciones()
+    inicializar_balances()
+
+@click.command('migrar')
+@with_appcontext
+def migrar_command():
+    """Aplica las migraciones de esquema sobre la base configurada"""
+    migrar()
+    click.echo('Migraciones aplicadas')
+
+@click.command('reconstruir-balances')
+@with_appcontext
+def reconstruir_balances_command():
+    """Recalcula la tabla balance_mensual desde las operaciones"""
+    reconstruir_balances()
+    click.echo('Balance mensual reconstruido')
+
+@click.command('verificar-balances')
+@with_appcontext
+def verificar_balances_command():
+    """Compara balance_mensual con las operaciones; termina con código 1 si hay diferencias"""
+    diferencias = verificar_balances()
+    for diferencia in diferencias:
+        click.echo(diferencia)
+    if diferencias:
+        click.echo(f'{len(diferencias)} grupos inconsistentes. Ejecutar "flask reconstruir-balances" para corregirlos')
+        raise SystemExit(1)
+    click.echo('Balance mensual consistente')
@@ -3,4 +3,12 @@ from .operacion import Operacion as OperacionModel
 from .concepto import Concepto as ConceptoModel
 from .categoria import Categoria as CategoriaModel
 from .subcategoria import Subcategoria as SubcategoriaModel
-from .persona import Persona as PersonaModel
\ No newline at end of file
+from .persona import Persona as PersonaModel
+from .balance import BalanceMensual as BalanceMensualModel
+from .version import VersionTabla as VersionTablaModel
+from .version import VersionFila as VersionFilaModel
+from .archivo import Archivo as ArchivoModel
+from .subida import Subida as SubidaModel
+from . import busqueda
+from . import catalogo
+from . import validacion
\ No newline at end of file
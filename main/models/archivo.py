@@ -0,0 +1,50 @@
+from .. import db
+from sqlalchemy import DDL, event
+from datetime import datetime
+
+# Columnas *_path de operacion que pueden apuntar a un archivo guardado por contenido
+CAMPOS_ARCHIVO = ('comprobante', 'archivo1', 'archivo2', 'archivo3')
+
+class Archivo(db.Model):
+    """Contenido de un adjunto, guardado una sola vez por hash. referencias cuenta las columnas
+    *_path de operacion que apuntan a la ruta; la mantienen triggers sobre operacion"""
+    __tablename__ = 'archivo'
+
+    hash = db.Column(db.String(64), primary_key=True)
+    ruta = db.Column(db.String(255), nullable=False, unique=True)
+    tamanio = db.Column(db.Integer, nullable=False)
+    referencias = db.Column(db.Integer, nullable=False, default=0)
+    creado = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<Archivo: {self.hash} - {self.tamanio} bytes - {self.referencias} referencias>'
+
+def _contar(fila, campo, delta):
+    return f"UPDATE archivo SET referencias = referencias + ({delta}) WHERE ruta = {fila}.{campo}_path;"
+
+def _triggers_referencias(campo):
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS archivo_{campo}_ai AFTER INSERT ON operacion
+        WHEN new.{campo}_path IS NOT NULL BEGIN
+            {_contar('new', campo, 1)}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS archivo_{campo}_ad AFTER DELETE ON operacion
+        WHEN old.{campo}_path IS NOT NULL BEGIN
+            {_contar('old', campo, -1)}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS archivo_{campo}_au AFTER UPDATE OF {campo}_path ON operacion
+        WHEN old.{campo}_path IS NOT new.{campo}_path BEGIN
+            {_contar('old', campo, -1)}
+            {_contar('new', campo, 1)}
+        END
+        """,
+    ]
+
+for _campo in CAMPOS_ARCHIVO:
+    for _ddl in _triggers_referencias(_campo):
+        event.listen(db.metadata, 'after_create', DDL(_ddl).execute_if(dialect='sqlite'))
@@ -0,0 +1,114 @@
+from .. import db
+from sqlalchemy import DDL, event
+
+# Claves de agrupación del balance; el resto de la tabla son los acumulados
+CLAVES_BALANCE = ('mes', 'tipo', 'id_subcategoria', 'id_persona', 'naturaleza', 'caracter')
+
+class BalanceMensual(db.Model):
+    """Totales y cantidad de operaciones por mes, tipo, subcategoría, persona, naturaleza y carácter.
+    Lo mantienen los triggers sobre operacion; no se escribe desde la aplicación."""
+    __tablename__ = 'balance_mensual'
+
+    mes = db.Column(db.String(7), primary_key=True)
+    tipo = db.Column(db.String(10), primary_key=True)
+    id_subcategoria = db.Column(db.Integer, primary_key=True)
+    id_persona = db.Column(db.Integer, primary_key=True)
+    naturaleza = db.Column(db.String(10), primary_key=True)
+    caracter = db.Column(db.String(10), primary_key=True)
+    total = db.Column(db.Numeric(precision=65, scale=5), nullable=False, default=0)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (f'<BalanceMensual: {self.mes} - {self.tipo} - {self.id_subcategoria} - {self.id_persona} - '
+                f'{self.naturaleza} - {self.caracter} - Total: {self.total} ({self.cantidad})>')
+
+def _sumar(fila):
+    """Sentencia que suma la operación 'new' u 'old' a su grupo del balance"""
+    return f"""
+        INSERT INTO balance_mensual(mes, tipo, id_subcategoria, id_persona, naturaleza, caracter, total, cantidad)
+        VALUES (substr({fila}.fecha, 1, 7), {fila}.tipo, {fila}.id_subcategoria, {fila}.id_persona,
+                {fila}.naturaleza, {fila}.caracter, {fila}.monto_total, 1)
+        ON CONFLICT(mes, tipo, id_subcategoria, id_persona, naturaleza, caracter)
+        DO UPDATE SET total = total + excluded.total, cantidad = cantidad + 1;
+    """
+
+def _restar(fila):
+    """Sentencias que descuentan la operación de su grupo y borran el grupo si quedó vacío"""
+    grupo = f"""mes = substr({fila}.fecha, 1, 7) AND tipo = {fila}.tipo
+        AND id_subcategoria = {fila}.id_subcategoria AND id_persona = {fila}.id_persona
+        AND naturaleza = {fila}.naturaleza AND caracter = {fila}.caracter"""
+    return f"""
+        UPDATE balance_mensual SET total = total - {fila}.monto_total, cantidad = cantidad - 1 WHERE {grupo};
+        DELETE FROM balance_mensual WHERE cantidad <= 0 AND {grupo};
+    """
+
+_DDL_BALANCE = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS balance_mensual_ai AFTER INSERT ON operacion BEGIN
+        {_sumar('new')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS balance_mensual_ad AFTER DELETE ON operacion BEGIN
+        {_restar('old')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS balance_mensual_au
+    AFTER UPDATE OF fecha, tipo, id_subcategoria, id_persona, naturaleza, caracter, monto_total ON operacion BEGIN
+        {_restar('old')}
+        {_sumar('new')}
+    END
+    """,
+]
+
+for _sentencia in _DDL_BALANCE:
+    event.listen(db.metadata, 'after_create', DDL(_sentencia).execute_if(dialect='sqlite'))
+
+_SELECT_BALANCE = """
+    SELECT substr(fecha, 1, 7), tipo, id_subcategoria, id_persona, naturaleza, caracter,
+           SUM(monto_total), COUNT(*)
+    FROM operacion
+    GROUP BY 1, 2, 3, 4, 5, 6
+"""
+
+def reconstruir_balances():
+    """Vuelve a calcular el balance completo a partir de las operaciones"""
+    db.session.execute(db.text("DELETE FROM balance_mensual"))
+    db.session.execute(db.text(
+        "INSERT INTO balance_mensual(mes, tipo, id_subcategoria, id_persona, naturaleza, caracter, total, cantidad)"
+        + _SELECT_BALANCE
+    ))
+    db.session.commit()
+
+def inicializar_balances():
+    """Calcula el balance si todavía está vacío y ya hay operaciones cargadas"""
+    vacio = db.session.execute(db.text("SELECT NOT EXISTS (SELECT 1 FROM balance_mensual)")).scalar()
+    if vacio and db.session.execute(db.text("SELECT EXISTS (SELECT 1 FROM operacion)")).scalar():
+        reconstruir_balances()
+
+def verificar_balances(tolerancia=0.005):
+    """Compara el balance registrado con el calculado desde las operaciones.
+    Devuelve los grupos que difieren, con el total y la cantidad de cada lado."""
+    esperado = {tuple(fila[:6]): (float(fila[6]), fila[7]) for fila in db.session.execute(db.text(_SELECT_BALANCE))}
+    registrado = {
+        tuple(fila[:6]): (float(fila[6]), fila[7])
+        for fila in db.session.execute(db.text(
+            "SELECT mes, tipo, id_subcategoria, id_persona, naturaleza, caracter, total, cantidad FROM balance_mensual"
+        ))
+    }
+
+    diferencias = []
+    for clave in sorted(set(esperado) | set(registrado), key=str):
+        total_esperado, cantidad_esperada = esperado.get(clave, (0.0, 0))
+        total_registrado, cantidad_registrada = registrado.get(clave, (0.0, 0))
+        if cantidad_esperada != cantidad_registrada or abs(total_esperado - total_registrado) > tolerancia:
+            diferencia = dict(zip(CLAVES_BALANCE, clave))
+            diferencia.update({
+                'total_esperado': total_esperado,
+                'total_registrado': total_registrado,
+                'cantidad_esperada': cantidad_esperada,
+                'cantidad_registrada': cantidad_registrada,
+            })
+            diferencias.append(diferencia)
+    return diferencias
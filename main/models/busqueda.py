@@ -0,0 +1,99 @@
+from .. import db
+from sqlalchemy import DDL, event, table, column, select, literal_column
+import re
+
+# Índice FTS5 de operaciones. rowid = operacion.id; las columnas de persona y
+# catálogo se desnormalizan para no tener que unir tablas al buscar.
+operacion_fts = table(
+    'operacion_fts',
+    column('rowid'),
+    column('rank'),
+    column('codigo'),
+    column('observaciones'),
+    column('persona'),
+    column('concepto'),
+    column('categoria'),
+    column('subcategoria'),
+    column('usuario'),
+)
+
+_SELECT_DOCUMENTO = """
+    SELECT o.id, o.codigo, o.observaciones, p.razon_social || ' ' || p.cuit,
+           co.nombre, ca.nombre, s.nombre, u.nombre
+    FROM operacion o
+    LEFT JOIN persona p ON p.id = o.id_persona
+    LEFT JOIN subcategoria s ON s.id = o.id_subcategoria
+    LEFT JOIN categoria ca ON ca.id = s.id_categoria
+    LEFT JOIN concepto co ON co.id = ca.id_concepto
+    LEFT JOIN usuario u ON u.id = o.id_usuario
+"""
+
+_INSERT_DOCUMENTO = """
+    INSERT INTO operacion_fts(rowid, codigo, observaciones, persona, concepto, categoria, subcategoria, usuario)
+""" + _SELECT_DOCUMENTO
+
+def _trigger_reindexar(nombre, evento, condicion):
+    """Trigger que vuelve a indexar las operaciones que cumplen la condición"""
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS {nombre} {evento} BEGIN
+        DELETE FROM operacion_fts WHERE rowid IN (SELECT o.id FROM operacion o WHERE {condicion});
+        {_INSERT_DOCUMENTO} WHERE {condicion};
+    END
+    """
+
+_DDL_BUSQUEDA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS operacion_fts USING fts5(
+        codigo, observaciones, persona, concepto, categoria, subcategoria, usuario,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS operacion_fts_ai AFTER INSERT ON operacion BEGIN
+        {_INSERT_DOCUMENTO} WHERE o.id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS operacion_fts_ad AFTER DELETE ON operacion BEGIN
+        DELETE FROM operacion_fts WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS operacion_fts_au AFTER UPDATE ON operacion BEGIN
+        DELETE FROM operacion_fts WHERE rowid = old.id;
+        {_INSERT_DOCUMENTO} WHERE o.id = new.id;
+    END
+    """,
+    _trigger_reindexar('operacion_fts_persona_au', 'AFTER UPDATE OF cuit, razon_social ON persona',
+                       'o.id_persona = new.id'),
+    _trigger_reindexar('operacion_fts_usuario_au', 'AFTER UPDATE OF nombre ON usuario',
+                       'o.id_usuario = new.id'),
+    _trigger_reindexar('operacion_fts_subcategoria_au', 'AFTER UPDATE ON subcategoria',
+                       'o.id_subcategoria = new.id'),
+    _trigger_reindexar('operacion_fts_categoria_au', 'AFTER UPDATE ON categoria',
+                       'o.id_subcategoria IN (SELECT id FROM subcategoria WHERE id_categoria = new.id)'),
+    _trigger_reindexar('operacion_fts_concepto_au', 'AFTER UPDATE ON concepto',
+                       'o.id_subcategoria IN (SELECT s.id FROM subcategoria s JOIN categoria ca ON ca.id = s.id_categoria WHERE ca.id_concepto = new.id)'),
+]
+
+for _sentencia in _DDL_BUSQUEDA:
+    event.listen(db.metadata, 'after_create', DDL(_sentencia).execute_if(dialect='sqlite'))
+
+def reindexar_operaciones():
+    """Agrega al índice las operaciones que todavía no están indexadas"""
+    db.session.execute(db.text(
+        _INSERT_DOCUMENTO + " WHERE o.id NOT IN (SELECT rowid FROM operacion_fts)"
+    ))
+    db.session.commit()
+
+def expresion_busqueda(texto):
+    """Convierte el texto libre en una expresión MATCH de prefijos, sin operadores FTS5"""
+    terminos = re.findall(r'\w+', texto or '')
+    return ' '.join(f'"{termino}"*' for termino in terminos)
+
+def resultados_busqueda(texto):
+    """Subquery con rowid y rank de las operaciones que coinciden con el texto"""
+    return select(operacion_fts.c.rowid, operacion_fts.c.rank).where(
+        literal_column('operacion_fts').op('MATCH')(expresion_busqueda(texto))
+    )
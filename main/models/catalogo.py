@@ -0,0 +1,150 @@
+from .. import db
+from .version import versiones_tablas
+import threading, time
+
+# Cada cuántos segundos se compara la versión de las tablas del catálogo, para ver cambios
+# hechos por otros procesos o directamente en la base
+REVALIDAR_CADA = 5
+
+TABLAS_CATALOGO = ('concepto', 'categoria', 'subcategoria')
+
+class _Snapshot:
+    """JSON de conceptos, categorías y subcategorías indexados por id, como los arman sus to_json.
+    No se modifica después de construirlo; se reemplaza entero"""
+    def __init__(self, conceptos, categorias, subcategorias, versiones):
+        self.conceptos = conceptos
+        self.categorias = categorias
+        self.subcategorias = subcategorias
+        self.versiones = versiones
+        self.revalidado = time.monotonic()
+        self.arbol = None
+        # (colección, id) buscados que no están en este catálogo ni en la base cuando se buscaron
+        self.ausentes = set()
+
+_snapshot = None
+_lock = threading.Lock()
+_estadisticas = {'hits': 0, 'misses': 0, 'reconstrucciones': 0, 'invalidaciones': 0}
+
+_SELECT_CATALOGO = """
+    SELECT 'concepto', id, nombre, NULL FROM concepto
+    UNION ALL SELECT 'categoria', id, nombre, id_concepto FROM categoria
+    UNION ALL SELECT 'subcategoria', id, nombre, id_categoria FROM subcategoria
+"""
+
+def _construir():
+    """Arma el catálogo con una sola consulta; las filas de cada tabla traen el id del padre"""
+    versiones = versiones_tablas(TABLAS_CATALOGO)
+    filas = {tabla: [] for tabla in TABLAS_CATALOGO}
+    for tabla, id, nombre, id_padre in db.session.execute(db.text(_SELECT_CATALOGO)):
+        filas[tabla].append((id, nombre, id_padre))
+
+    conceptos = {id: {'id': id, 'nombre': nombre} for id, nombre, _ in filas['concepto']}
+    categorias = {
+        id: {'id': id, 'nombre': nombre, 'concepto': conceptos.get(id_concepto)}
+        for id, nombre, id_concepto in filas['categoria']
+    }
+    subcategorias = {
+        id: {'id': id, 'nombre': nombre, 'categoria': categorias.get(id_categoria)}
+        for id, nombre, id_categoria in filas['subcategoria']
+    }
+    return _Snapshot(conceptos, categorias, subcategorias, versiones)
+
+def cargar():
+    """Construye el catálogo completo y lo reemplaza de una vez"""
+    global _snapshot
+    with _lock:
+        _snapshot = _construir()
+        _estadisticas['reconstrucciones'] += 1
+    return _snapshot
+
+def invalidar():
+    """Descarta el catálogo; se vuelve a construir en el próximo acceso"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+        _estadisticas['invalidaciones'] += 1
+
+def obtener():
+    """Catálogo vigente, reconstruido si fue invalidado o si cambió la versión de sus tablas"""
+    snapshot = _snapshot
+    if snapshot is None:
+        return cargar()
+    if time.monotonic() - snapshot.revalidado >= REVALIDAR_CADA:
+        if versiones_tablas(TABLAS_CATALOGO) != snapshot.versiones:
+            return cargar()
+        snapshot.revalidado = time.monotonic()
+    return snapshot
+
+def revalidar(versiones):
+    """Reconstruye el catálogo si alguna de las versiones dadas de sus tablas no es la del
+    catálogo vigente. Lo usa etag antes de armar la respuesta, para que el cuerpo no salga de un
+    catálogo anterior a las versiones con las que se calculó el ETag"""
+    tablas = [tabla for tabla in TABLAS_CATALOGO if tabla in versiones]
+    snapshot = _snapshot
+    if not tablas or snapshot is None:
+        return snapshot
+    if any(versiones[tabla] != snapshot.versiones[tabla] for tabla in tablas):
+        return cargar()
+    return snapshot
+
+def _buscar(coleccion, id):
+    """JSON cacheado del id, o None si no está (el llamador lo arma desde el ORM). Ante un id
+    desconocido se comparan las versiones por si fue creado por otro proceso; si no cambiaron, el
+    fallo queda anotado en el catálogo y no se vuelve a consultar hasta que este se reemplace"""
+    snapshot = obtener()
+    entrada = getattr(snapshot, coleccion).get(id)
+    if entrada is None and id is not None and (coleccion, id) not in snapshot.ausentes:
+        if versiones_tablas(TABLAS_CATALOGO) != snapshot.versiones:
+            snapshot = cargar()
+            entrada = getattr(snapshot, coleccion).get(id)
+        if entrada is None:
+            snapshot.ausentes.add((coleccion, id))
+    if entrada is None:
+        _estadisticas['misses'] += 1
+        return None
+    _estadisticas['hits'] += 1
+    return entrada
+
+def concepto_json(id):
+    return _buscar('conceptos', id)
+
+def categoria_json(id):
+    return _buscar('categorias', id)
+
+def subcategoria_json(id):
+    return _buscar('subcategorias', id)
+
+def arbol():
+    """Árbol concepto → categorías → subcategorías ordenado por nombre. Se arma una vez por
+    catálogo, sin consultas adicionales"""
+    snapshot = obtener()
+    if snapshot.arbol is None:
+        por_nombre = lambda entrada: (entrada['nombre'] or '', entrada['id'])
+        subcategorias, categorias = {}, {}
+        for subcategoria in sorted(snapshot.subcategorias.values(), key=por_nombre):
+            if subcategoria['categoria'] is not None:
+                subcategorias.setdefault(subcategoria['categoria']['id'], []).append(
+                    {'id': subcategoria['id'], 'nombre': subcategoria['nombre']}
+                )
+        for categoria in sorted(snapshot.categorias.values(), key=por_nombre):
+            if categoria['concepto'] is not None:
+                categorias.setdefault(categoria['concepto']['id'], []).append({
+                    'id': categoria['id'],
+                    'nombre': categoria['nombre'],
+                    'subcategorias': subcategorias.get(categoria['id'], []),
+                })
+        snapshot.arbol = [
+            {'id': concepto['id'], 'nombre': concepto['nombre'], 'categorias': categorias.get(concepto['id'], [])}
+            for concepto in sorted(snapshot.conceptos.values(), key=por_nombre)
+        ]
+    return snapshot.arbol
+
+def estadisticas():
+    snapshot = _snapshot
+    return {
+        **_estadisticas,
+        'cargado': snapshot is not None,
+        'conceptos': len(snapshot.conceptos) if snapshot else 0,
+        'categorias': len(snapshot.categorias) if snapshot else 0,
+        'subcategorias': len(snapshot.subcategorias) if snapshot else 0,
+    }
@@ -1,4 +1,5 @@
 from .. import db
+from . import catalogo
 
 class Categoria(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -13,6 +14,9 @@ class Categoria(db.Model):
         return '<Categoria: %r %r %r>'% (self.id, self.nombre, self.id_concepto)
     
     def to_json(self):
+        cacheado = catalogo.categoria_json(self.id)
+        if cacheado is not None:
+            return cacheado
         categoria_json = {
             'id': self.id,
             'nombre': self.nombre,
@@ -1,4 +1,5 @@
 from .. import db
+from . import catalogo
 from datetime import datetime
 import re 
 
@@ -10,6 +11,18 @@ class Operacion(db.Model):
     OPTIONS_PERMITIDAS = ['factura', 'boleta']
     METODOS_PAGO_PERMITIDOS = ['efectivo', 'transferencia', 'mixto', 'otro']
 
+    __table_args__ = (
+        db.Index('ix_operacion_fecha_id', 'fecha', 'id'),
+        db.Index('ix_operacion_tipo_fecha', 'tipo', 'fecha'),
+        db.Index('ix_operacion_persona_fecha', 'id_persona', 'fecha'),
+        db.Index('ix_operacion_subcategoria_fecha', 'id_subcategoria', 'fecha'),
+        db.Index('ix_operacion_usuario_fecha', 'id_usuario', 'fecha'),
+        # Búsqueda de operaciones por ruta de adjunto: recolector y migración de adjuntos
+        db.Index('ix_operacion_comprobante_path', 'comprobante_path'),
+        db.Index('ix_operacion_archivo1_path', 'archivo1_path'),
+        db.Index('ix_operacion_archivo2_path', 'archivo2_path'),
+        db.Index('ix_operacion_archivo3_path', 'archivo3_path'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     fecha = db.Column(db.Date, nullable=False)
@@ -22,6 +35,7 @@ class Operacion(db.Model):
 
     comprobante_path = db.Column(db.String(255), nullable=True)
     comprobante_tipo = db.Column(db.String(10), nullable=True)
+    comprobante_nombre = db.Column(db.String(255), nullable=True)
 
     option = db.Column(db.String(10), nullable=False)
     codigo = db.Column(db.String(10), nullable=False)
@@ -38,10 +52,13 @@ class Operacion(db.Model):
 
     archivo1_path = db.Column(db.String(255), nullable=True)
     archivo1_tipo = db.Column(db.String(10), nullable=True)
+    archivo1_nombre = db.Column(db.String(255), nullable=True)
     archivo2_path = db.Column(db.String(255), nullable=True)
     archivo2_tipo = db.Column(db.String(10), nullable=True)
+    archivo2_nombre = db.Column(db.String(255), nullable=True)
     archivo3_path = db.Column(db.String(255), nullable=True)
     archivo3_tipo = db.Column(db.String(10), nullable=True)
+    archivo3_nombre = db.Column(db.String(255), nullable=True)
 
     modificado_por_otro = db.Column(db.Boolean, nullable=False, default=False)
     
@@ -54,7 +71,10 @@ class Operacion(db.Model):
     @monto_total.setter
     def monto_total(self, value):
         """Convierte el valor a absoluto antes de guardarlo y aplica el signo correcto."""
-        monto_abs = abs(value)
+        try:
+            monto_abs = abs(value)
+        except TypeError:
+            raise ValueError("Invalid monto_total. It should be a number.")
 
         if self.tipo == "egreso":
             self._monto_total = -monto_abs
@@ -126,16 +146,21 @@ class Operacion(db.Model):
         return (f'<Operación: {self.id} - {self.fecha} - {self.tipo} - '
                 f'{self.caracter} - {self.naturaleza} - Monto: {self.monto_total}>')
 
-    def to_json(self):
+    @staticmethod
+    def get_filename(path):
+        if not path:
+            return None
+        match = re.search(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_(.+)$', path)
+        if match:
+            return match.group(1)
+        return path.split('/')[-1]
 
-        def get_filename(path):
-            if not path:
-                return None
-            match = re.search(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_(.+)$', path)
-            if match:
-                return match.group(1)
-            return path.split('/')[-1]
+    def nombre_archivo(self, campo):
+        """Nombre original del adjunto. Los guardados por contenido lo tienen en *_nombre;
+        los anteriores, en la propia ruta"""
+        return getattr(self, f'{campo}_nombre') or self.get_filename(getattr(self, f'{campo}_path'))
 
+    def to_json(self):
         operacion_json = {
             "id": self.id,
             "fecha": self.fecha.strftime("%Y-%m-%d"),
@@ -143,17 +168,17 @@ class Operacion(db.Model):
             "caracter": self.caracter,
             "naturaleza": self.naturaleza,
             "persona": self.personas.to_json(),
-            "comprobante": get_filename(self.comprobante_path),
+            "comprobante": self.nombre_archivo('comprobante'),
             "option": self.option,
             "codigo": self.codigo,
             "observaciones": self.observaciones,
             "metodo_de_pago": self.metodo_de_pago,
             "monto_total": float(self.monto_total),
-            "subcategoria":self.subcategoria.to_json(),
+            "subcategoria": catalogo.subcategoria_json(self.id_subcategoria) or self.subcategoria.to_json(),
             "usuario": self.usuario.nombre,
-            "archivo1": get_filename(self.archivo1_path),
-            "archivo2": get_filename(self.archivo2_path),
-            "archivo3": get_filename(self.archivo3_path),
+            "archivo1": self.nombre_archivo('archivo1'),
+            "archivo2": self.nombre_archivo('archivo2'),
+            "archivo3": self.nombre_archivo('archivo3'),
             "modificado_por_otro": self.modificado_por_otro
         }
         return operacion_json
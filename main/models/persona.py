@@ -1,4 +1,5 @@
 from .. import db
+from sqlalchemy import DDL, event
 import re 
 
 class Persona(db.Model):
@@ -15,6 +16,36 @@ class Persona(db.Model):
             raise ValueError("Invalid CUIT format. It should be in the format 'XXXXXXXXXXX'.")
         return value
     
+    @staticmethod
+    def cuit_texto():
+        return db.cast(Persona.cuit, db.Text)
+
+    @staticmethod
+    def razon_social_lower():
+        return db.func.lower(Persona.razon_social)
+
+    @staticmethod
+    def _rango_prefijo(expresion, prefijo):
+        """Condición 'empieza con' expresada como rango, para que SQLite recorra el índice"""
+        siguiente = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+        return db.and_(expresion >= prefijo, expresion < siguiente)
+
+    @staticmethod
+    def normalizar_prefijo(texto):
+        """Pasa a minúsculas solo las letras ASCII, igual que lower() de SQLite"""
+        return ''.join(caracter.lower() if caracter.isascii() else caracter for caracter in (texto or '').strip())
+
+    @staticmethod
+    def coincide_prefijo(texto):
+        """Condición de personas cuyo CUIT o razón social empiezan con el texto"""
+        prefijo = Persona.normalizar_prefijo(texto)
+        if not prefijo:
+            return db.true()
+        condiciones = [Persona._rango_prefijo(Persona.razon_social_lower(), prefijo)]
+        if prefijo.isdigit():
+            condiciones.append(Persona._rango_prefijo(Persona.cuit_texto(), prefijo))
+        return db.or_(*condiciones)
+
     def __repr__(self):
         return '<Persona: %r %r %r>'% (self.id, self.cuit, self.razon_social)
     
@@ -35,4 +66,13 @@ class Persona(db.Model):
                     id = id,
                     cuit = cuit,
                     razon_social = razon_social
-                    )
\ No newline at end of file
+                    )
+
+# Índices de expresión para autocompletar por prefijo de CUIT y de razón social sin distinguir
+# mayúsculas; las consultas tienen que usar las mismas expresiones (cuit_texto y razon_social_lower).
+# Van como DDL porque create_all no detecta si un índice de expresión ya existe.
+for _sentencia in (
+    "CREATE INDEX IF NOT EXISTS ix_persona_cuit_texto ON persona (CAST(cuit AS TEXT))",
+    "CREATE INDEX IF NOT EXISTS ix_persona_razon_social_lower ON persona (lower(razon_social))",
+):
+    event.listen(db.metadata, 'after_create', DDL(_sentencia).execute_if(dialect='sqlite'))
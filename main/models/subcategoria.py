@@ -1,4 +1,5 @@
 from .. import db
+from . import catalogo
 
 class Subcategoria(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -13,6 +14,9 @@ class Subcategoria(db.Model):
         return '<Subcategoria: %r %r %r>' % (self.id, self.nombre, self.id_categoria)
     
     def to_json(self):
+        cacheado = catalogo.subcategoria_json(self.id)
+        if cacheado is not None:
+            return cacheado
         subcategoria_json = {
             'id': self.id,
             'nombre': self.nombre,
@@ -0,0 +1,20 @@
+from .. import db
+from datetime import datetime
+
+class Subida(db.Model):
+    """Subida por partes de un adjunto de operación. Los bytes recibidos están en un archivo
+    parcial; su tamaño en disco es el offset desde el que el cliente retoma la subida"""
+    __tablename__ = 'subida'
+
+    id = db.Column(db.String(32), primary_key=True)
+    id_operacion = db.Column(db.Integer, db.ForeignKey("operacion.id"), nullable=False)
+    campo = db.Column(db.String(20), nullable=False)
+    nombre = db.Column(db.String(255), nullable=False)
+    tipo = db.Column(db.String(100), nullable=True)
+    tamanio = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id"), nullable=False)
+    creada = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<Subida: {self.id} - {self.campo} de {self.id_operacion} - {self.tamanio} bytes>'
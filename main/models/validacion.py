@@ -0,0 +1,165 @@
+from .operacion import Operacion
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import re
+
+# Campos con validador en Operacion, en el orden en que los asigna el constructor: el primero
+# que falla es el error que informa el ORM
+CAMPOS_VALIDADOS = ('fecha', 'tipo', 'caracter', 'naturaleza', 'option', 'codigo', 'metodo_de_pago', 'monto_total')
+
+# Campo -> valores que acepta, comparados en minúsculas
+VALORES_PERMITIDOS = {
+    'tipo': Operacion.TIPOS_PERMITIDOS,
+    'caracter': Operacion.CARACTERES_PERMITIDOS,
+    'naturaleza': Operacion.NATURALEZAS_PERMITIDAS,
+    'option': Operacion.OPTIONS_PERMITIDAS,
+    'metodo_de_pago': Operacion.METODOS_PAGO_PERMITIDOS,
+}
+
+# Lo que strptime acepta con "%Y-%m-%d"; la validez de la fecha se controla aparte
+_PATRON_FECHA = re.compile(
+    r'^(?P<anio>\d\d\d\d)-(?P<mes>1[0-2]|0[1-9]|[1-9])-(?P<dia>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])\Z',
+    re.IGNORECASE
+)
+_PATRON_FACTURA = re.compile(r'^\d{5}-\d{8}$')
+_DIAS_POR_MES = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+# bool también se acepta: abs(True) no falla
+_NUMEROS = (int, float, Decimal, bool)
+
+def _es(serie, tipos):
+    """Máscara de los valores que son exactamente de alguno de los tipos"""
+    return serie.map(type, na_action=None).isin(tipos)
+
+def _por_texto(serie, textos, funcion):
+    """Aplica funcion a cada texto distinto de la serie una sola vez y reparte el resultado;
+    en un lote los mismos valores se repiten mucho. Los que no son texto quedan en NaN"""
+    codigos, unicos = pd.factorize(serie[textos])
+    resultado = funcion(pd.Series(unicos, dtype=object))
+    return resultado.take(codigos).set_axis(serie.index[textos]).reindex(serie.index)
+
+def _error_validador(campo, valor, option=None):
+    """Mensaje que daría el modelo al asignar el valor, o None si lo acepta. Solo se usa para las
+    filas que los controles por columna ya marcaron como inválidas"""
+    try:
+        if campo == 'monto_total':
+            Operacion.monto_total.fset(SimpleNamespace(tipo=None), valor)
+        else:
+            fila = SimpleNamespace(option=option, **{
+                nombre: getattr(Operacion, nombre) for nombre in (
+                    'TIPOS_PERMITIDOS', 'CARACTERES_PERMITIDOS', 'NATURALEZAS_PERMITIDAS',
+                    'OPTIONS_PERMITIDAS', 'METODOS_PAGO_PERMITIDOS'
+                )
+            })
+            getattr(Operacion, f'validate_{campo}')(fila, campo, valor)
+    except (ValueError, TypeError, AttributeError) as e:
+        return str(e)
+    return None
+
+def _partes_fecha(textos):
+    """Año, mes y día de los textos como enteros; validas indica si strptime los acepta"""
+    partes = textos.str.extract(_PATRON_FECHA)
+    coinciden = partes['anio'].notna().to_numpy()
+    for columna in ('anio', 'mes', 'dia'):
+        partes[columna] = partes[columna].where(coinciden, '0').map(int)
+    anio, mes, dia = (partes[columna].to_numpy() for columna in ('anio', 'mes', 'dia'))
+    bisiesto = (anio % 4 == 0) & ((anio % 100 != 0) | (anio % 400 == 0))
+    dias_mes = _DIAS_POR_MES[mes] + ((mes == 2) & bisiesto)
+    partes['valida'] = coinciden & (anio >= 1) & (dia <= dias_mes)
+    return partes
+
+def _fechas_validas(serie):
+    """Máscara de fechas válidas y sus partes (año, mes, día; NaN donde no es texto)"""
+    partes = _por_texto(serie, _es(serie, (str,)), _partes_fecha)
+    return partes['valida'].fillna(False).astype(bool), partes
+
+def convertir_fechas(serie):
+    """Fechas válidas como date, None en el resto; acepta lo mismo que Operacion.validate_fecha"""
+    def fechas(textos):
+        partes = _partes_fecha(textos)
+        return pd.Series([
+            date(anio, mes, dia) if valida else None
+            for valida, anio, mes, dia in zip(partes['valida'], partes['anio'], partes['mes'], partes['dia'])
+        ], dtype=object)
+    convertidas = _por_texto(serie, _es(serie, (str,)), fechas)
+    return convertidas.astype(object).where(convertidas.notna(), None)
+
+def validar_lote(df):
+    """Aplica las reglas de los validadores de Operacion a un lote entero, por columna.
+    df tiene una columna por campo (las que faltan se toman como None, igual que datos.get).
+    Devuelve un DataFrame con las columnas de CAMPOS_VALIDADOS y, en cada celda, el mismo
+    mensaje que daría el modelo para ese valor o None si es válido"""
+    df = pd.DataFrame({
+        campo: df[campo].astype(object) if campo in df else pd.Series(None, index=df.index, dtype=object)
+        for campo in CAMPOS_VALIDADOS
+    }, index=df.index)
+    if df.empty:
+        return pd.DataFrame(columns=list(CAMPOS_VALIDADOS), index=df.index, dtype=object)
+    invalidas = {}
+
+    textos = {campo: _es(df[campo], (str,)) for campo in CAMPOS_VALIDADOS}
+    minusculas = {
+        campo: _por_texto(df[campo], textos[campo], lambda unicos: unicos.str.lower())
+        for campo in VALORES_PERMITIDOS
+    }
+
+    validas, _ = _fechas_validas(df['fecha'])
+    invalidas['fecha'] = ~validas
+
+    for campo, permitidos in VALORES_PERMITIDOS.items():
+        invalidas[campo] = ~(textos[campo] & minusculas[campo].isin(permitidos))
+
+    # El código se valida contra el comprobante ya normalizado; si el comprobante es inválido
+    # solo se controla que no esté vacío
+    option = minusculas['option'].where(~invalidas['option'], None)
+    codigo = df['codigo'].where(textos['codigo'], '')
+    vacio = pd.Series([not valor for valor in df['codigo']], index=df.index, dtype=bool)
+    es_factura, es_boleta = option == 'factura', option == 'boleta'
+    invalidas['codigo'] = vacio | (
+        ~textos['codigo'] & (es_factura | es_boleta)
+    ) | (
+        es_factura & ~codigo.str.match(_PATRON_FACTURA).astype(bool)
+    ) | (
+        es_boleta & ~codigo.str.isdigit().astype(bool)
+    )
+
+    invalidas['monto_total'] = ~_es(df['monto_total'], _NUMEROS)
+
+    # Los mensajes salen del propio validador, una vez por valor inválido distinto
+    errores, mensajes = {}, {}
+    opciones = option.to_numpy()
+    for campo in CAMPOS_VALIDADOS:
+        errores[campo] = np.full(len(df), None, dtype=object)
+        valores = df[campo].to_numpy()
+        for posicion in np.flatnonzero(invalidas[campo].to_numpy(dtype=bool)):
+            valor, opcion = valores[posicion], opciones[posicion]
+            try:
+                clave = (campo, type(valor), valor, opcion)
+                if clave not in mensajes:
+                    mensajes[clave] = _error_validador(campo, valor, opcion)
+                errores[campo][posicion] = mensajes[clave]
+            except TypeError:
+                errores[campo][posicion] = _error_validador(campo, valor, opcion)
+    return pd.DataFrame(errores, index=df.index, dtype=object)
+
+def validar_operaciones(datos):
+    """Valida una lista de operaciones en JSON. Devuelve, por operación, un dict campo -> error
+    (vacío si es válida)"""
+    df = pd.DataFrame(
+        {campo: pd.Series([operacion.get(campo) for operacion in datos], dtype=object) for campo in CAMPOS_VALIDADOS},
+        index=range(len(datos))
+    )
+    errores = validar_lote(df)
+    con_errores = errores.notna().any(axis=1).to_numpy()
+    return [
+        {campo: mensaje for campo, mensaje in zip(CAMPOS_VALIDADOS, fila) if mensaje is not None}
+        if tiene_errores else {}
+        for fila, tiene_errores in zip(errores.itertuples(index=False, name=None), con_errores)
+    ]
+
+def primer_error(errores):
+    """El error que informaría el ORM: el del primer campo que asigna el constructor"""
+    return next((errores[campo] for campo in CAMPOS_VALIDADOS if campo in errores), None)
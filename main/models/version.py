@@ -0,0 +1,62 @@
+from .. import db
+from sqlalchemy import DDL, event, select
+
+# Tablas cuyo contenido aparece en las respuestas de operaciones y catálogos
+TABLAS_VERSIONADAS = ('operacion', 'persona', 'subcategoria', 'categoria', 'concepto', 'usuario')
+
+class VersionTabla(db.Model):
+    """Contador que aumenta con cada fila insertada, modificada o borrada en la tabla.
+    Lo mantienen triggers; no se escribe desde la aplicación."""
+    __tablename__ = 'version_tabla'
+
+    tabla = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VersionTabla: {self.tabla} - {self.version}>'
+
+class VersionFila(db.Model):
+    """Contador por fila de las tablas versionadas; sigue aumentando después de borrar la fila"""
+    __tablename__ = 'version_fila'
+
+    tabla = db.Column(db.String(50), primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VersionFila: {self.tabla} {self.id} - {self.version}>'
+
+def _trigger_version(tabla, evento):
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS version_{tabla}_{evento.lower()} AFTER {evento} ON {tabla} BEGIN
+        INSERT INTO version_tabla(tabla, version) VALUES ('{tabla}', 1)
+        ON CONFLICT(tabla) DO UPDATE SET version = version + 1;
+    END
+    """
+
+def _trigger_version_fila(tabla, evento):
+    fila = 'old' if evento == 'DELETE' else 'new'
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS version_fila_{tabla}_{evento.lower()} AFTER {evento} ON {tabla} BEGIN
+        INSERT INTO version_fila(tabla, id, version) VALUES ('{tabla}', {fila}.id, 1)
+        ON CONFLICT(tabla, id) DO UPDATE SET version = version + 1;
+    END
+    """
+
+for _tabla in TABLAS_VERSIONADAS:
+    for _evento in ('INSERT', 'UPDATE', 'DELETE'):
+        event.listen(db.metadata, 'after_create', DDL(_trigger_version(_tabla, _evento)).execute_if(dialect='sqlite'))
+        event.listen(db.metadata, 'after_create', DDL(_trigger_version_fila(_tabla, _evento)).execute_if(dialect='sqlite'))
+
+def versiones_tablas(tablas=TABLAS_VERSIONADAS):
+    """Versión actual de cada tabla; 0 si todavía no se modificó"""
+    versiones = dict(db.session.execute(
+        select(VersionTabla.tabla, VersionTabla.version).where(VersionTabla.tabla.in_(tablas))
+    ).all())
+    return {tabla: versiones.get(tabla, 0) for tabla in tablas}
+
+def version_fila(tabla, id):
+    """Versión actual de una fila; 0 si todavía no se modificó"""
+    return db.session.execute(
+        select(VersionFila.version).where(VersionFila.tabla == tabla, VersionFila.id == id)
+    ).scalar() or 0
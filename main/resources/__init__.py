@@ -4,6 +4,14 @@ from .operacion import Operacion as OperacionResource
 from .operacion import Operaciones as OperacionesResource
 from .operacion import OperacionesBulk as OperacionesBulkResource
 from .operacion import OperacionesExcel as OperacionesExcelResource
+from .operacion import OperacionesResumen as OperacionesResumenResource
+from .operacion import OperacionesExport as OperacionesExportResource
+from .operacion import OperacionesArchivosZip as OperacionesArchivosZipResource
+from .trabajo import TrabajosExportacion as TrabajosExportacionResource
+from .trabajo import TrabajoExportacion as TrabajoExportacionResource
+from .trabajo import ArchivoTrabajoExportacion as ArchivoTrabajoExportacionResource
+from .importacion import TrabajosImportacion as TrabajosImportacionResource
+from .importacion import TrabajoImportacion as TrabajoImportacionResource
 from .concepto import Concepto as ConceptoResource
 from .concepto import Conceptos as ConceptosResource
 from .categoria import Categoria as CategoriaResource
@@ -12,5 +20,11 @@ from .subcategoria import Subcategoria as SubcategoriaResource
 from .subcategoria import Subcategorias as SubcategoriasResource
 from .persona import Persona as PersonaResource
 from .persona import Personas as PersonasResource
+from .persona import PersonasAutocompletar as PersonasAutocompletarResource
 from .archivo import ArchivoOperacion as ArchivoOperacionResource
-from .archivo import ArchivosOperaciones as ArchivosOperacionesResource
\ No newline at end of file
+from .archivo import ArchivosOperaciones as ArchivosOperacionesResource
+from .subida import SubidasArchivo as SubidasArchivoResource
+from .subida import Subida as SubidaResource
+from .subida import FinalizarSubida as FinalizarSubidaResource
+from .catalogo import CatalogoArbol as CatalogoArbolResource
+from .catalogo import CatalogoCache as CatalogoCacheResource
\ No newline at end of file
@@ -0,0 +1,222 @@
+from flask import current_app, request
+from werkzeug.utils import send_file
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+from .. import db
+from main.models import ArchivoModel
+from main.models.archivo import CAMPOS_ARCHIVO
+from datetime import datetime
+import os, re, uuid, shutil, hashlib, logging, threading
+
+logger = logging.getLogger(__name__)
+
+# Subcarpeta de UPLOAD_FOLDER con los archivos guardados por contenido, uno por hash
+CARPETA_OBJETOS = 'objetos'
+# Subcarpeta de UPLOAD_FOLDER con los archivos parciales de las subidas por partes
+CARPETA_SUBIDAS = 'subidas'
+TAMANIO_BLOQUE = 1024 * 1024
+_PATRON_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+# Un solo hilo: los borrados no compiten con las requests por el disco
+_pool = None
+_lock = threading.Lock()
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='almacenamiento')
+        return _pool
+
+def rutas_archivos(fila):
+    """Rutas de archivos adjuntos de una operación (entidad o fila con las columnas *_path)"""
+    return [
+        ruta for ruta in (getattr(fila, f'{campo}_path', None) for campo in CAMPOS_ARCHIVO) if ruta
+    ]
+
+def _bloques(stream):
+    return iter(lambda: stream.read(TAMANIO_BLOQUE), b'')
+
+def _escribir(stream, carpeta, hash=None):
+    """Copia el stream a un temporal de la carpeta, actualizando el hash si se pasa uno"""
+    temporal = os.path.join(carpeta, f'{uuid.uuid4().hex}.tmp')
+    tamanio = 0
+    try:
+        with open(temporal, 'wb') as salida:
+            for bloque in _bloques(stream):
+                if hash is not None:
+                    hash.update(bloque)
+                salida.write(bloque)
+                tamanio += len(bloque)
+    except Exception:
+        os.remove(temporal)
+        raise
+    return temporal, tamanio
+
+def ruta_objeto(clave):
+    """Ruta de un contenido en la carpeta de objetos, repartida en dos niveles por los primeros
+    caracteres del hash (objetos/ab/cd/abcd...) para que ningún directorio crezca demasiado"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], CARPETA_OBJETOS, clave[:2], clave[2:4], clave)
+
+def reservar_archivo(clave, tamanio):
+    """Registra el contenido si es nuevo y devuelve la ruta donde está o debe quedar. Los
+    registrados antes de repartir la carpeta conservan su ruta hasta que se migran"""
+    db.session.execute(
+        insert(ArchivoModel).values(
+            hash=clave, ruta=ruta_objeto(clave), tamanio=tamanio, referencias=0, creado=datetime.now()
+        ).on_conflict_do_nothing()
+    )
+    ruta = db.session.execute(select(ArchivoModel.ruta).where(ArchivoModel.hash == clave)).scalar()
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    return ruta
+
+def guardar_archivo(stream):
+    """Guarda el contenido del stream una sola vez por hash SHA-256 y devuelve su ruta.
+
+    Se llama dentro de la transacción que asigna la ruta a la operación: la fila de archivo se
+    reserva antes de tocar el disco, lo que toma el lock de escritura de SQLite y evita que el
+    borrado de archivos sin referencias elimine el contenido hasta que la transacción termine.
+    Si el stream admite seek (los uploads de werkzeug), primero se calcula el hash y solo se
+    escribe si el contenido es nuevo; si no, se calcula mientras se copia a un temporal."""
+    carpeta = os.path.join(current_app.config['UPLOAD_FOLDER'], CARPETA_OBJETOS)
+    os.makedirs(carpeta, exist_ok=True)
+
+    temporal = None
+    hash = hashlib.sha256()
+    if stream.seekable():
+        inicio, tamanio = stream.tell(), 0
+        for bloque in _bloques(stream):
+            hash.update(bloque)
+            tamanio += len(bloque)
+        stream.seek(inicio)
+    else:
+        temporal, tamanio = _escribir(stream, carpeta, hash)
+
+    try:
+        ruta = reservar_archivo(hash.hexdigest(), tamanio)
+        if not os.path.exists(ruta):
+            if temporal is None:
+                temporal, _ = _escribir(stream, carpeta)
+            os.replace(temporal, ruta)
+            temporal = None
+        return ruta
+    finally:
+        if temporal is not None:
+            os.remove(temporal)
+
+def enlazar_archivo(origen, destino):
+    """Crea destino con el contenido de origen sin tocar origen: un hard link si están en el mismo
+    sistema de archivos; si no, una copia a un temporal que después se renombra"""
+    try:
+        os.link(origen, destino)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        temporal = os.path.join(os.path.dirname(destino), f'{uuid.uuid4().hex}.tmp')
+        try:
+            shutil.copyfile(origen, temporal)
+            os.replace(temporal, destino)
+        except Exception:
+            eliminar_archivos([temporal])
+            raise
+
+def guardar_temporal(temporal, clave, tamanio):
+    """Como guardar_archivo, para un archivo ya escrito en UPLOAD_FOLDER cuyo hash se conoce.
+    El temporal no se toca: el contenido nuevo se enlaza en su ruta y el llamador borra el
+    temporal después del commit. Devuelve la ruta y si se creó el archivo, que hay que borrar si
+    la transacción no se confirma"""
+    ruta = reservar_archivo(clave, tamanio)
+    if os.path.exists(ruta):
+        return ruta, False
+    enlazar_archivo(temporal, ruta)
+    return ruta, True
+
+def _etag(ruta):
+    """Los archivos guardados por contenido se llaman como su hash, que sirve de ETag fuerte y
+    no cambia entre copias del servidor; para los anteriores, el de werkzeug (fecha y tamaño)"""
+    nombre = os.path.basename(ruta)
+    return nombre if _PATRON_HASH.match(nombre) else True
+
+def _redireccion_interna(ruta):
+    """URI interna de nginx para X-Accel-Redirect: ATTACHMENT_ACCEL_PREFIX más la ruta relativa
+    a UPLOAD_FOLDER. None si el archivo está fuera de UPLOAD_FOLDER"""
+    relativa = os.path.relpath(ruta, os.path.abspath(current_app.config['UPLOAD_FOLDER']))
+    if relativa.startswith(os.pardir):
+        return None
+    return current_app.config['ATTACHMENT_ACCEL_PREFIX'].rstrip('/') + '/' + quote(relativa.replace(os.sep, '/'))
+
+def enviar_archivo(ruta, tipo=None, nombre=None):
+    """Respuesta con el archivo, con ETag y Last-Modified. Sin ATTACHMENT_OFFLOAD el worker
+    responde If-None-Match/If-Modified-Since y Range y envía el archivo con wsgi.file_wrapper.
+    Con 'x-sendfile' o 'x-accel-redirect' solo se responde 304; los bytes y los rangos quedan
+    a cargo del servidor de adelante y el worker se libera apenas arma los encabezados"""
+    ruta = os.path.abspath(ruta)
+    modo = current_app.config['ATTACHMENT_OFFLOAD']
+    redireccion = _redireccion_interna(ruta) if modo == 'x-accel-redirect' else None
+    delegar = modo == 'x-sendfile' or redireccion is not None
+
+    respuesta = send_file(
+        ruta, request.environ, mimetype=tipo, download_name=nombre, etag=_etag(ruta),
+        conditional=not delegar, use_x_sendfile=delegar,
+        max_age=current_app.get_send_file_max_age, response_class=current_app.response_class,
+    )
+    if not delegar:
+        return respuesta
+
+    # El cuerpo va vacío: el largo lo pone el servidor de adelante. Un 304 tampoco lleva el
+    # encabezado de delegación, para que no se envíe el archivo
+    del respuesta.headers['Content-Length']
+    respuesta = respuesta.make_conditional(request.environ)
+    if respuesta.status_code == 304:
+        del respuesta.headers['X-Sendfile']
+    elif redireccion is not None:
+        del respuesta.headers['X-Sendfile']
+        respuesta.headers['X-Accel-Redirect'] = redireccion
+    return respuesta
+
+def eliminar_archivos(rutas):
+    """Borra los archivos que existan; los errores se registran y no se propagan"""
+    for ruta in rutas:
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning('No se pudo eliminar el archivo %s: %s', ruta, e)
+
+def liberar_archivos(rutas):
+    """Borra los archivos que ya no usa ninguna operación. Los guardados por contenido se borran
+    solo si su contador de referencias llegó a cero; los adjuntos anteriores, sin registro en
+    archivo, pertenecían a una única operación y se borran directamente"""
+    for ruta in rutas:
+        try:
+            if db.session.execute(select(ArchivoModel.hash).where(ArchivoModel.ruta == ruta)).first() is None:
+                db.session.rollback()
+                eliminar_archivos([ruta])
+                continue
+
+            # El archivo se borra con la fila todavía bloqueada, antes del commit
+            liberado = db.session.execute(
+                delete(ArchivoModel)
+                .where(ArchivoModel.ruta == ruta, ArchivoModel.referencias <= 0)
+                .returning(ArchivoModel.ruta)
+            ).first()
+            if liberado:
+                eliminar_archivos([ruta])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('No se pudo liberar el archivo %s: %s', ruta, e)
+
+def _liberar_en_contexto(app, rutas):
+    with app.app_context():
+        liberar_archivos(rutas)
+
+def eliminar_en_segundo_plano(rutas):
+    """Encola la liberación de los archivos. Se llama después del commit que eliminó o reemplazó
+    sus referencias, así un commit fallido nunca deja operaciones sin sus archivos"""
+    rutas = list(rutas)
+    if rutas:
+        _executor().submit(_liberar_en_contexto, current_app._get_current_object(), rutas)
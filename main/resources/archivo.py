@@ -1,9 +1,10 @@
 from flask_restful import Resource, current_app
-from flask import request, send_file
-from werkzeug.utils import secure_filename
-import os, uuid
+from flask import request
+import os
 from .. import db
 from main.models import OperacionModel, UsuarioModel
+from main.models.archivo import CAMPOS_ARCHIVO
+from .almacenamiento import guardar_archivo, enviar_archivo, eliminar_en_segundo_plano
 from flask_jwt_extended import get_jwt_identity
 from main.auth.decorators import role_required
 
@@ -20,12 +21,15 @@ class ArchivoOperacion(Resource):
             if not file_path:
                 return {'message': f'El archivo {campo_archivo} no está registrado'}, 404
 
-            full_path = os.path.abspath(file_path)
-
-            if not os.path.exists(full_path):
+            if not os.path.exists(file_path):
                 return {'message': f'El archivo {campo_archivo} no existe o no es accesible'}, 404
 
-            return send_file(full_path)
+            # Los archivos guardados por contenido no tienen extensión; el tipo queda registrado
+            return enviar_archivo(
+                file_path,
+                tipo=getattr(operacion, f"{campo_archivo}_tipo", None),
+                nombre=operacion.nombre_archivo(campo_archivo),
+            )
 
         except Exception as e:
             return {'message': 'Error al obtener el archivo', 'error': str(e)}, 500
@@ -54,6 +58,9 @@ class ArchivoOperacion(Resource):
             if es_creador and not es_supervisor :
                 operacion.modificado_por_otro = False
 
+            if (request.content_length or 0) > current_app.config['UPLOAD_MAX_SIZE']:
+                return {'message': 'El archivo supera el tamaño máximo permitido'}, 413
+
             campos_validos = ['comprobante', 'archivo1', 'archivo2', 'archivo3']
             if campo_archivo not in campos_validos:
                 return {'message': f'Campo de archivo "{campo_archivo}" no permitido'}, 400
@@ -65,23 +72,16 @@ class ArchivoOperacion(Resource):
 
             if file and file.filename:
                 old_path = getattr(operacion, f"{campo_archivo}_path")
-                if old_path and os.path.exists(old_path):
-                    os.remove(old_path)
-
-                filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-                upload_folder = current_app.config['UPLOAD_FOLDER']
-
-                if not os.path.exists(upload_folder):
-                    os.makedirs(upload_folder)
 
-                file_path = os.path.join(upload_folder, filename)
-                file.save(file_path)
-
-                setattr(operacion, f"{campo_archivo}_path", file_path)
+                setattr(operacion, f"{campo_archivo}_path", guardar_archivo(file.stream))
                 setattr(operacion, f"{campo_archivo}_tipo", file.content_type)
+                setattr(operacion, f"{campo_archivo}_nombre", file.filename)
 
                 db.session.commit()
 
+                if old_path:
+                    eliminar_en_segundo_plano([old_path])
+
                 return {
                     'message': f'Archivo "{campo_archivo}" actualizado correctamente',
                     'archivo_actualizado': campo_archivo,
@@ -102,27 +102,21 @@ class ArchivosOperaciones(Resource):
             if not operacion:
                 return {'message': 'Operación no encontrada'}, 404
             
-            if 'comprobante' in request.files:
-                comprobante_path, comprobante_tipo = self._procesar_archivo('comprobante')
-                operacion.comprobante_path = comprobante_path
-                operacion.comprobante_tipo = comprobante_tipo
-            
-            if 'archivo1' in request.files:
-                archivo1_path, archivo1_tipo = self._procesar_archivo('archivo1')
-                operacion.archivo1_path = archivo1_path
-                operacion.archivo1_tipo = archivo1_tipo
-                
-            if 'archivo2' in request.files:
-                archivo2_path, archivo2_tipo = self._procesar_archivo('archivo2')
-                operacion.archivo2_path = archivo2_path
-                operacion.archivo2_tipo = archivo2_tipo
-                
-            if 'archivo3' in request.files:
-                archivo3_path, archivo3_tipo = self._procesar_archivo('archivo3')
-                operacion.archivo3_path = archivo3_path
-                operacion.archivo3_tipo = archivo3_tipo
+            if (request.content_length or 0) > current_app.config['UPLOAD_MAX_SIZE'] * len(CAMPOS_ARCHIVO):
+                return {'message': 'Los archivos superan el tamaño máximo permitido'}, 413
+
+            reemplazados = []
+            for campo in CAMPOS_ARCHIVO:
+                if campo in request.files:
+                    reemplazados.append(getattr(operacion, f"{campo}_path"))
+                    ruta, tipo, nombre = self._procesar_archivo(campo)
+                    setattr(operacion, f"{campo}_path", ruta)
+                    setattr(operacion, f"{campo}_tipo", tipo)
+                    setattr(operacion, f"{campo}_nombre", nombre)
             
             db.session.commit()
+
+            eliminar_en_segundo_plano(ruta for ruta in reemplazados if ruta)
             
             return {'message': 'Archivos adjuntados correctamente'}, 200
             
@@ -134,14 +128,5 @@ class ArchivosOperaciones(Resource):
         if file_key in request.files:
             file = request.files[file_key]
             if file.filename:
-                filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-                upload_folder = current_app.config['UPLOAD_FOLDER']
-                        
-                if not os.path.exists(upload_folder):
-                    os.makedirs(upload_folder)
-                        
-                file_path = os.path.join(upload_folder, filename)
-                file.save(file_path)
-                        
-                return file_path, file.content_type
-        return None, None
\ No newline at end of file
+                return guardar_archivo(file.stream), file.content_type, file.filename
+        return None, None, None
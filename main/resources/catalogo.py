@@ -0,0 +1,20 @@
+from flask_restful import Resource
+from main.models import catalogo
+from main.auth.decorators import role_required
+from .condicional import etag
+
+class CatalogoArbol(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    @etag(catalogo.TABLAS_CATALOGO)
+    def get(self):
+        """Obtiene el árbol completo de conceptos, categorías y subcategorías"""
+        try:
+            return {'conceptos': catalogo.arbol()}, 200
+        except Exception as e:
+            return {'message': str(e)}, 500
+
+class CatalogoCache(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def get(self):
+        """Obtiene los contadores de aciertos, fallos y reconstrucciones del catálogo en memoria"""
+        return catalogo.estadisticas(), 200
@@ -2,12 +2,17 @@ from flask_restful import Resource
 from flask import request
 from .. import db
 from sqlalchemy import or_
-from main.models import CategoriaModel
+from sqlalchemy.orm import aliased
+from main.models import CategoriaModel, ConceptoModel
+from main.models import catalogo
 from main.auth.decorators import role_required
+from .condicional import etag
+from .proyeccion import CampoInvalido, campos_solicitados, consulta_proyectada
 import re
 
 class Categoria(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag(("concepto",), tabla_fila="categoria")
     def get(self, id):
         """Obtiene una categoria por su ID"""
         try:
@@ -23,6 +28,7 @@ class Categoria(Resource):
             categoria  = db.session.query(CategoriaModel).get_or_404(id)
             db.session.delete(categoria)
             db.session.commit()
+            catalogo.invalidar()
             return {'message': 'Categoria eliminada'}, 204
         except Exception as e:
             db.session.rollback()
@@ -40,6 +46,7 @@ class Categoria(Resource):
 
             db.session.add(categoria)
             db.session.commit()
+            catalogo.invalidar()
             return categoria.to_json(), 200
         except Exception as e:
             db.session.rollback()
@@ -47,20 +54,26 @@ class Categoria(Resource):
     
 class Categorias(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag(("categoria", "concepto"))
     def get(self):
         """Obtiene lista paginada de categorias con opción de búsqueda"""
         try:
             page = request.args.get('page', default=1, type=int)
             per_page = request.args.get('per_page', default=10, type=int)
 
-            query = db.session.query(CategoriaModel)
+            especificacion = self._especificacion_campos()
+            campos = campos_solicitados(list(especificacion))
+            if campos:
+                query, serializar = consulta_proyectada(CategoriaModel, especificacion, campos)
+            else:
+                query, serializar = db.session.query(CategoriaModel), CategoriaModel.to_json
 
             query = self._aplicar_busqueda_general(query)
 
             if (page == 0 and per_page == 0):
                 categorias_items = query.all()
                 return {
-                    'categorias': [categoria.to_json() for categoria in categorias_items],
+                    'categorias': [serializar(categoria) for categoria in categorias_items],
                     'total': len(categorias_items),
                     'pages': 1,
                     'page': 1,
@@ -73,13 +86,31 @@ class Categorias(Resource):
                 )
 
                 return {
-                    'categorias': [categoria.to_json() for categoria in categorias.items],
+                    'categorias': [serializar(categoria) for categoria in categorias.items],
                     'total': categorias.total,
                     'pages': categorias.pages,
                     'page': categorias.page,
                 }, 200
+        except CampoInvalido as ci:
+            return {'message': str(ci)}, 400
         except Exception as e:
             return {'message': str(e)}, 500
+
+    def _especificacion_campos(self):
+        """Columnas, armado y joins de cada campo de Categoria.to_json, para las proyecciones con 'fields'"""
+        Concepto = aliased(ConceptoModel)
+        return {
+            'id': ([CategoriaModel.id.label('id')], lambda fila: fila['id'], ()),
+            'nombre': ([CategoriaModel.nombre.label('nombre')], lambda fila: fila['nombre'], ()),
+            'concepto': (
+                [Concepto.id.label('concepto_id'), Concepto.nombre.label('concepto_nombre')],
+                lambda fila: {
+                    'id': fila['concepto_id'],
+                    'nombre': fila['concepto_nombre'],
+                } if fila['concepto_id'] is not None else None,
+                ((Concepto, Concepto.id == CategoriaModel.id_concepto),)
+            ),
+        }
     
 
     def _aplicar_busqueda_general(self, query):
@@ -118,6 +149,7 @@ class Categorias(Resource):
             new_categoria = CategoriaModel.from_json(data)
             db.session.add(new_categoria)
             db.session.commit()
+            catalogo.invalidar()
 
             return new_categoria.to_json(), 201
         
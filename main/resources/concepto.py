@@ -3,10 +3,14 @@ from flask import request
 from .. import db
 from sqlalchemy import or_
 from main.models import ConceptoModel
+from main.models import catalogo
 from main.auth.decorators import role_required
+from .condicional import etag
+from .proyeccion import CampoInvalido, campos_solicitados, consulta_proyectada
 
 class Concepto(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag((), tabla_fila="concepto")
     def get(self, id):
         """"Obtiene un concepto por su ID"""
         try:
@@ -22,6 +26,7 @@ class Concepto(Resource):
             concepto  = db.session.query(ConceptoModel).get_or_404(id)
             db.session.delete(concepto)
             db.session.commit()
+            catalogo.invalidar()
             return {'message': 'Concepto eliminado'}, 204
         except Exception as e:
             db.session.rollback()
@@ -39,6 +44,7 @@ class Concepto(Resource):
 
             db.session.add(concepto)
             db.session.commit()
+            catalogo.invalidar()
             return concepto.to_json(), 200
         except Exception as e:
             db.session.rollback()
@@ -46,19 +52,26 @@ class Concepto(Resource):
     
 class Conceptos(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag(("concepto",))
     def get(self):
         """Obtiene lista paginada de conceptos con opción de búsqueda"""
         try:
             page = request.args.get('page', default=1, type=int)
             per_page = request.args.get('per_page', default=10, type=int)
 
-            query = db.session.query(ConceptoModel)
+            especificacion = self._especificacion_campos()
+            campos = campos_solicitados(list(especificacion))
+            if campos:
+                query, serializar = consulta_proyectada(ConceptoModel, especificacion, campos)
+            else:
+                query, serializar = db.session.query(ConceptoModel), ConceptoModel.to_json
+
             query = self._aplicar_busqueda_general(query)
 
             if (page == 0 and per_page == 0):
                 conceptos_items = query.all()
                 return {
-                    'conceptos': [concepto.to_json() for concepto in conceptos_items],
+                    'conceptos': [serializar(concepto) for concepto in conceptos_items],
                     'total': len(conceptos_items),
                     'pages': 1,
                     'page': 1,
@@ -71,13 +84,22 @@ class Conceptos(Resource):
                 )
 
                 return {
-                    'conceptos': [concepto.to_json() for concepto in conceptos.items],
+                    'conceptos': [serializar(concepto) for concepto in conceptos.items],
                     'total': conceptos.total,
                     'pages': conceptos.pages,
                     'page': conceptos.page,
                 }, 200
+        except CampoInvalido as ci:
+            return {'message': str(ci)}, 400
         except Exception as e:
             return {'message': str(e)}, 500
+
+    def _especificacion_campos(self):
+        """Columnas de cada campo de Concepto.to_json, para las proyecciones con 'fields'"""
+        return {
+            'id': ([ConceptoModel.id.label('id')], lambda fila: fila['id'], ()),
+            'nombre': ([ConceptoModel.nombre.label('nombre')], lambda fila: fila['nombre'], ()),
+        }
         
     def _aplicar_busqueda_general(self, query):
         """Aplica filtros de búsqueda al query"""
@@ -110,6 +132,7 @@ class Conceptos(Resource):
             new_concepto = ConceptoModel.from_json(data)
             db.session.add(new_concepto)
             db.session.commit()
+            catalogo.invalidar()
 
             return new_concepto.to_json(), 201
         
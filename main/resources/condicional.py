@@ -0,0 +1,33 @@
+from flask import request, Response
+from main.models import catalogo
+from main.models.version import versiones_tablas, version_fila
+import hashlib
+
+def etag(tablas, tabla_fila=None):
+    """Responde 304 Not Modified si el If-None-Match coincide con la versión actual de los datos.
+
+    El ETag se calcula con la URL, las versiones de las tablas de las que depende la respuesta y,
+    para los recursos individuales, la versión de la fila 'id' de tabla_fila; no se consulta el ORM.
+    Si la respuesta usa el catálogo en memoria, se revalida con esas mismas versiones antes de
+    armarla: un ETag nuevo nunca acompaña a un cuerpo viejo.
+    Va debajo de role_required para que la autorización se verifique igual."""
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            versiones = versiones_tablas(tablas)
+            if tabla_fila:
+                versiones[f'{tabla_fila}:{kwargs["id"]}'] = version_fila(tabla_fila, kwargs['id'])
+            firma = f'{request.full_path}|{sorted(versiones.items())}'
+            valor = hashlib.sha1(firma.encode()).hexdigest()
+
+            if request.if_none_match.contains(valor):
+                respuesta = Response(status=304)
+                respuesta.set_etag(valor)
+                return respuesta
+
+            catalogo.revalidar(versiones)
+            resultado = fn(*args, **kwargs)
+            if isinstance(resultado, tuple) and len(resultado) == 2 and resultado[1] == 200:
+                return resultado[0], 200, {'ETag': f'"{valor}"'}
+            return resultado
+        return wrapper
+    return decorator
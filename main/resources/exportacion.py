@@ -0,0 +1,244 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased
+from main.models import OperacionModel, PersonaModel, UsuarioModel, SubcategoriaModel, CategoriaModel, ConceptoModel
+from main.models.archivo import CAMPOS_ARCHIVO
+from flask import send_file
+from .. import db
+from itertools import islice
+import os, io, csv, json, time, logging, tempfile, zipfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+logger = logging.getLogger(__name__)
+
+TAMANIO_LOTE = 1000
+TAMANIO_BLOQUE_ZIP = 1024 * 1024
+# ZIP no admite fechas anteriores a 1980
+_FECHA_MINIMA_ZIP = time.mktime((1980, 1, 1, 0, 0, 0, 0, 0, -1))
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
+
+# Tipos de las columnas no textuales de la exportación en Parquet
+TIPOS_PARQUET = {"id": pa.int64(), "Cuit": pa.int64(), "Monto": pa.float64()}
+
+def columnas_exportacion():
+    """Encabezados de Operacion.to_excel, en el mismo orden, con la columna que los alimenta,
+    la conversión del valor y los joins (entidad, condición) que hacen falta"""
+    Persona, Subcategoria, Categoria, Concepto, Usuario = (
+        aliased(PersonaModel), aliased(SubcategoriaModel), aliased(CategoriaModel),
+        aliased(ConceptoModel), aliased(UsuarioModel)
+    )
+    joins = [
+        (Persona, Persona.id == OperacionModel.id_persona),
+        (Subcategoria, Subcategoria.id == OperacionModel.id_subcategoria),
+        (Categoria, Categoria.id == Subcategoria.id_categoria),
+        (Concepto, Concepto.id == Categoria.id_concepto),
+        (Usuario, Usuario.id == OperacionModel.id_usuario),
+    ]
+    columnas = [
+        ("id", OperacionModel.id, None),
+        ("Fecha", OperacionModel.fecha, lambda valor: valor.strftime("%Y-%m-%d")),
+        ("Tipo", OperacionModel.tipo, None),
+        ("Carácter", OperacionModel.caracter, None),
+        ("Naturaleza", OperacionModel.naturaleza, None),
+        ("Cuit", Persona.cuit, None),
+        ("Razón social", Persona.razon_social, None),
+        ("Tipo de comprobante", OperacionModel.option, None),
+        ("Número de comprobante", OperacionModel.codigo, None),
+        ("Observaciones", OperacionModel.observaciones, None),
+        ("Método de pago", OperacionModel.metodo_de_pago, None),
+        ("Monto", OperacionModel._monto_total, float),
+        ("Concepto", Concepto.nombre, None),
+        ("Categoría", Categoria.nombre, None),
+        ("Subcategoría", Subcategoria.nombre, None),
+        ("Usuario", Usuario.nombre, None),
+        ("Modificado por otro", OperacionModel.modificado_por_otro, lambda valor: "Sí" if valor else "No"),
+    ]
+    return columnas, joins
+
+def encabezados_exportacion():
+    return [encabezado for encabezado, _, _ in columnas_exportacion()[0]]
+
+def filas_exportacion(filtros, tamanio_lote=TAMANIO_LOTE):
+    """Genera las filas de la exportación como tuplas en el orden de los encabezados.
+    Las relaciones vienen unidas en el mismo SELECT, sin instanciar entidades del ORM, y las filas
+    se leen de a páginas por id como en adjuntos_exportacion: la memoria no depende de la cantidad
+    de operaciones y no queda un cursor de SQLite abierto mientras se escribe la respuesta"""
+    columnas, joins = columnas_exportacion()
+    query = db.session.query(*[columna for _, columna, _ in columnas]).select_from(OperacionModel)
+    for entidad, condicion in joins:
+        query = query.outerjoin(entidad, condicion)
+    query = query.filter(*filtros) if filtros else query
+
+    conversiones = [convertir for _, _, convertir in columnas]
+    ultimo = None
+    while True:
+        pagina = query if ultimo is None else query.filter(OperacionModel.id > ultimo)
+        pagina = pagina.order_by(OperacionModel.id).limit(tamanio_lote).all()
+        if not pagina:
+            return
+        for fila in pagina:
+            yield tuple(
+                convertir(valor) if convertir and valor is not None else valor
+                for valor, convertir in zip(fila, conversiones)
+            )
+        if len(pagina) < tamanio_lote:
+            return
+        # La primera columna es el id de la operación
+        ultimo = pagina[-1][0]
+
+def escribir_excel(filas, ruta, hoja='Operaciones'):
+    """Escribe las filas en un .xlsx con el modo de memoria constante de xlsxwriter,
+    que baja cada fila a disco apenas se completa"""
+    workbook = xlsxwriter.Workbook(ruta, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(hoja)
+    negrita = workbook.add_format({'bold': True})
+
+    for columna, encabezado in enumerate(encabezados_exportacion()):
+        worksheet.write(0, columna, encabezado, negrita)
+    for numero, fila in enumerate(filas, start=1):
+        worksheet.write_row(numero, 0, fila)
+
+    workbook.close()
+
+def lineas_csv(filas):
+    """Genera el CSV línea por línea, empezando por los encabezados"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(encabezados_exportacion())
+    yield buffer.getvalue()
+    for fila in filas:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(fila)
+        yield buffer.getvalue()
+
+def lineas_ndjson(filas):
+    """Genera un objeto JSON por línea con los encabezados como claves"""
+    encabezados = encabezados_exportacion()
+    for fila in filas:
+        yield json.dumps(dict(zip(encabezados, fila)), ensure_ascii=False) + '\n'
+
+def escribir_csv(filas, ruta):
+    with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+        archivo.writelines(lineas_csv(filas))
+
+def escribir_ndjson(filas, ruta):
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        archivo.writelines(lineas_ndjson(filas))
+
+def escribir_parquet(filas, ruta, tamanio_lote=TAMANIO_LOTE):
+    """Escribe las filas en un .parquet, un row group por lote armado por columnas"""
+    encabezados = encabezados_exportacion()
+    schema = pa.schema([(encabezado, TIPOS_PARQUET.get(encabezado, pa.string())) for encabezado in encabezados])
+
+    with pq.ParquetWriter(ruta, schema) as writer:
+        while True:
+            lote = list(islice(filas, tamanio_lote))
+            if not lote:
+                break
+            columnas = [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*lote), schema)]
+            writer.write_table(pa.Table.from_arrays(columnas, schema=schema))
+
+# Funciones que escriben cada formato en una ruta
+ESCRITORES = {
+    'csv': escribir_csv,
+    'ndjson': escribir_ndjson,
+    'parquet': escribir_parquet,
+    'xlsx': escribir_excel,
+}
+
+def enviar_archivo_temporal(escribir, sufijo, mimetype, download_name):
+    """Genera el archivo con escribir(ruta) en un temporal y lo envía. El temporal se borra apenas
+    se abre; el sistema libera el espacio cuando send_file termina de leerlo"""
+    with tempfile.NamedTemporaryFile(suffix=sufijo, delete=False) as temporal:
+        ruta = temporal.name
+    try:
+        escribir(ruta)
+        archivo = open(ruta, 'rb')
+    finally:
+        os.remove(ruta)
+
+    return send_file(archivo, mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+def adjuntos_exportacion(filtros, tamanio_lote=TAMANIO_LOTE):
+    """Genera (id, campo, ruta, nombre) de los adjuntos de las operaciones filtradas, en orden de id.
+    Se leen de a páginas por id: cada página se trae entera, así no queda un cursor de SQLite
+    abierto (que frenaría las escrituras) mientras el cliente descarga los archivos"""
+    columnas = [OperacionModel.id]
+    for campo in CAMPOS_ARCHIVO:
+        columnas += [getattr(OperacionModel, f'{campo}_path'), getattr(OperacionModel, f'{campo}_nombre')]
+    con_adjuntos = or_(*[getattr(OperacionModel, f'{campo}_path').isnot(None) for campo in CAMPOS_ARCHIVO])
+
+    ultimo = None
+    while True:
+        query = db.session.query(*columnas).filter(con_adjuntos, *filtros)
+        if ultimo is not None:
+            query = query.filter(OperacionModel.id > ultimo)
+        pagina = query.order_by(OperacionModel.id).limit(tamanio_lote).all()
+        if not pagina:
+            return
+        for id_operacion, *archivos in pagina:
+            for campo, ruta, nombre in zip(CAMPOS_ARCHIVO, archivos[0::2], archivos[1::2]):
+                if ruta:
+                    yield id_operacion, campo, ruta, nombre or OperacionModel.get_filename(ruta)
+        ultimo = pagina[-1][0]
+
+class _SalidaZip:
+    """Destino sin seek para zipfile: guarda lo escrito hasta que el generador lo entrega.
+    Sin seek, zipfile escribe el tamaño y el CRC de cada archivo después de sus datos"""
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes.clear()
+        return datos
+
+def _nombre_en_zip(id_operacion, campo, nombre):
+    nombre = os.path.basename((nombre or '').replace('\\', '/')) or campo
+    return f'{id_operacion}_{campo}_{nombre}'
+
+def bloques_zip(adjuntos):
+    """Genera un ZIP con los adjuntos a medida que se lee cada archivo, sin temporales: en
+    memoria hay como mucho un bloque. Los archivos van sin comprimir (son PDF e imágenes, ya
+    comprimidos). Los que no están en disco se listan en faltantes.txt al final"""
+    salida = _SalidaZip()
+    faltantes = []
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archivo_zip:
+        for id_operacion, campo, ruta, nombre in adjuntos:
+            try:
+                origen = open(ruta, 'rb')
+            except OSError as e:
+                logger.warning('No se pudo agregar el archivo %s al ZIP: %s', ruta, e)
+                faltantes.append(f'{id_operacion}\t{campo}\t{nombre}')
+                continue
+            with origen:
+                estado = os.fstat(origen.fileno())
+                info = zipfile.ZipInfo(
+                    _nombre_en_zip(id_operacion, campo, nombre),
+                    date_time=time.localtime(max(estado.st_mtime, _FECHA_MINIMA_ZIP))[:6]
+                )
+                with archivo_zip.open(info, 'w', force_zip64=estado.st_size >= zipfile.ZIP64_LIMIT) as destino:
+                    for bloque in iter(lambda: origen.read(TAMANIO_BLOQUE_ZIP), b''):
+                        destino.write(bloque)
+                        yield salida.vaciar()
+            yield salida.vaciar()
+
+        if faltantes:
+            archivo_zip.writestr('faltantes.txt', 'id\tcampo\tnombre\n' + '\n'.join(faltantes) + '\n')
+    yield salida.vaciar()
@@ -0,0 +1,332 @@
+from flask_restful import Resource, current_app
+from flask import request
+from flask_jwt_extended import get_jwt_identity
+from concurrent.futures import ThreadPoolExecutor
+from .. import db
+from main.models import OperacionModel, PersonaModel
+from main.models import catalogo, validacion
+from main.auth.decorators import role_required
+from .exportacion import TAMANIO_LOTE
+from datetime import datetime
+from itertools import islice
+import os, csv, uuid, threading
+import numpy as np
+import pandas as pd
+import openpyxl
+
+FORMATOS_IMPORTACION = ('csv', 'xlsx')
+
+# Errores por fila que se guardan en el trabajo; del resto solo se lleva la cuenta
+MAX_ERRORES = 1000
+
+# Encabezados de Operacion.to_excel que se leen al importar. id, Razón social, Usuario y
+# Modificado por otro se ignoran: la operación es nueva, la persona se busca por CUIT y
+# queda a nombre de quien importa
+ENCABEZADOS_REQUERIDOS = (
+    "Fecha", "Tipo", "Carácter", "Naturaleza", "Cuit", "Tipo de comprobante",
+    "Número de comprobante", "Método de pago", "Monto", "Concepto", "Categoría", "Subcategoría",
+)
+ENCABEZADOS_OPCIONALES = ("Observaciones",)
+
+# Encabezado -> campo de la operación, para las reglas de los validadores del modelo
+CAMPOS_ENCABEZADOS = {
+    "Fecha": 'fecha',
+    "Tipo": 'tipo',
+    "Carácter": 'caracter',
+    "Naturaleza": 'naturaleza',
+    "Tipo de comprobante": 'option',
+    "Número de comprobante": 'codigo',
+    "Método de pago": 'metodo_de_pago',
+}
+
+_trabajos = {}
+_lock = threading.Lock()
+_pool = None
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=current_app.config['IMPORT_WORKERS'], thread_name_prefix='importacion'
+            )
+        return _pool
+
+def _leer_filas(ruta, formato):
+    """Genera las filas del archivo como tuplas, empezando por los encabezados. El CSV se lee
+    línea por línea y el .xlsx con el modo de solo lectura de openpyxl, que no carga la hoja entera"""
+    if formato == 'csv':
+        with open(ruta, encoding='utf-8-sig', newline='') as archivo:
+            for fila in csv.reader(archivo):
+                yield tuple(fila)
+    else:
+        workbook = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+def _indices_encabezados(encabezados):
+    """Posición de cada encabezado conocido; ValueError si falta alguno de los requeridos"""
+    encabezados = [str(encabezado).strip() if encabezado is not None else '' for encabezado in encabezados]
+    faltantes = [encabezado for encabezado in ENCABEZADOS_REQUERIDOS if encabezado not in encabezados]
+    if faltantes:
+        raise ValueError(f'Faltan columnas en el archivo: {", ".join(faltantes)}')
+    return {
+        encabezado: encabezados.index(encabezado)
+        for encabezado in ENCABEZADOS_REQUERIDOS + ENCABEZADOS_OPCIONALES if encabezado in encabezados
+    }
+
+def _texto(valor):
+    """Celda como texto sin espacios; None si está vacía. Los números enteros que el .xlsx
+    devuelve como float (CUIT, número de comprobante) se escriben sin decimales"""
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    if isinstance(valor, datetime):
+        valor = valor.strftime("%Y-%m-%d")
+    valor = str(valor).strip()
+    return valor or None
+
+def _nombre(valor):
+    return valor.lower() if valor else None
+
+def mapa_personas():
+    """CUIT -> id de todas las personas, en una sola consulta"""
+    return dict(db.session.execute(db.select(PersonaModel.cuit, PersonaModel.id)).all())
+
+def mapa_subcategorias():
+    """(concepto, categoría, subcategoría) en minúsculas -> id de la subcategoría, desde el catálogo"""
+    subcategorias = {}
+    for subcategoria in catalogo.obtener().subcategorias.values():
+        categoria = subcategoria['categoria'] or {}
+        concepto = categoria.get('concepto') or {}
+        clave = (_nombre(concepto.get('nombre')), _nombre(categoria.get('nombre')), _nombre(subcategoria['nombre']))
+        subcategorias[clave] = subcategoria['id']
+    return subcategorias
+
+def validar_lote(lote, indices, personas, subcategorias):
+    """Valida un lote de filas con operaciones por columna. Devuelve el DataFrame de valores
+    normalizados y, por fila del lote, la lista de errores (vacía si la fila es válida)"""
+    df = pd.DataFrame({
+        encabezado: pd.Series(
+            [_texto(fila[indice]) if indice < len(fila) else None for fila in lote], dtype=object
+        )
+        for encabezado, indice in indices.items()
+    })
+    if "Observaciones" not in df:
+        df["Observaciones"] = pd.Series([None] * len(df), dtype=object)
+
+    errores = [[] for _ in range(len(df))]
+    def marcar(mascara, mensaje):
+        for posicion in np.flatnonzero(mascara.to_numpy(dtype=bool)):
+            errores[posicion].append(mensaje(posicion) if callable(mensaje) else mensaje)
+
+    presentes = {}
+    for encabezado in ENCABEZADOS_REQUERIDOS:
+        presentes[encabezado] = df[encabezado].notna()
+        marcar(~presentes[encabezado], f'Falta {encabezado}')
+
+    df["Monto"] = pd.to_numeric(df["Monto"], errors='coerce')
+    marcar(presentes["Monto"] & df["Monto"].isna(), 'Monto inválido')
+
+    reglas = validacion.validar_lote(
+        pd.DataFrame({campo: df[encabezado] for encabezado, campo in CAMPOS_ENCABEZADOS.items()})
+    )
+    for encabezado, campo in CAMPOS_ENCABEZADOS.items():
+        mensajes = reglas[campo]
+        marcar(presentes[encabezado] & mensajes.notna(), lambda posicion: mensajes.iat[posicion])
+
+    cuits = pd.to_numeric(df["Cuit"].str.replace('-', '', regex=False), errors='coerce')
+    df["id_persona"] = cuits.map(personas)
+    marcar(
+        presentes["Cuit"] & df["id_persona"].isna(),
+        lambda posicion: f'No existe una persona con CUIT {df["Cuit"].iat[posicion]}'
+    )
+
+    claves = pd.Series(list(zip(
+        df["Concepto"].map(_nombre), df["Categoría"].map(_nombre), df["Subcategoría"].map(_nombre)
+    )), dtype=object)
+    df["id_subcategoria"] = claves.map(subcategorias)
+    marcar(
+        presentes["Concepto"] & presentes["Categoría"] & presentes["Subcategoría"] & df["id_subcategoria"].isna(),
+        lambda posicion: 'No existe la subcategoría {2} en la categoría {1} del concepto {0}'.format(
+            df["Concepto"].iat[posicion], df["Categoría"].iat[posicion], df["Subcategoría"].iat[posicion]
+        )
+    )
+
+    # Valores como los guarda el modelo
+    df["Fecha"] = validacion.convertir_fechas(df["Fecha"])
+    for encabezado in ("Tipo", "Carácter", "Naturaleza", "Tipo de comprobante", "Método de pago"):
+        df[encabezado] = df[encabezado].map(_nombre, na_action='ignore')
+
+    return df, errores
+
+def filas_operacion(df, validas, id_usuario):
+    """Filas listas para insertar en la tabla operacion; el monto lleva el signo del tipo"""
+    df = df[validas]
+    montos = np.where(df["Tipo"] == 'egreso', -df["Monto"].abs(), df["Monto"].abs())
+    return [
+        {
+            'fecha': fecha, 'tipo': tipo, 'caracter': caracter, 'naturaleza': naturaleza,
+            'id_persona': int(id_persona), 'comprobante_path': None, 'comprobante_tipo': None,
+            'option': option, 'codigo': codigo, 'observaciones': observaciones,
+            'metodo_de_pago': metodo_de_pago, 'monto_total': float(monto),
+            'id_subcategoria': int(id_subcategoria), 'id_usuario': id_usuario,
+            'archivo1_path': None, 'archivo1_tipo': None, 'archivo2_path': None, 'archivo2_tipo': None,
+            'archivo3_path': None, 'archivo3_tipo': None, 'modificado_por_otro': False,
+        }
+        for fecha, tipo, caracter, naturaleza, id_persona, option, codigo, observaciones,
+            metodo_de_pago, monto, id_subcategoria in zip(
+            df["Fecha"], df["Tipo"], df["Carácter"], df["Naturaleza"], df["id_persona"],
+            df["Tipo de comprobante"], df["Número de comprobante"], df["Observaciones"],
+            df["Método de pago"], montos, df["id_subcategoria"]
+        )
+    ]
+
+def _actualizar(id, **cambios):
+    with _lock:
+        _trabajos[id].update(cambios)
+
+def _registrar_errores(id, errores_lote):
+    with _lock:
+        trabajo = _trabajos[id]
+        trabajo['filas_con_errores'] += len(errores_lote)
+        lugar = MAX_ERRORES - len(trabajo['errores'])
+        if lugar > 0:
+            trabajo['errores'].extend(errores_lote[:lugar])
+
+def _ejecutar(app, id, ruta, formato, id_usuario, tamanio_lote=TAMANIO_LOTE):
+    """Importa el archivo por lotes: cada lote se valida por columnas y sus filas válidas se
+    insertan y confirman en una transacción propia. Solo hay un lote en memoria a la vez"""
+    with app.app_context():
+        try:
+            filas = _leer_filas(ruta, formato)
+            indices = _indices_encabezados(next(filas, ()))
+            personas, subcategorias = mapa_personas(), mapa_subcategorias()
+            _actualizar(id, estado='procesando')
+
+            numero = 1
+            while True:
+                bloque = list(islice(filas, tamanio_lote))
+                if not bloque:
+                    break
+
+                lote, numeros = [], []
+                for fila in bloque:
+                    numero += 1
+                    if any(_texto(valor) is not None for valor in fila):
+                        lote.append(fila)
+                        numeros.append(numero)
+                if not lote:
+                    continue
+
+                df, errores = validar_lote(lote, indices, personas, subcategorias)
+                validas = np.array([not errores_fila for errores_fila in errores], dtype=bool)
+                if validas.any():
+                    db.session.execute(OperacionModel.__table__.insert(), filas_operacion(df, validas, id_usuario))
+                    db.session.commit()
+
+                _registrar_errores(id, [
+                    {'fila': numero_fila, 'errores': errores_fila}
+                    for numero_fila, errores_fila in zip(numeros, errores) if errores_fila
+                ])
+                with _lock:
+                    _trabajos[id]['procesadas'] += len(lote)
+                    _trabajos[id]['insertadas'] += int(validas.sum())
+
+            _actualizar(id, estado='terminado', terminado=datetime.now())
+        except Exception as e:
+            db.session.rollback()
+            _actualizar(id, estado='error', error=str(e), terminado=datetime.now())
+        finally:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+def _limpiar_terminados():
+    """Olvida los trabajos terminados hace más de IMPORT_TTL segundos"""
+    limite = current_app.config['IMPORT_TTL']
+    with _lock:
+        for id, trabajo in list(_trabajos.items()):
+            if trabajo['terminado'] and (datetime.now() - trabajo['terminado']).total_seconds() > limite:
+                del _trabajos[id]
+
+def _trabajo_json(id, trabajo):
+    return {
+        'id': id,
+        'estado': trabajo['estado'],
+        'formato': trabajo['formato'],
+        'archivo': trabajo['archivo'],
+        'procesadas': trabajo['procesadas'],
+        'insertadas': trabajo['insertadas'],
+        'filas_con_errores': trabajo['filas_con_errores'],
+        'errores': trabajo['errores'],
+        'creado': trabajo['creado'].strftime("%Y-%m-%d %H:%M:%S"),
+        'terminado': trabajo['terminado'].strftime("%Y-%m-%d %H:%M:%S") if trabajo['terminado'] else None,
+        'error': trabajo['error'],
+    }
+
+class TrabajosImportacion(Resource):
+    @role_required(roles=["admin"])
+    def post(self):
+        """Recibe un CSV o .xlsx con las columnas de la exportación a Excel y encola su importación.
+        Las filas válidas se insertan aunque otras tengan errores"""
+        try:
+            archivo = request.files.get('archivo')
+            if not archivo or not archivo.filename:
+                return {'message': 'Se esperaba un archivo en el campo "archivo"'}, 400
+
+            formato = str(request.form.get('format') or os.path.splitext(archivo.filename)[1].lstrip('.')).lower()
+            if formato not in FORMATOS_IMPORTACION:
+                return {'message': f"Formato inválido. Debe ser uno de: {', '.join(FORMATOS_IMPORTACION)}"}, 400
+
+            os.makedirs(current_app.config['IMPORT_FOLDER'], exist_ok=True)
+            _limpiar_terminados()
+
+            id = uuid.uuid4().hex
+            ruta = os.path.join(current_app.config['IMPORT_FOLDER'], f'{id}.{formato}')
+            archivo.save(ruta)
+
+            # Los encabezados se controlan antes de encolar para responder 400 si no corresponden
+            filas = _leer_filas(ruta, formato)
+            try:
+                _indices_encabezados(next(filas, ()))
+            except Exception as e:
+                os.remove(ruta)
+                return {'message': str(e) if isinstance(e, ValueError) else 'No se pudo leer el archivo'}, 400
+            finally:
+                filas.close()
+
+            with _lock:
+                _trabajos[id] = {
+                    'formato': formato,
+                    'archivo': archivo.filename,
+                    'estado': 'pendiente',
+                    'procesadas': 0,
+                    'insertadas': 0,
+                    'filas_con_errores': 0,
+                    'errores': [],
+                    'creado': datetime.now(),
+                    'terminado': None,
+                    'error': None,
+                }
+                trabajo = dict(_trabajos[id])
+
+            _executor().submit(
+                _ejecutar, current_app._get_current_object(), id, ruta, formato, int(get_jwt_identity())
+            )
+            return _trabajo_json(id, trabajo), 202
+
+        except Exception as e:
+            return {'message': 'Error al crear la importación', 'error': str(e)}, 500
+
+class TrabajoImportacion(Resource):
+    @role_required(roles=["admin"])
+    def get(self, id):
+        """Obtiene el progreso de una importación y los errores de las filas rechazadas"""
+        with _lock:
+            trabajo = dict(_trabajos[id], errores=list(_trabajos[id]['errores'])) if id in _trabajos else None
+        if not trabajo:
+            return {'message': 'Importación no encontrada'}, 404
+        return _trabajo_json(id, trabajo), 200
@@ -1,21 +1,37 @@
 from flask_restful import Resource
-from flask import request, send_file
+from flask import request, Response, stream_with_context
 from flask_jwt_extended import get_jwt_identity
-import os, io
+import base64
 from .. import db
-from sqlalchemy import or_
+from sqlalchemy import and_, tuple_, func, case, select, bindparam
+from sqlalchemy.orm import joinedload, aliased
+from sqlalchemy.orm.attributes import set_committed_value
 from dateutil.parser import parse
-from main.models import OperacionModel, PersonaModel, UsuarioModel, SubcategoriaModel
+from dateutil.relativedelta import relativedelta
+from main.models import OperacionModel, PersonaModel, UsuarioModel, SubcategoriaModel, CategoriaModel, ConceptoModel, BalanceMensualModel
+from main.models import validacion
+from main.models.version import TABLAS_VERSIONADAS
+from main.models.busqueda import operacion_fts, expresion_busqueda, resultados_busqueda
 from main.auth.decorators import role_required
-import pandas as pd
-from datetime import datetime
+from .condicional import etag
+from main.models.archivo import CAMPOS_ARCHIVO
+from .almacenamiento import rutas_archivos, eliminar_en_segundo_plano
+from .proyeccion import campos_solicitados, consulta_proyectada
+from .exportacion import (filas_exportacion, escribir_excel, lineas_csv, lineas_ndjson, enviar_archivo_temporal,
+                          adjuntos_exportacion, bloques_zip, ESCRITORES, MIMETYPES)
+from datetime import datetime, date, timedelta
+import re
+
+class CursorInvalido(ValueError):
+    pass
 
 class Operacion(Resource):
     @role_required(roles=["admin","supervisor"])
+    @etag(("persona", "subcategoria", "categoria", "concepto", "usuario"), tabla_fila="operacion")
     def get(self, id):
         """"Obtiene una operacion por su ID"""
         try:
-            operacion  = db.session.query(OperacionModel).get_or_404(id)
+            operacion  = Operaciones()._query_base().get_or_404(id)
             return operacion.to_json(), 200
         except Exception as e:
             return {'message': str(e)}, 500
@@ -28,23 +44,19 @@ class Operacion(Resource):
             if not operacion:
                 return {'message': 'Operación no encontrada'}, 404
             
-            self._eliminar_archivo_si_existe(operacion.comprobante_path)
-            self._eliminar_archivo_si_existe(operacion.archivo1_path)
-            self._eliminar_archivo_si_existe(operacion.archivo2_path)
-            self._eliminar_archivo_si_existe(operacion.archivo3_path)
+            rutas = rutas_archivos(operacion)
             
             db.session.delete(operacion)
             db.session.commit()
+
+            # Los archivos se borran recién después del commit, fuera de la request
+            eliminar_en_segundo_plano(rutas)
             
             return {'message': 'Operación eliminada correctamente'}, 200
             
         except Exception as e:
             db.session.rollback()
             return {'message': 'Error al eliminar la operación', 'error': str(e)}, 500
-    
-    def _eliminar_archivo_si_existe(self, ruta_archivo):
-        if ruta_archivo and os.path.exists(ruta_archivo):
-            os.remove(ruta_archivo)
 
     @role_required(roles=["admin", "supervisor"])
     def patch(self, id):
@@ -114,17 +126,38 @@ class Operacion(Resource):
 
 class Operaciones(Resource):
     @role_required(roles=["admin","supervisor"])
+    @etag(TABLAS_VERSIONADAS)
     def get(self):
         """Obtiene lista paginada de operaciones con opción de búsqueda"""
         try:
             page = request.args.get('page', default=1, type=int)
             per_page = request.args.get('per_page', default=10, type=int)
 
-            query = db.session.query(OperacionModel)
+            especificacion = self._especificacion_campos()
+            campos = campos_solicitados(list(especificacion))
+            if campos:
+                query, serializar = consulta_proyectada(
+                    OperacionModel, especificacion, campos,
+                    obligatorias=(OperacionModel.id.label('id'), OperacionModel.fecha.label('fecha'))
+                )
+            else:
+                query, serializar = self._query_base(), OperacionModel.to_json
+
+            busqueda = None
+            if 'after' not in request.args and expresion_busqueda(request.args.get('q')):
+                busqueda = request.args.get('q')
 
-            filtros = self._generar_filtros(request.args)
+            params = {k: v for k, v in request.args.items() if not (busqueda and k == 'q')}
+            filtros = self._generar_filtros(params)
             query = query.filter(*filtros) if filtros else query
 
+            if busqueda:
+                resultados = resultados_busqueda(busqueda).subquery()
+                query = query.join(resultados, resultados.c.rowid == OperacionModel.id).order_by(resultados.c.rank)
+
+            if 'after' in request.args:
+                return self._paginar_por_cursor(query, request.args.get('after'), per_page, serializar), 200
+
             operaciones = query.paginate(
                 page=page, 
                 per_page=per_page, 
@@ -132,14 +165,138 @@ class Operaciones(Resource):
             )
 
             return {
-                'operaciones': [operacion.to_json() for operacion in operaciones.items],
+                'operaciones': [serializar(operacion) for operacion in operaciones.items],
                 'total': operaciones.total,           
                 'pages': operaciones.pages,  
                 'page': operaciones.page,  
             }, 200
+        except ValueError as ve:
+            return {'message': str(ve)}, 400
         except Exception as e:
             return {'message': str(e)}, 500
 
+    def _paginar_por_cursor(self, query, after, per_page, serializar):
+        """Paginación keyset ordenada por (fecha, id); el total solo se calcula si se pide con 'total=true'"""
+        total = None
+        if request.args.get('total', '').lower() == 'true':
+            total = query.order_by(None).count()
+
+        if after:
+            fecha, id = self._decodificar_cursor(after)
+            query = query.filter(tuple_(OperacionModel.fecha, OperacionModel.id) > tuple_(fecha, id))
+
+        operaciones = query.order_by(OperacionModel.fecha, OperacionModel.id).limit(per_page + 1).all()
+
+        siguiente = None
+        if len(operaciones) > per_page:
+            operaciones = operaciones[:per_page]
+            siguiente = self._codificar_cursor(operaciones[-1])
+
+        resultado = {
+            'operaciones': [serializar(operacion) for operacion in operaciones],
+            'next': siguiente,
+        }
+        if total is not None:
+            resultado['total'] = total
+        return resultado
+
+    def _codificar_cursor(self, operacion):
+        """Genera un cursor opaco a partir de la fecha e id de la operación"""
+        valor = f"{operacion.fecha.isoformat()}|{operacion.id}"
+        return base64.urlsafe_b64encode(valor.encode()).decode()
+
+    def _decodificar_cursor(self, cursor):
+        """Obtiene la fecha e id codificados en un cursor"""
+        try:
+            fecha, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.strptime(fecha, "%Y-%m-%d").date(), int(id)
+        except (ValueError, UnicodeDecodeError):
+            raise CursorInvalido("Cursor inválido")
+
+    def _especificacion_campos(self):
+        """Columnas, armado y joins de cada campo de Operacion.to_json, para las proyecciones con 'fields'"""
+        # Alias para que los filtros con EXISTS sobre estas tablas no se correlacionen con los joins
+        Persona, Subcategoria, Categoria, Concepto, Usuario = (
+            aliased(PersonaModel), aliased(SubcategoriaModel), aliased(CategoriaModel),
+            aliased(ConceptoModel), aliased(UsuarioModel)
+        )
+        persona = (Persona, Persona.id == OperacionModel.id_persona)
+        subcategoria = (Subcategoria, Subcategoria.id == OperacionModel.id_subcategoria)
+        categoria = (Categoria, Categoria.id == Subcategoria.id_categoria)
+        concepto = (Concepto, Concepto.id == Categoria.id_concepto)
+        usuario = (Usuario, Usuario.id == OperacionModel.id_usuario)
+
+        def columna(nombre, atributo=None, convertir=lambda valor: valor):
+            atributo = atributo if atributo is not None else getattr(OperacionModel, nombre)
+            return [atributo.label(nombre)], lambda fila: convertir(fila[nombre]), ()
+
+        def adjunto(campo):
+            ruta, nombre = getattr(OperacionModel, f'{campo}_path'), getattr(OperacionModel, f'{campo}_nombre')
+            return (
+                [ruta.label(campo), nombre.label(f'{campo}_nombre')],
+                lambda fila: fila[f'{campo}_nombre'] or OperacionModel.get_filename(fila[campo]),
+                ()
+            )
+
+        def armar_subcategoria(fila):
+            if fila['subcategoria_id'] is None:
+                return None
+            categoria_json = None
+            if fila['categoria_id'] is not None:
+                categoria_json = {
+                    'id': fila['categoria_id'],
+                    'nombre': fila['categoria_nombre'],
+                    'concepto': {
+                        'id': fila['concepto_id'],
+                        'nombre': fila['concepto_nombre'],
+                    } if fila['concepto_id'] is not None else None
+                }
+            return {'id': fila['subcategoria_id'], 'nombre': fila['subcategoria_nombre'], 'categoria': categoria_json}
+
+        return {
+            'id': columna('id'),
+            'fecha': columna('fecha', convertir=lambda valor: valor.strftime("%Y-%m-%d")),
+            'tipo': columna('tipo'),
+            'caracter': columna('caracter'),
+            'naturaleza': columna('naturaleza'),
+            'persona': (
+                [Persona.id.label('persona_id'), Persona.cuit.label('persona_cuit'),
+                 Persona.razon_social.label('persona_razon_social')],
+                lambda fila: {
+                    'id': fila['persona_id'],
+                    'cuit': fila['persona_cuit'],
+                    'razon_social': fila['persona_razon_social']
+                } if fila['persona_id'] is not None else None,
+                (persona,)
+            ),
+            'comprobante': adjunto('comprobante'),
+            'option': columna('option'),
+            'codigo': columna('codigo'),
+            'observaciones': columna('observaciones'),
+            'metodo_de_pago': columna('metodo_de_pago'),
+            'monto_total': columna('monto_total', OperacionModel._monto_total, float),
+            'subcategoria': (
+                [Subcategoria.id.label('subcategoria_id'), Subcategoria.nombre.label('subcategoria_nombre'),
+                 Categoria.id.label('categoria_id'), Categoria.nombre.label('categoria_nombre'),
+                 Concepto.id.label('concepto_id'), Concepto.nombre.label('concepto_nombre')],
+                armar_subcategoria,
+                (subcategoria, categoria, concepto)
+            ),
+            'usuario': ([Usuario.nombre.label('usuario')], lambda fila: fila['usuario'], (usuario,)),
+            'archivo1': adjunto('archivo1'),
+            'archivo2': adjunto('archivo2'),
+            'archivo3': adjunto('archivo3'),
+            'modificado_por_otro': columna('modificado_por_otro'),
+        }
+
+    def _query_base(self):
+        """Query de operaciones con persona y usuario cargados en el mismo SELECT; la subcategoría
+        y su cadena categoría/concepto salen del catálogo en memoria"""
+        return db.session.query(OperacionModel).options(
+            joinedload(OperacionModel.personas),
+            joinedload(OperacionModel.usuario)
+        )
+
     def _procesar_filtro_fecha(self, fecha):
         """Procesa diferentes formatos de búsqueda por fecha"""
         try:
@@ -150,11 +307,25 @@ class Operaciones(Resource):
                     parse(fecha_hasta).date()
                 )
             else:
-                return OperacionModel.fecha.like(f"%{fecha}%")
+                desde, hasta = self._rango_fecha(fecha)
+                return and_(OperacionModel.fecha >= desde, OperacionModel.fecha < hasta)
 
         except ValueError:
             raise ValueError("Fecha inválida. Debe ser en formato 'YYYY-MM-DD', 'YYYY-MM', 'YYYYMM' o 'YYYY'.")
 
+    def _rango_fecha(self, fecha):
+        """Convierte una fecha completa o parcial en un rango semiabierto [desde, hasta)"""
+        fecha = fecha.strip()
+        if re.fullmatch(r'\d{4}', fecha):
+            desde = date(int(fecha), 1, 1)
+            return desde, desde + relativedelta(years=1)
+        match = re.fullmatch(r'(\d{4})-?(\d{2})', fecha)
+        if match:
+            desde = date(int(match.group(1)), int(match.group(2)), 1)
+            return desde, desde + relativedelta(months=1)
+        desde = datetime.strptime(fecha, "%Y-%m-%d").date()
+        return desde, desde + timedelta(days=1)
+
     def _generar_filtros(self, params):
         """Genera una lista de filtros en base a los parámetros de la request"""
         campos_busqueda = {
@@ -163,27 +334,29 @@ class Operaciones(Resource):
             'tipo': OperacionModel.tipo,
             'naturaleza': OperacionModel.naturaleza,
             'caracter': OperacionModel.caracter,
-            'persona': lambda t: OperacionModel.id_persona.has(or_(
-                PersonaModel.cuit.like(f"%{t}%"),
-                PersonaModel.razon_social.like(f"%{t}%")
-            )),
+            'persona': lambda t: OperacionModel.id_persona.in_(
+                select(PersonaModel.id).where(PersonaModel.coincide_prefijo(t))
+            ),
             'option': OperacionModel.option,
             'codigo': OperacionModel.codigo,
             'observaciones': OperacionModel.observaciones,
             'pago': OperacionModel.metodo_de_pago,
-            'monto': OperacionModel.monto_total,
-            'categoria': lambda t: OperacionModel.id_subcategoria.has(
+            'monto': OperacionModel._monto_total,
+            'categoria': lambda t: OperacionModel.subcategoria.has(
                 SubcategoriaModel.nombre.like(f"%{t}%")
             ),
-            'usuario': lambda t: OperacionModel.id_usuario.has(
+            'usuario': lambda t: OperacionModel.usuario.has(
                 UsuarioModel.nombre.like(f"%{t}%")
-            )
+            ),
+            'q': lambda t: OperacionModel.id.in_(resultados_busqueda(t).with_only_columns(operacion_fts.c.rowid))
         }
 
         filtros = []
         
         for campo, valor in params.items():
             if campo in campos_busqueda:
+                if campo == "q" and not expresion_busqueda(valor):
+                    continue
                 if campo == "fecha":
                     filtros.append(campos_busqueda["fecha"](valor))
                 elif callable(campos_busqueda[campo]):
@@ -194,42 +367,48 @@ class Operaciones(Resource):
         return filtros
 
 
+    CAMPOS_REQUERIDOS = [
+        'fecha', 'tipo', 'caracter', 'naturaleza', 'id_persona', 
+        'option', 'codigo', 'metodo_de_pago', 'monto_total', 
+        'id_subcategoria', 'id_usuario'
+    ]
+
+    @staticmethod
+    def _nueva_operacion(datos):
+        """Instancia una operación sin archivos a partir del JSON; los validadores del modelo
+        lanzan ValueError si algún valor es inválido"""
+        return OperacionModel(
+            fecha=datos.get('fecha'),
+            tipo=datos.get('tipo'),
+            caracter=datos.get('caracter'),
+            naturaleza=datos.get('naturaleza'),
+            id_persona=datos.get('id_persona'),
+            comprobante_path=None,
+            comprobante_tipo=None,
+            option=datos.get('option'),
+            codigo=datos.get('codigo'),
+            observaciones=datos.get('observaciones'),
+            metodo_de_pago=datos.get('metodo_de_pago'),
+            monto_total=datos.get('monto_total'),
+            id_subcategoria=datos.get('id_subcategoria'),
+            id_usuario=datos.get('id_usuario'),
+            archivo1_path=None,
+            archivo1_tipo=None,
+            archivo2_path=None,
+            archivo2_tipo=None,
+            archivo3_path=None,
+            archivo3_tipo=None
+        )
+
     @role_required(roles=["admin"])
     def post(self):
         """Crea una nueva operación"""
         try:
-            required_fields = [
-                'fecha', 'tipo', 'caracter', 'naturaleza', 'id_persona', 
-                'option', 'codigo', 'metodo_de_pago', 'monto_total', 
-                'id_subcategoria', 'id_usuario'
-            ]
-            
-            if not all(field in request.json for field in required_fields):
-                missing = [field for field in required_fields if field not in request.json]
+            if not all(field in request.json for field in self.CAMPOS_REQUERIDOS):
+                missing = [field for field in self.CAMPOS_REQUERIDOS if field not in request.json]
                 return {'message': f'Missing required fields: {", ".join(missing)}'}, 400
             
-            new_operacion = OperacionModel(
-                fecha=request.json.get('fecha'),
-                tipo=request.json.get('tipo'),
-                caracter=request.json.get('caracter'),
-                naturaleza=request.json.get('naturaleza'),
-                id_persona=request.json.get('id_persona'),
-                comprobante_path=None,
-                comprobante_tipo=None,
-                option=request.json.get('option'),
-                codigo=request.json.get('codigo'),
-                observaciones=request.json.get('observaciones'),
-                metodo_de_pago=request.json.get('metodo_de_pago'),
-                monto_total=request.json.get('monto_total'),
-                id_subcategoria=request.json.get('id_subcategoria'),
-                id_usuario=request.json.get('id_usuario'),
-                archivo1_path=None,
-                archivo1_tipo=None,
-                archivo2_path=None,
-                archivo2_tipo=None,
-                archivo3_path=None,
-                archivo3_tipo=None
-            )
+            new_operacion = self._nueva_operacion(request.json)
             
             db.session.add(new_operacion)
             db.session.commit()
@@ -243,65 +422,428 @@ class Operaciones(Resource):
             db.session.rollback()
             return {'message': 'Error al crear la operacion', 'error': str(e)}, 500
         
+class OperacionesResumen(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    @etag(("operacion", "persona", "subcategoria", "categoria", "concepto"))
+    def get(self):
+        """Obtiene totales de ingresos, egresos y saldo agrupados, calculados en la base de datos.
+        Si los filtros y agrupaciones no bajan del mes se lee balance_mensual en lugar de las operaciones"""
+        try:
+            filtros = self._filtros_balance(request.args)
+            if filtros is not None:
+                fuente, monto = BalanceMensualModel, BalanceMensualModel.total
+                cantidad = func.coalesce(func.sum(BalanceMensualModel.cantidad), 0)
+            else:
+                fuente, monto = OperacionModel, OperacionModel._monto_total
+                cantidad = func.count(OperacionModel.id)
+                filtros = Operaciones()._generar_filtros(request.args)
+
+            dimensiones = self._dimensiones(fuente)
+            group_by = [campo.strip() for valor in request.args.getlist('group_by') for campo in valor.split(',') if campo.strip()]
+
+            invalidos = [campo for campo in group_by if campo not in dimensiones]
+            if invalidos:
+                return {'message': f"Agrupación inválida: {', '.join(invalidos)}. Disponibles: {', '.join(dimensiones)}"}, 400
+
+            columnas, agrupar, joins = [], [], {}
+            for campo in group_by:
+                columnas_campo, _, joins_campo = dimensiones[campo]
+                columnas.extend(columnas_campo)
+                agrupar.extend(columnas_campo)
+                for entidad, condicion in joins_campo:
+                    joins.setdefault(entidad, condicion)
+
+            ingreso = func.coalesce(func.sum(case((fuente.tipo == 'ingreso', monto), else_=0)), 0)
+            egreso = func.coalesce(func.sum(case((fuente.tipo == 'egreso', monto), else_=0)), 0)
+
+            query = db.session.query(
+                *columnas,
+                ingreso.label('ingreso'),
+                egreso.label('egreso'),
+                cantidad.label('cantidad')
+            ).select_from(fuente)
+            for entidad, condicion in joins.items():
+                query = query.outerjoin(entidad, condicion)
+
+            query = query.filter(*filtros) if filtros else query
+            query = query.group_by(*agrupar).order_by(*agrupar) if agrupar else query
+
+            resumen = []
+            for fila in query.all():
+                mapping = fila._mapping
+                grupo = {campo: dimensiones[campo][1](mapping) for campo in group_by}
+                grupo.update({
+                    'ingreso': float(mapping['ingreso']),
+                    'egreso': float(mapping['egreso']),
+                    'neto': float(mapping['ingreso']) + float(mapping['egreso']),
+                    'cantidad': mapping['cantidad'],
+                })
+                resumen.append(grupo)
+
+            return {
+                'resumen': resumen,
+                'grupos': len(resumen),
+            }, 200
+        except ValueError as ve:
+            return {'message': str(ve)}, 400
+        except Exception as e:
+            return {'message': str(e)}, 500
+
+    def _filtros_balance(self, params):
+        """Filtros equivalentes sobre balance_mensual, o None si alguno necesita leer las operaciones"""
+        filtros = []
+        for campo, valor in params.items():
+            if campo in ('tipo', 'naturaleza', 'caracter'):
+                filtros.append(getattr(BalanceMensualModel, campo).like(f"%{valor}%"))
+            elif campo == 'fecha':
+                # Solo años o meses completos; los días y los rangos se resuelven sobre operacion
+                if not re.fullmatch(r'\s*\d{4}(-?\d{2})?\s*', valor):
+                    return None
+                desde, hasta = Operaciones()._rango_fecha(valor)
+                filtros.append(and_(BalanceMensualModel.mes >= desde.strftime('%Y-%m'),
+                                    BalanceMensualModel.mes < hasta.strftime('%Y-%m')))
+            elif campo == 'persona':
+                filtros.append(BalanceMensualModel.id_persona.in_(
+                    select(PersonaModel.id).where(PersonaModel.coincide_prefijo(valor))
+                ))
+            elif campo == 'categoria':
+                filtros.append(BalanceMensualModel.id_subcategoria.in_(
+                    select(SubcategoriaModel.id).where(SubcategoriaModel.nombre.like(f"%{valor}%"))
+                ))
+            elif campo in ('id', 'option', 'codigo', 'observaciones', 'pago', 'monto', 'usuario', 'q'):
+                return None
+        return filtros
+
+    def _dimensiones(self, fuente=OperacionModel):
+        """Columnas de agrupación, armado y joins de cada dimensión del resumen, sobre
+        operacion o balance_mensual"""
+        Persona, Subcategoria, Categoria, Concepto = (
+            aliased(PersonaModel), aliased(SubcategoriaModel), aliased(CategoriaModel), aliased(ConceptoModel)
+        )
+        persona = (Persona, Persona.id == fuente.id_persona)
+        subcategoria = (Subcategoria, Subcategoria.id == fuente.id_subcategoria)
+        categoria = (Categoria, Categoria.id == Subcategoria.id_categoria)
+        concepto = (Concepto, Concepto.id == Categoria.id_concepto)
+
+        if fuente is BalanceMensualModel:
+            mes, anio = BalanceMensualModel.mes, func.substr(BalanceMensualModel.mes, 1, 4)
+        else:
+            mes, anio = func.strftime('%Y-%m', OperacionModel.fecha), func.strftime('%Y', OperacionModel.fecha)
+
+        def columna(nombre, atributo):
+            return [atributo.label(nombre)], lambda fila: fila[nombre], ()
+
+        def entidad(nombre, id, descripcion, joins):
+            return (
+                [id.label(f'{nombre}_id'), descripcion.label(f'{nombre}_nombre')],
+                lambda fila: {'id': fila[f'{nombre}_id'], 'nombre': fila[f'{nombre}_nombre']},
+                joins
+            )
+
+        return {
+            'year': columna('year', anio),
+            'month': columna('month', mes),
+            'tipo': columna('tipo', fuente.tipo),
+            'concepto': entidad('concepto', Concepto.id, Concepto.nombre, (subcategoria, categoria, concepto)),
+            'categoria': entidad('categoria', Categoria.id, Categoria.nombre, (subcategoria, categoria)),
+            'subcategoria': entidad('subcategoria', Subcategoria.id, Subcategoria.nombre, (subcategoria,)),
+            'persona': (
+                [Persona.id.label('persona_id'), Persona.cuit.label('persona_cuit'),
+                 Persona.razon_social.label('persona_razon_social')],
+                lambda fila: {
+                    'id': fila['persona_id'],
+                    'cuit': fila['persona_cuit'],
+                    'razon_social': fila['persona_razon_social']
+                },
+                (persona,)
+            ),
+            'naturaleza': columna('naturaleza', fuente.naturaleza),
+            'caracter': columna('caracter', fuente.caracter),
+        }
+
 class OperacionesBulk(Resource):
+    @role_required(roles=["admin"])
+    def post(self):
+        """Crea múltiples operaciones en una sola transacción. Las filas inválidas se informan
+        con su índice y errores; las válidas se insertan igual. Con ?dry_run=true solo se validan"""
+        try:
+            if not request.json or not isinstance(request.json, list):
+                return {'message': 'Se esperaba una lista de operaciones para crear'}, 400
+
+            if request.args.get('dry_run', '').lower() == 'true':
+                return self._validar(request.json), 200
+
+            # Columna de la tabla -> atributo del modelo (monto_total se guarda en _monto_total)
+            columnas = {
+                atributo.columns[0].key: atributo.key
+                for atributo in OperacionModel.__mapper__.column_attrs if atributo.key != 'id'
+            }
+            filas, indices, errores = [], [], []
+
+            # Las mismas reglas y el mismo formato de errores que con dry_run: solo se construyen
+            # las operaciones que pasaron la validación
+            for indice, (operacion_data, errores_fila) in enumerate(zip(request.json, self._errores(request.json))):
+                if errores_fila:
+                    errores.append({'indice': indice, 'errores': errores_fila})
+                    continue
+
+                try:
+                    operacion = Operaciones._nueva_operacion(operacion_data)
+                except (ValueError, TypeError, AttributeError):
+                    errores.append({'indice': indice, 'errores': {'operacion': 'Operación inválida'}})
+                    continue
+
+                fila = {columna: getattr(operacion, atributo) for columna, atributo in columnas.items()}
+                fila['modificado_por_otro'] = False
+                filas.append(fila)
+                indices.append(indice)
+
+            ids = []
+            if filas:
+                # Un único executemany dentro de una transacción, sin instanciar las operaciones en la sesión
+                resultado = db.session.execute(
+                    OperacionModel.__table__.insert().returning(
+                        OperacionModel.__table__.c.id, sort_by_parameter_order=True
+                    ),
+                    filas
+                )
+                ids = resultado.scalars().all()
+                db.session.commit()
+
+            resultado = {
+                'message': f'Se crearon {len(ids)} operaciones',
+                'operaciones_creadas': [{'indice': indice, 'id': id} for indice, id in zip(indices, ids)],
+            }
+            if errores:
+                resultado['errores'] = errores
+
+            return resultado, 201 if ids else 400
+
+        except Exception as e:
+            db.session.rollback()
+            return {'message': 'Error al crear operaciones', 'error': str(e)}, 500
+
+    def _validar(self, datos):
+        """Valida las operaciones sin crearlas: por cada una con errores, el mensaje de cada campo"""
+        errores = [
+            {'indice': indice, 'errores': errores_fila}
+            for indice, errores_fila in enumerate(self._errores(datos)) if errores_fila
+        ]
+        return {
+            'message': f'{len(datos) - len(errores)} de {len(datos)} operaciones son válidas',
+            'validas': len(datos) - len(errores),
+            'errores': errores,
+        }
+
+    def _errores(self, datos):
+        """Por cada operación, un dict campo -> mensaje; vacío si es válida"""
+        objetos = [operacion_data for operacion_data in datos if isinstance(operacion_data, dict)]
+        resultados = iter(validacion.validar_operaciones(objetos))
+        errores = []
+
+        for operacion_data in datos:
+            if not isinstance(operacion_data, dict):
+                errores.append({'operacion': 'Se esperaba un objeto'})
+                continue
+
+            errores_fila = {
+                field: 'Missing required field' for field in Operaciones.CAMPOS_REQUERIDOS if field not in operacion_data
+            }
+            for campo, mensaje in next(resultados).items():
+                errores_fila.setdefault(campo, mensaje)
+            errores.append(errores_fila)
+
+        return errores
+
+    # Filtros de la eliminación por query string: solo coincidencias exactas, nunca los de
+    # búsqueda parcial del listado. fecha se convierte en un rango con Operaciones._rango_fecha
+    FILTROS_ELIMINACION = {
+        'id': OperacionModel.id,
+        'id_persona': OperacionModel.id_persona,
+        'id_subcategoria': OperacionModel.id_subcategoria,
+        'id_usuario': OperacionModel.id_usuario,
+        'tipo': OperacionModel.tipo,
+        'fecha': OperacionModel.fecha,
+    }
+
+    @role_required(roles=["admin", "supervisor"])
+    def delete(self):
+        """Elimina en una sola sentencia las operaciones indicadas por {"ids": [...]} en el cuerpo
+        o, sin cuerpo y solo para admin, las que coinciden exactamente con los filtros de la query
+        string (id, id_persona, id_subcategoria, id_usuario, tipo, fecha). Con ?dry_run=true solo
+        informa cuántas se eliminarían; por filtros hay que confirmar esa cantidad con
+        ?confirmar=<cantidad>, y si no coincide no se elimina nada"""
+        try:
+            datos = request.get_json(silent=True)
+            params = request.args.copy()
+            dry_run = params.pop('dry_run', '').lower() == 'true'
+            confirmar = params.pop('confirmar', None)
+
+            if datos is not None:
+                ids = datos.get('ids') if isinstance(datos, dict) else None
+                if not isinstance(ids, list) or not ids:
+                    return {'message': 'Se esperaba un objeto con una lista "ids" de operaciones'}, 400
+                ids = [self._id_entero(id) for id in ids]
+                if None in ids:
+                    return {'message': 'Los ids de operaciones deben ser enteros'}, 400
+                condicion = OperacionModel.id.in_(ids)
+            else:
+                usuario_actual = UsuarioModel.query.get(get_jwt_identity())
+                if str(usuario_actual.rol) != 'admin':
+                    return {'message': 'Solo un admin puede eliminar operaciones por filtros'}, 403
+                filtros = self._filtros_eliminacion(params)
+                if not filtros:
+                    return {'message': 'Se requiere al menos un filtro para eliminar operaciones'}, 400
+                condicion = and_(*filtros)
+                if not dry_run:
+                    confirmar = self._id_entero(confirmar)
+                    if confirmar is None:
+                        return {'message': 'Se requiere confirmar con ?confirmar=<cantidad> la cantidad de '
+                                           'operaciones a eliminar (obtenerla con ?dry_run=true)'}, 400
+
+            if dry_run:
+                cantidad = db.session.execute(
+                    select(func.count()).select_from(OperacionModel).where(condicion)
+                ).scalar()
+                return {
+                    'message': f'Se eliminarían {cantidad} operaciones',
+                    'cantidad': cantidad,
+                }, 200
+
+            tabla = OperacionModel.__table__
+            columnas_archivo = [tabla.c[f'{campo}_path'] for campo in CAMPOS_ARCHIVO]
+            filas = db.session.execute(
+                tabla.delete().where(condicion).returning(tabla.c.id, *columnas_archivo)
+            ).all()
+            if datos is None and len(filas) != confirmar:
+                db.session.rollback()
+                return {
+                    'message': f'Los filtros coinciden con {len(filas)} operaciones, no con {confirmar}; no se eliminó ninguna',
+                    'cantidad': len(filas),
+                }, 409
+            db.session.commit()
+
+            # Los archivos se borran recién después del commit, fuera de la request
+            eliminar_en_segundo_plano(ruta for fila in filas for ruta in fila[1:] if ruta)
+
+            eliminadas = sorted(fila.id for fila in filas)
+            resultado = {
+                'message': f'Se eliminaron {len(eliminadas)} operaciones',
+                'operaciones_eliminadas': eliminadas,
+            }
+            if datos is not None:
+                encontradas = set(eliminadas)
+                no_encontradas = sorted({id for id in ids if id not in encontradas})
+                if no_encontradas:
+                    resultado['operaciones_no_encontradas'] = no_encontradas
+
+            return resultado, 200
+
+        except ValueError as ve:
+            db.session.rollback()
+            return {'message': str(ve)}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {'message': 'Error al eliminar operaciones', 'error': str(e)}, 500
+
+    def _filtros_eliminacion(self, params):
+        """Filtros exactos para eliminar por query string. ValueError si un parámetro no se
+        admite, se repite, está vacío o no es válido"""
+        filtros = []
+        for campo, valores in params.lists():
+            if campo not in self.FILTROS_ELIMINACION:
+                raise ValueError(f'Filtro "{campo}" no permitido para eliminar operaciones')
+            if len(valores) > 1:
+                raise ValueError(f'El filtro "{campo}" se repite')
+            valor = valores[0].strip()
+            if not valor:
+                raise ValueError(f'El filtro "{campo}" está vacío')
+
+            columna = self.FILTROS_ELIMINACION[campo]
+            if campo == 'fecha':
+                filtros.append(self._rango_eliminacion(valor))
+            elif campo == 'tipo':
+                if valor.lower() not in OperacionModel.TIPOS_PERMITIDOS:
+                    raise ValueError(f"Tipo inválido. Debe ser uno de: {', '.join(OperacionModel.TIPOS_PERMITIDOS)}")
+                filtros.append(columna == valor.lower())
+            else:
+                id = self._id_entero(valor)
+                if id is None:
+                    raise ValueError(f'El filtro "{campo}" debe ser un entero')
+                filtros.append(columna == id)
+        return filtros
+
+    def _rango_eliminacion(self, fecha):
+        """fecha completa o parcial, o desde:hasta con ambos extremos incluidos"""
+        desde_texto, separador, hasta_texto = fecha.partition(':')
+        try:
+            desde, hasta = Operaciones()._rango_fecha(desde_texto)
+            if separador:
+                _, hasta = Operaciones()._rango_fecha(hasta_texto)
+        except ValueError:
+            raise ValueError("Fecha inválida. Debe ser en formato 'YYYY-MM-DD', 'YYYY-MM', 'YYYYMM' o 'YYYY', "
+                             "o un rango 'desde:hasta'.")
+        return and_(OperacionModel.fecha >= desde, OperacionModel.fecha < hasta)
+
+    CAMPOS_PERMITIDOS = [
+        'fecha', 'tipo', 'caracter', 'naturaleza', 'id_persona', 
+        'option', 'codigo', 'observaciones', 'metodo_de_pago', 
+        'monto_total', 'id_subcategoria'
+    ]
+
     @role_required(roles=["admin", "supervisor"])
     def patch(self):
         """Actualiza múltiples operaciones en una sola solicitud"""
         try:
             if not request.json or not isinstance(request.json, list):
                 return {'message': 'Se esperaba una lista de operaciones para actualizar'}, 400
+
+            if any(not isinstance(operacion_data, dict) or 'id' not in operacion_data for operacion_data in request.json):
+                return {'message': 'Cada operación debe contener un campo "id"'}, 400
+
+            if any(self._id_entero(operacion_data['id']) is None for operacion_data in request.json):
+                return {'message': 'Los ids de operaciones deben ser enteros'}, 400
             
             usuario_actual_id = get_jwt_identity()
+            usuario_actual = UsuarioModel.query.get(usuario_actual_id)
+            es_supervisor = "supervisor" == str(usuario_actual.rol)
+
+            # Todas las operaciones en una sola consulta
+            ids = {self._id_entero(operacion_data['id']) for operacion_data in request.json}
+            operaciones = {
+                operacion.id: operacion
+                for operacion in OperacionModel.query.filter(OperacionModel.id.in_(ids)).all()
+            }
             
             operaciones_actualizadas = []
             operaciones_no_encontradas = []
             operaciones_sin_permiso = []
+            copias = {}
             
             for operacion_data in request.json:
-                if 'id' not in operacion_data:
-                    return {'message': 'Cada operación debe contener un campo "id"'}, 400
-                
-                operacion = OperacionModel.query.get(operacion_data['id'])
+                operacion = operaciones.get(self._id_entero(operacion_data['id']))
                 if not operacion:
                     operaciones_no_encontradas.append(operacion_data['id'])
                     continue
-                
-                usuario_actual = UsuarioModel.query.get(usuario_actual_id)
 
                 es_creador = int(operacion.id_usuario) == int(usuario_actual_id)
-                es_supervisor = "supervisor" == str(usuario_actual.rol)
                 
                 if not (es_creador or es_supervisor):
                     operaciones_sin_permiso.append(operacion_data['id'])
                     continue
-                
+
+                # Los cambios se aplican sobre una copia fuera de la sesión, así corren los
+                # validadores del modelo sin que el ORM actualice fila por fila
+                copia = copias.get(operacion.id) or self._copia(operacion)
+                copias[operacion.id] = copia
+
                 if es_supervisor and not es_creador:
-                    operacion.modificado_por_otro = True
+                    copia.modificado_por_otro = True
 
                 if es_creador and not es_supervisor:
-                    operacion.modificado_por_otro = False
+                    copia.modificado_por_otro = False
 
-                campos_actualizados = []
-                
-                if 'tipo' in operacion_data:
-                    tipo_anterior = operacion.tipo
-                    nuevo_tipo = operacion_data['tipo']
-                    if tipo_anterior != nuevo_tipo:
-                        operacion.actualizar_tipo_operacion(nuevo_tipo)
-                        campos_actualizados.append('tipo')
-
-                campos_permitidos = [
-                    'fecha', 'tipo', 'caracter', 'naturaleza', 'id_persona', 
-                    'option', 'codigo', 'observaciones', 'metodo_de_pago', 
-                    'monto_total', 'id_subcategoria'
-                ]
-                
-                for campo in campos_permitidos:
-                    if campo in operacion_data:
-                        setattr(operacion, campo, operacion_data[campo])
-                        if campo not in campos_actualizados:
-                            campos_actualizados.append(campo)
-                
+                campos_actualizados = self._aplicar_cambios(copia, operacion_data)
                 if campos_actualizados:
                     operaciones_actualizadas.append({
                         'id': operacion.id,
@@ -309,6 +851,7 @@ class OperacionesBulk(Resource):
                     })
             
             if operaciones_actualizadas:
+                self._actualizar_en_lote(operaciones, copias)
                 db.session.commit()
             
             resultado = {
@@ -328,32 +871,144 @@ class OperacionesBulk(Resource):
             db.session.rollback()
             return {'message': 'Error al actualizar operaciones', 'error': str(e)}, 500
 
+    def _id_entero(self, id):
+        """El id como entero, o None si no lo es: 1.5 o True no se redondean a un id"""
+        if isinstance(id, bool) or (isinstance(id, float) and not id.is_integer()):
+            return None
+        try:
+            return int(id)
+        except (TypeError, ValueError):
+            return None
+
+    def _copia(self, operacion):
+        """Operación transitoria con los valores actuales, cargados sin pasar por los validadores"""
+        copia = OperacionModel()
+        for atributo in OperacionModel.__mapper__.column_attrs:
+            set_committed_value(copia, atributo.key, getattr(operacion, atributo.key))
+        return copia
+
+    def _aplicar_cambios(self, operacion, operacion_data):
+        """Aplica los campos permitidos como lo hace Operacion.patch y devuelve los actualizados"""
+        campos_actualizados = []
+
+        if 'tipo' in operacion_data:
+            tipo_anterior = operacion.tipo
+            nuevo_tipo = operacion_data['tipo']
+            if tipo_anterior != nuevo_tipo:
+                operacion.actualizar_tipo_operacion(nuevo_tipo)
+                campos_actualizados.append('tipo')
+
+        for campo in self.CAMPOS_PERMITIDOS:
+            if campo in operacion_data:
+                setattr(operacion, campo, operacion_data[campo])
+                if campo not in campos_actualizados:
+                    campos_actualizados.append(campo)
+
+        return campos_actualizados
+
+    def _actualizar_en_lote(self, operaciones, copias):
+        """Escribe las diferencias de cada copia. Las operaciones con exactamente los mismos cambios
+        se actualizan con un UPDATE ... WHERE id IN; el resto, con un executemany por conjunto de columnas"""
+        tabla = OperacionModel.__table__
+        columnas = {atributo.key: atributo.columns[0].key for atributo in OperacionModel.__mapper__.column_attrs}
+
+        por_cambios = {}
+        for id, copia in copias.items():
+            cambios = tuple(sorted(
+                (columna, getattr(copia, atributo))
+                for atributo, columna in columnas.items()
+                if getattr(copia, atributo) != getattr(operaciones[id], atributo)
+            ))
+            if cambios:
+                por_cambios.setdefault(cambios, []).append(id)
+
+        por_columnas = {}
+        for cambios, ids in por_cambios.items():
+            if len(ids) > 1:
+                db.session.execute(tabla.update().where(tabla.c.id.in_(ids)).values(dict(cambios)))
+            else:
+                claves = tuple(columna for columna, _ in cambios)
+                por_columnas.setdefault(claves, []).append({'id_operacion': ids[0], **dict(cambios)})
+
+        for claves, filas in por_columnas.items():
+            db.session.execute(
+                tabla.update()
+                    .where(tabla.c.id == bindparam('id_operacion'))
+                    .values({columna: bindparam(columna) for columna in claves}),
+                filas
+            )
+
+        # Las entidades cargadas quedaron desactualizadas
+        for operacion in operaciones.values():
+            db.session.expire(operacion)
+
 class OperacionesExcel(Resource):
     @role_required(roles=["admin", "supervisor"])
     def get(self):
         """Genera y descarga un archivo Excel con las operaciones filtradas"""
         try:
             filtros = Operaciones()._generar_filtros(request.args)
-            query = db.session.query(OperacionModel)
-            query = query.filter(*filtros) if filtros else query
-            
-            operaciones = query.all()
-            
-            data = [op.to_excel() for op in operaciones]
-            df = pd.DataFrame(data)
 
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Operaciones', index=False)
+            # xlsxwriter solo usa memoria constante escribiendo a un archivo
+            return enviar_archivo_temporal(
+                lambda ruta: escribir_excel(filas_exportacion(filtros), ruta),
+                '.xlsx',
+                MIMETYPES['xlsx'],
+                f'operaciones_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.xlsx'
+            )
             
-            output.seek(0)
+        except Exception as e:
+            return {'message': f'Error al generar Excel: {str(e)}'}, 500
 
-            return send_file(
-                output, 
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f'operaciones_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.xlsx'
+class OperacionesExport(Resource):
+    FORMATOS = list(ESCRITORES)
+
+    @role_required(roles=["admin", "supervisor"])
+    def get(self):
+        """Exporta las operaciones filtradas en CSV, NDJSON, Parquet o Excel, con las columnas de to_excel"""
+        try:
+            formato = request.args.get('format', default='csv').lower()
+            if formato not in self.FORMATOS:
+                return {'message': f"Formato inválido. Debe ser uno de: {', '.join(self.FORMATOS)}"}, 400
+
+            params = {k: v for k, v in request.args.items() if k != 'format'}
+            filtros = Operaciones()._generar_filtros(params)
+            nombre = f'operaciones_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.{formato}'
+
+            if formato in ('parquet', 'xlsx'):
+                return enviar_archivo_temporal(
+                    lambda ruta: ESCRITORES[formato](filas_exportacion(filtros), ruta),
+                    f'.{formato}', MIMETYPES[formato], nombre
+                )
+
+            lineas = lineas_csv if formato == 'csv' else lineas_ndjson
+            return Response(
+                stream_with_context(lineas(filas_exportacion(filtros))),
+                mimetype=MIMETYPES[formato],
+                headers={'Content-Disposition': f'attachment; filename={nombre}'}
             )
-            
+
+        except ValueError as ve:
+            return {'message': str(ve)}, 400
+        except Exception as e:
+            return {'message': f'Error al exportar operaciones: {str(e)}'}, 500
+
+class OperacionesArchivosZip(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def get(self):
+        """Descarga en un ZIP los adjuntos de las operaciones filtradas. Se arma mientras se envía:
+        no usa temporales y la memoria no depende de la cantidad ni del tamaño de los archivos"""
+        try:
+            filtros = Operaciones()._generar_filtros(request.args)
+            nombre = f'adjuntos_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.zip'
+
+            return Response(
+                stream_with_context(bloques_zip(adjuntos_exportacion(filtros))),
+                mimetype=MIMETYPES['zip'],
+                headers={'Content-Disposition': f'attachment; filename={nombre}'}
+            )
+
+        except ValueError as ve:
+            return {'message': str(ve)}, 400
         except Exception as e:
-            return {'message': f'Error al generar Excel: {str(e)}'}, 500
\ No newline at end of file
+            return {'message': f'Error al generar el ZIP: {str(e)}'}, 500
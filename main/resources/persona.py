@@ -4,10 +4,12 @@ from .. import db
 from sqlalchemy import or_
 from main.models import PersonaModel
 from main.auth.decorators import role_required
+from .condicional import etag
 import re
 
 class Persona(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag((), tabla_fila="persona")
     def get(self, id):
         """Obtiene una persona por su ID"""
         try:
@@ -45,8 +47,38 @@ class Persona(Resource):
             db.session.rollback()
             return {'message': f'Error al actualizar persona: {str(e)}'}, 500
 
+class PersonasAutocompletar(Resource):
+    LIMITE_MAXIMO = 50
+
+    @role_required(roles=["admin", "supervisor"])
+    def get(self):
+        """Obtiene las primeras personas cuyo CUIT o razón social empiezan con 'q'"""
+        try:
+            prefijo = PersonaModel.normalizar_prefijo(request.args.get('q'))
+            limite = min(max(request.args.get('limit', default=10, type=int), 1), self.LIMITE_MAXIMO)
+            if not prefijo:
+                return {'personas': []}, 200
+
+            # Una consulta por índice, cada una recorre su índice en orden y corta en el límite
+            criterios = [(PersonaModel.razon_social_lower(), prefijo)]
+            if prefijo.isdigit():
+                criterios.insert(0, (PersonaModel.cuit_texto(), prefijo))
+
+            personas = {}
+            for expresion, valor in criterios:
+                filas = db.session.query(PersonaModel.id, PersonaModel.cuit, PersonaModel.razon_social).filter(
+                    PersonaModel._rango_prefijo(expresion, valor)
+                ).order_by(expresion).limit(limite).all()
+                for id, cuit, razon_social in filas:
+                    personas.setdefault(id, {'id': id, 'cuit': cuit, 'razon_social': razon_social})
+
+            return {'personas': list(personas.values())[:limite]}, 200
+        except Exception as e:
+            return {'message': str(e)}, 500
+
 class Personas(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag(("persona",))
     def get(self):
         """Obtiene lista paginada de personas con opción de búsqueda"""
         try:
@@ -0,0 +1,46 @@
+from flask import request
+from .. import db
+
+class CampoInvalido(ValueError):
+    pass
+
+def campos_solicitados(disponibles):
+    """Lee los campos pedidos en 'fields' e 'include'; devuelve None si no se pidió una proyección"""
+    valores = [request.args.get('fields'), request.args.get('include')]
+    campos = [campo.strip() for valor in valores if valor for campo in valor.split(',') if campo.strip()]
+
+    if not campos:
+        return None
+
+    invalidos = [campo for campo in campos if campo not in disponibles]
+    if invalidos:
+        raise CampoInvalido(f"Campos inválidos: {', '.join(invalidos)}. Disponibles: {', '.join(disponibles)}")
+
+    # Respeta el orden de la especificación, como en to_json
+    return [campo for campo in disponibles if campo in campos]
+
+def consulta_proyectada(modelo, especificacion, campos, obligatorias=()):
+    """Arma una query que selecciona solo las columnas de los campos pedidos y una función
+    que convierte cada fila en un dict, sin instanciar entidades del ORM.
+
+    La especificación mapea cada campo a (columnas, armar, joins): columnas etiquetadas a
+    seleccionar, una función que recibe el mapping de la fila y devuelve el valor, y los
+    joins (entidad, condición) que requieren esas columnas."""
+    columnas = {columna.key: columna for columna in obligatorias}
+    joins = {}
+    for campo in campos:
+        columnas_campo, _, joins_campo = especificacion[campo]
+        for columna in columnas_campo:
+            columnas.setdefault(columna.key, columna)
+        for entidad, condicion in joins_campo:
+            joins.setdefault(entidad, condicion)
+
+    query = db.session.query(*columnas.values()).select_from(modelo)
+    for entidad, condicion in joins.items():
+        query = query.outerjoin(entidad, condicion)
+
+    def armar(fila):
+        mapping = fila._mapping
+        return {campo: especificacion[campo][1](mapping) for campo in campos}
+
+    return query, armar
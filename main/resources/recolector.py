@@ -0,0 +1,281 @@
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, delete, or_
+from .. import db
+from main.models import OperacionModel, ArchivoModel, SubidaModel
+from main.models.archivo import CAMPOS_ARCHIVO
+from .almacenamiento import CARPETA_OBJETOS, CARPETA_SUBIDAS, eliminar_archivos
+from .subida import limpiar_vencidas
+from datetime import datetime
+from itertools import islice
+import os, re, time, fcntl, click, logging, threading
+
+logger = logging.getLogger(__name__)
+
+TAMANIO_LOTE = 500
+
+# Archivo de UPLOAD_FOLDER que asegura una sola recolección a la vez entre procesos
+ARCHIVO_LOCK = '.recolector.lock'
+
+_PATRON_HASH = re.compile(r'^[0-9a-f]{64}$')
+_PATRON_PARCIAL = re.compile(r'^([0-9a-f]{32})\.part$')
+
+# Categorías del informe. Los faltantes solo se informan: son rutas de operaciones sin archivo
+HUERFANO_OBJETO = 'objeto'
+HUERFANO_SIN_REFERENCIAS = 'sin_referencias'
+HUERFANO_TEMPORAL = 'temporal'
+HUERFANO_PARCIAL = 'parcial'
+HUERFANO_ADJUNTO = 'adjunto'
+FALTANTE = 'faltante'
+
+def _lotes(iterable, tamanio):
+    iterador = iter(iterable)
+    while lote := list(islice(iterador, tamanio)):
+        yield lote
+
+def _recorrer(carpeta, excluidas):
+    """Genera (ruta, stat) de los archivos bajo la carpeta, directorio por directorio, sin
+    armar la lista completa. No entra en las carpetas excluidas (rutas absolutas)"""
+    pendientes = [carpeta]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            entradas = os.scandir(actual)
+        except FileNotFoundError:
+            continue
+        with entradas:
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entrada.path) not in excluidas:
+                        pendientes.append(entrada.path)
+                elif entrada.is_file(follow_symlinks=False) and entrada.name != ARCHIVO_LOCK:
+                    yield entrada.path, entrada.stat(follow_symlinks=False)
+
+def _variantes(ruta):
+    """Formas en que la ruta puede estar guardada en operacion: tal cual, absoluta o relativa"""
+    absoluta = os.path.abspath(ruta)
+    return {ruta, absoluta, os.path.relpath(absoluta)}
+
+def _adjuntos_referenciados(rutas):
+    """De las rutas del lote, las que alguna columna *_path de operacion usa, en cualquier forma"""
+    variantes = {ruta: _variantes(ruta) for ruta in rutas}
+    buscadas = set().union(*variantes.values())
+    columnas = [getattr(OperacionModel, f'{campo}_path') for campo in CAMPOS_ARCHIVO]
+    usadas = set()
+    for fila in db.session.execute(select(*columnas).where(or_(*[columna.in_(buscadas) for columna in columnas]))):
+        usadas.update(fila)
+    return {ruta for ruta, formas in variantes.items() if formas & usadas}
+
+def _eliminar_si_sin_registro(ruta):
+    """Borra un objeto que ninguna fila de archivo tiene como ruta. La escritura toma el lock de
+    SQLite antes de controlar: guardar_archivo y la migración de adjuntos registran la ruta antes
+    de crear el archivo, así que si alguna está en curso esto espera a su commit y ve la fila"""
+    try:
+        db.session.execute(delete(ArchivoModel).where(ArchivoModel.ruta == ruta, ArchivoModel.referencias <= 0))
+        if db.session.execute(select(ArchivoModel.hash).where(ArchivoModel.ruta == ruta)).first() is None:
+            eliminar_archivos([ruta])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning('No se pudo eliminar el archivo %s: %s', ruta, e)
+
+def _revisar_objetos(lote, limite, eliminar, informar):
+    """Objetos guardados por contenido sin fila en archivo (un commit que falló después de
+    moverlos, o la copia anterior de uno ya migrado) y temporales de escrituras interrumpidas"""
+    viejos = [(ruta, estado) for ruta, estado in lote if estado.st_mtime < limite]
+    objetos = [ruta for ruta, _ in viejos if _PATRON_HASH.match(os.path.basename(ruta))]
+    registradas = set(db.session.execute(
+        select(ArchivoModel.ruta).where(ArchivoModel.ruta.in_(objetos))
+    ).scalars()) if objetos else set()
+
+    for ruta, estado in viejos:
+        if _PATRON_HASH.match(os.path.basename(ruta)):
+            if ruta in registradas:
+                continue
+            informar(HUERFANO_OBJETO, ruta, estado.st_size)
+            if eliminar:
+                _eliminar_si_sin_registro(ruta)
+        else:
+            informar(HUERFANO_TEMPORAL, ruta, estado.st_size)
+            if eliminar:
+                eliminar_archivos([ruta])
+
+def _revisar_parciales(lote, limite, eliminar, informar):
+    """Archivos parciales de subidas que ya no existen"""
+    viejos = [(ruta, estado) for ruta, estado in lote if estado.st_mtime < limite]
+    ids = {
+        coincide.group(1) for ruta, _ in viejos
+        if (coincide := _PATRON_PARCIAL.match(os.path.basename(ruta)))
+    }
+    activas = set(db.session.execute(
+        select(SubidaModel.id).where(SubidaModel.id.in_(ids))
+    ).scalars()) if ids else set()
+
+    for ruta, estado in viejos:
+        coincide = _PATRON_PARCIAL.match(os.path.basename(ruta))
+        if coincide and coincide.group(1) in activas:
+            continue
+        informar(HUERFANO_PARCIAL, ruta, estado.st_size)
+        if eliminar:
+            eliminar_archivos([ruta])
+
+def _revisar_adjuntos(lote, limite, eliminar, informar):
+    """Archivos sueltos de UPLOAD_FOLDER (los adjuntos anteriores al guardado por contenido)
+    que ninguna operación usa"""
+    viejos = [(ruta, estado) for ruta, estado in lote if estado.st_mtime < limite]
+    usadas = _adjuntos_referenciados([ruta for ruta, _ in viejos]) if viejos else set()
+    for ruta, estado in viejos:
+        if ruta in usadas:
+            continue
+        informar(HUERFANO_ADJUNTO, ruta, estado.st_size)
+        if eliminar:
+            eliminar_archivos([ruta])
+
+def _revisar_sin_referencias(limite, eliminar, informar, tamanio_lote):
+    """Filas de archivo que ninguna operación usa (la liberación en segundo plano no llegó a
+    correr) y su contenido. Se recorren de a páginas por hash"""
+    ultimo = ''
+    while True:
+        pagina = db.session.execute(
+            select(ArchivoModel.hash, ArchivoModel.ruta, ArchivoModel.tamanio)
+            .where(ArchivoModel.referencias <= 0, ArchivoModel.creado < limite, ArchivoModel.hash > ultimo)
+            .order_by(ArchivoModel.hash).limit(tamanio_lote)
+        ).all()
+        if not pagina:
+            return
+        for clave, ruta, tamanio in pagina:
+            informar(HUERFANO_SIN_REFERENCIAS, ruta, tamanio)
+            if not eliminar:
+                continue
+            try:
+                liberado = db.session.execute(
+                    delete(ArchivoModel)
+                    .where(ArchivoModel.hash == clave, ArchivoModel.referencias <= 0)
+                    .returning(ArchivoModel.ruta)
+                ).first()
+                if liberado:
+                    eliminar_archivos([ruta])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning('No se pudo liberar el archivo %s: %s', ruta, e)
+        ultimo = pagina[-1][0]
+
+def _revisar_faltantes(informar, tamanio_lote):
+    """Rutas de operaciones cuyo archivo no está en disco, de a páginas por id"""
+    columnas = [getattr(OperacionModel, f'{campo}_path') for campo in CAMPOS_ARCHIVO]
+    ultimo = 0
+    while True:
+        pagina = db.session.execute(
+            select(OperacionModel.id, *columnas)
+            .where(OperacionModel.id > ultimo, or_(*[columna.isnot(None) for columna in columnas]))
+            .order_by(OperacionModel.id).limit(tamanio_lote)
+        ).all()
+        if not pagina:
+            return
+        for _, *rutas in pagina:
+            for ruta in rutas:
+                if ruta and not os.path.exists(ruta):
+                    informar(FALTANTE, ruta, 0)
+        ultimo = pagina[-1][0]
+
+def reconciliar(eliminar=False, gracia=None, informar=None, tamanio_lote=TAMANIO_LOTE, pausa=0):
+    """Compara UPLOAD_FOLDER con las tablas operacion, archivo y subida y encuentra los archivos
+    que nada usa y que tienen más de gracia segundos (ATTACHMENT_GC_GRACE por defecto). Con
+    eliminar=True los borra. El directorio se recorre de a lotes y la base se consulta por lote
+    o de a páginas, así que la memoria no depende de la cantidad de archivos ni de operaciones.
+    informar(categoria, ruta, tamanio) se llama por cada archivo encontrado; pausa son los
+    segundos a esperar entre lotes. Devuelve la cantidad y los bytes por categoría"""
+    carpeta = current_app.config['UPLOAD_FOLDER']
+    gracia = current_app.config['ATTACHMENT_GC_GRACE'] if gracia is None else gracia
+    limite = time.time() - gracia
+
+    resumen = {}
+    def contar(categoria, ruta, tamanio):
+        cantidad, bytes_ = resumen.get(categoria, (0, 0))
+        resumen[categoria] = (cantidad + 1, bytes_ + (tamanio or 0))
+        if informar:
+            informar(categoria, ruta, tamanio)
+
+    if eliminar:
+        limpiar_vencidas()
+
+    # Se recorre con las rutas tal como se arman al guardar, que es como quedan en la base
+    objetos = os.path.join(carpeta, CARPETA_OBJETOS)
+    subidas = os.path.join(carpeta, CARPETA_SUBIDAS)
+    # Las exportaciones e importaciones tienen su propia limpieza
+    propias = {os.path.abspath(current_app.config[clave]) for clave in ('EXPORT_FOLDER', 'IMPORT_FOLDER')}
+
+    revisiones = (
+        (objetos, set(), _revisar_objetos),
+        (subidas, set(), _revisar_parciales),
+        (carpeta, {os.path.abspath(objetos), os.path.abspath(subidas)} | propias, _revisar_adjuntos),
+    )
+    for raiz, excluidas, revisar in revisiones:
+        for lote in _lotes(_recorrer(raiz, excluidas), tamanio_lote):
+            revisar(lote, limite, eliminar, contar)
+            db.session.rollback()
+            time.sleep(pausa)
+
+    _revisar_sin_referencias(datetime.fromtimestamp(limite), eliminar, contar, tamanio_lote)
+    _revisar_faltantes(contar, tamanio_lote)
+    db.session.rollback()
+
+    return {categoria: {'archivos': cantidad, 'bytes': bytes_} for categoria, (cantidad, bytes_) in resumen.items()}
+
+def _con_lock(funcion):
+    """Ejecuta funcion() si ningún otro proceso está recolectando; devuelve False si no pudo"""
+    carpeta = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(carpeta, exist_ok=True)
+    with open(os.path.join(carpeta, ARCHIVO_LOCK), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        funcion()
+        return True
+
+def _recolectar(app):
+    """Bucle del hilo de fondo: cada ATTACHMENT_GC_INTERVAL segundos busca los huérfanos y, con
+    ATTACHMENT_GC_DELETE, los borra; si no, solo deja el informe en el log. Corre con la menor
+    prioridad de CPU y una pausa entre lotes para no competir con las requests"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+    while True:
+        time.sleep(app.config['ATTACHMENT_GC_INTERVAL'])
+        with app.app_context():
+            try:
+                eliminar = app.config['ATTACHMENT_GC_DELETE']
+                resumen = {}
+                if _con_lock(lambda: resumen.update(reconciliar(eliminar=eliminar, pausa=0.1))):
+                    logger.info('Recolección de adjuntos%s: %s', '' if eliminar else ' (sin borrar)', resumen)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Error en la recolección de adjuntos')
+
+def iniciar_recolector(app):
+    """Lanza la recolección periódica en un hilo daemon si ATTACHMENT_GC_INTERVAL es mayor que 0;
+    por defecto no corre"""
+    if app.config['ATTACHMENT_GC_INTERVAL'] > 0:
+        threading.Thread(target=_recolectar, args=(app,), name='recolector', daemon=True).start()
+
+@click.command('reconciliar-adjuntos')
+@click.option('--eliminar', is_flag=True, help='Borra los huérfanos en vez de solo listarlos')
+@click.option('--gracia', type=int, default=None, help='Antigüedad mínima en segundos (ATTACHMENT_GC_GRACE)')
+@with_appcontext
+def reconciliar_command(eliminar, gracia):
+    """Lista (o borra) los archivos de UPLOAD_FOLDER que ninguna operación usa y las rutas de
+    operaciones sin archivo"""
+    def informar(categoria, ruta, tamanio):
+        click.echo(f'{categoria}\t{tamanio}\t{ruta}')
+
+    resumen = {}
+    if not _con_lock(lambda: resumen.update(reconciliar(eliminar=eliminar, gracia=gracia, informar=informar))):
+        click.echo('Hay otra reconciliación en curso')
+        raise SystemExit(1)
+    for categoria, totales in sorted(resumen.items()):
+        click.echo(f'{categoria}: {totales["archivos"]} archivos, {totales["bytes"]} bytes')
+    if not resumen:
+        click.echo('Sin archivos huérfanos')
@@ -0,0 +1,172 @@
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, union_all, func
+from .. import db
+from main.models import OperacionModel, ArchivoModel
+from main.models.archivo import CAMPOS_ARCHIVO
+from .almacenamiento import TAMANIO_BLOQUE, ruta_objeto, reservar_archivo, enlazar_archivo, eliminar_archivos
+import os, time, click, hashlib, logging
+
+logger = logging.getLogger(__name__)
+
+TAMANIO_LOTE = 200
+
+def _hash_archivo(ruta):
+    hash, tamanio = hashlib.sha256(), 0
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(TAMANIO_BLOQUE), b''):
+            hash.update(bloque)
+            tamanio += len(bloque)
+    return hash.hexdigest(), tamanio
+
+def _reemplazar_rutas(vieja, nueva, nombre=None):
+    """Cambia vieja por nueva en las columnas *_path de operacion; si se pasa nombre, completa
+    los *_nombre vacíos. Devuelve cuántas columnas cambió"""
+    tabla = OperacionModel.__table__
+    cambiadas = 0
+    for campo in CAMPOS_ARCHIVO:
+        valores = {f'{campo}_path': nueva}
+        if nombre:
+            valores[f'{campo}_nombre'] = func.coalesce(tabla.c[f'{campo}_nombre'], nombre)
+        cambiadas += db.session.execute(
+            update(tabla).where(tabla.c[f'{campo}_path'] == vieja).values(valores)
+        ).rowcount
+    return cambiadas
+
+def _mover(vieja, registrar):
+    """registrar() actualiza la base dentro de la transacción y devuelve la ruta nueva, o None si
+    ya no hay nada que mover. La primera escritura toma el lock de SQLite, el archivo nuevo se
+    crea antes del commit y el viejo se borra después: quien lea la ruta, antes o después del
+    commit, encuentra el archivo. Si algo falla, el archivo nuevo se borra y la base queda como
+    estaba"""
+    creado, nueva = False, None
+    try:
+        nueva = registrar()
+        if nueva is None:
+            db.session.rollback()
+            return False
+        if not os.path.exists(nueva):
+            os.makedirs(os.path.dirname(nueva), exist_ok=True)
+            enlazar_archivo(vieja, nueva)
+            creado = True
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if creado:
+            eliminar_archivos([nueva])
+        raise
+    if os.path.abspath(vieja) != os.path.abspath(nueva):
+        eliminar_archivos([vieja])
+    return True
+
+def _migrar_objeto(clave, vieja):
+    """Pasa un objeto guardado en la carpeta plana a su ruta repartida"""
+    nueva = ruta_objeto(clave)
+
+    def registrar():
+        movido = db.session.execute(
+            update(ArchivoModel).where(ArchivoModel.hash == clave, ArchivoModel.ruta == vieja).values(ruta=nueva)
+        ).rowcount
+        if not movido:
+            return None
+        referencias = db.session.execute(select(ArchivoModel.referencias).where(ArchivoModel.hash == clave)).scalar()
+        _reemplazar_rutas(vieja, nueva)
+        # Con la fila ya renombrada, los triggers de operacion cuentan cada ruta cambiada como
+        # una referencia nueva: el contador vuelve a su valor
+        db.session.execute(update(ArchivoModel).where(ArchivoModel.hash == clave).values(referencias=referencias))
+        return nueva
+
+    return _mover(vieja, registrar)
+
+def _migrar_adjunto(vieja):
+    """Pasa un adjunto anterior al guardado por contenido (un archivo por operación, con el nombre
+    en la ruta) a la carpeta de objetos, deduplicado y con el nombre original en *_nombre"""
+    clave, tamanio = _hash_archivo(vieja)
+
+    def registrar():
+        nueva = reservar_archivo(clave, tamanio)
+        if not _reemplazar_rutas(vieja, nueva, OperacionModel.get_filename(vieja)):
+            return None
+        return nueva
+
+    return _mover(vieja, registrar)
+
+def _objetos_sin_repartir(tamanio_lote):
+    """Páginas de (hash, ruta) de los objetos que no están en su ruta repartida, por hash"""
+    ultimo = ''
+    while True:
+        pagina = db.session.execute(
+            select(ArchivoModel.hash, ArchivoModel.ruta)
+            .where(ArchivoModel.hash > ultimo).order_by(ArchivoModel.hash).limit(tamanio_lote)
+        ).all()
+        if not pagina:
+            return
+        yield [(clave, ruta) for clave, ruta in pagina if ruta != ruta_objeto(clave)]
+        ultimo = pagina[-1][0]
+
+def _adjuntos_anteriores(tamanio_lote):
+    """Páginas de rutas de operaciones que no son objetos registrados. Lo ya migrado deja de
+    aparecer, así que una migración interrumpida sigue donde quedó"""
+    rutas = union_all(*[
+        select(columna.label('ruta')).where(columna.isnot(None))
+        for columna in (getattr(OperacionModel, f'{campo}_path') for campo in CAMPOS_ARCHIVO)
+    ]).subquery()
+    ultimo = ''
+    while True:
+        pagina = db.session.execute(
+            select(rutas.c.ruta).distinct()
+            .where(rutas.c.ruta > ultimo, rutas.c.ruta.not_in(select(ArchivoModel.ruta)))
+            .order_by(rutas.c.ruta).limit(tamanio_lote)
+        ).scalars().all()
+        if not pagina:
+            return
+        yield pagina
+        ultimo = pagina[-1]
+
+def migrar_adjuntos(tamanio_lote=TAMANIO_LOTE, pausa=0, informar=None):
+    """Lleva los adjuntos a la carpeta de objetos repartida: primero los objetos guardados en la
+    carpeta plana y después los adjuntos anteriores al guardado por contenido. Cada archivo se
+    mueve en su propia transacción, así el servicio sigue funcionando durante la migración y
+    se puede interrumpir y volver a ejecutar. informar(estado, ruta) se llama por archivo;
+    pausa son los segundos a esperar entre lotes. Devuelve la cantidad por estado"""
+    resumen = {}
+    def contar(estado, ruta):
+        resumen[estado] = resumen.get(estado, 0) + 1
+        if informar:
+            informar(estado, ruta)
+
+    def migrar(ruta, mover):
+        try:
+            contar('migrado' if mover() else 'sin_cambios', ruta)
+        except FileNotFoundError:
+            contar('faltante', ruta)
+        except Exception as e:
+            logger.warning('No se pudo migrar el archivo %s: %s', ruta, e)
+            contar('error', ruta)
+
+    for pagina in _objetos_sin_repartir(tamanio_lote):
+        for clave, ruta in pagina:
+            migrar(ruta, lambda: _migrar_objeto(clave, ruta))
+        time.sleep(pausa)
+
+    for pagina in _adjuntos_anteriores(tamanio_lote):
+        for ruta in pagina:
+            migrar(ruta, lambda: _migrar_adjunto(ruta))
+        time.sleep(pausa)
+
+    return resumen
+
+@click.command('migrar-adjuntos')
+@click.option('--lote', type=int, default=TAMANIO_LOTE, help='Archivos por consulta')
+@click.option('--pausa', type=float, default=0, help='Segundos de espera entre lotes')
+@with_appcontext
+def migrar_adjuntos_command(lote, pausa):
+    """Mueve los adjuntos a la carpeta de objetos repartida por hash y actualiza sus rutas"""
+    def informar(estado, ruta):
+        if estado != 'migrado':
+            click.echo(f'{estado}\t{ruta}')
+
+    resumen = migrar_adjuntos(tamanio_lote=lote, pausa=pausa, informar=informar)
+    for estado, cantidad in sorted(resumen.items()):
+        click.echo(f'{estado}: {cantidad}')
+    if not resumen:
+        click.echo('No hay adjuntos para migrar')
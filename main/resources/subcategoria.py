@@ -2,11 +2,16 @@ from flask_restful import Resource
 from flask import request
 from .. import db
 from sqlalchemy import and_, or_
-from main.models import SubcategoriaModel
+from sqlalchemy.orm import aliased
+from main.models import SubcategoriaModel, CategoriaModel, ConceptoModel
+from main.models import catalogo
 from main.auth.decorators import role_required
+from .condicional import etag
+from .proyeccion import CampoInvalido, campos_solicitados, consulta_proyectada
 
 class Subcategoria(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag(("categoria", "concepto"), tabla_fila="subcategoria")
     def get(self, id):
         """Obtiene una subcategoria por su ID"""
         try:
@@ -22,6 +27,7 @@ class Subcategoria(Resource):
             subcategoria  = db.session.query(SubcategoriaModel).get_or_404(id)
             db.session.delete(subcategoria)
             db.session.commit()
+            catalogo.invalidar()
             return {'message': 'Subcategoria eliminada'}, 204
         except Exception as e:
             db.session.rollback()
@@ -39,6 +45,7 @@ class Subcategoria(Resource):
 
             db.session.add(subcategoria)
             db.session.commit()
+            catalogo.invalidar()
             return subcategoria.to_json(), 200
         except Exception as e:
             db.session.rollback()
@@ -46,13 +53,19 @@ class Subcategoria(Resource):
     
 class Subcategorias(Resource):
     @role_required(roles=["admin", "supervisor"])
+    @etag(("subcategoria", "categoria", "concepto"))
     def get(self):
         """Obtiene lista paginada de subcategorias con opción de búsqueda"""
         try:
             page = request.args.get('page', default=1, type=int)
             per_page = request.args.get('per_page', default=10, type=int)
 
-            query = db.session.query(SubcategoriaModel)
+            especificacion = self._especificacion_campos()
+            campos = campos_solicitados(list(especificacion))
+            if campos:
+                query, serializar = consulta_proyectada(SubcategoriaModel, especificacion, campos)
+            else:
+                query, serializar = db.session.query(SubcategoriaModel), SubcategoriaModel.to_json
 
             query = self._aplicar_filtros_busqueda(query)
 
@@ -63,14 +76,44 @@ class Subcategorias(Resource):
             )
 
             return {
-                'subcategorias': [subcategoria.to_json() for subcategoria in subcategorias.items],
+                'subcategorias': [serializar(subcategoria) for subcategoria in subcategorias.items],
                 'total': subcategorias.total,
                 'pages': subcategorias.pages,
                 'page': subcategorias.page,
             }, 200
+        except CampoInvalido as ci:
+            return {'message': str(ci)}, 400
         except Exception as e:
             return {'message': str(e)}, 500
 
+    def _especificacion_campos(self):
+        """Columnas, armado y joins de cada campo de Subcategoria.to_json, para las proyecciones con 'fields'"""
+        Categoria, Concepto = aliased(CategoriaModel), aliased(ConceptoModel)
+
+        def armar_categoria(fila):
+            if fila['categoria_id'] is None:
+                return None
+            return {
+                'id': fila['categoria_id'],
+                'nombre': fila['categoria_nombre'],
+                'concepto': {
+                    'id': fila['concepto_id'],
+                    'nombre': fila['concepto_nombre'],
+                } if fila['concepto_id'] is not None else None
+            }
+
+        return {
+            'id': ([SubcategoriaModel.id.label('id')], lambda fila: fila['id'], ()),
+            'nombre': ([SubcategoriaModel.nombre.label('nombre')], lambda fila: fila['nombre'], ()),
+            'categoria': (
+                [Categoria.id.label('categoria_id'), Categoria.nombre.label('categoria_nombre'),
+                 Concepto.id.label('concepto_id'), Concepto.nombre.label('concepto_nombre')],
+                armar_categoria,
+                ((Categoria, Categoria.id == SubcategoriaModel.id_categoria),
+                 (Concepto, Concepto.id == Categoria.id_concepto))
+            ),
+        }
+
     def _aplicar_busqueda_general(self, query):
         """Aplica búsqueda global sobre varios campos."""
         search = request.args.get('busqueda')
@@ -96,13 +139,15 @@ class Subcategorias(Resource):
         """Aplica filtros específicos por campo."""
         filtros = []
         campos_busqueda = {
-            'concepto': SubcategoriaModel.categoria.concepto.nombre,
-            'categoria': SubcategoriaModel.categoria.nombre,
-            'subcategoria': SubcategoriaModel.nombre,
+            'concepto': lambda t: SubcategoriaModel.categoria.has(
+                CategoriaModel.concepto.has(ConceptoModel.nombre.like(f"%{t}%"))
+            ),
+            'categoria': lambda t: SubcategoriaModel.categoria.has(CategoriaModel.nombre.like(f"%{t}%")),
+            'subcategoria': lambda t: SubcategoriaModel.nombre.like(f"%{t}%"),
         }
         for campo, valor in request.args.items():
             if campo in campos_busqueda:
-                filtros.append(campos_busqueda[campo].like(f"%{valor}%"))
+                filtros.append(campos_busqueda[campo](valor))
         return query.filter(and_(*filtros)) if filtros else query
     
     @role_required(roles=["admin", "supervisor"])
@@ -122,6 +167,7 @@ class Subcategorias(Resource):
             new_subcategoria = SubcategoriaModel.from_json(data)
             db.session.add(new_subcategoria)
             db.session.commit()
+            catalogo.invalidar()
 
             return new_subcategoria.to_json(), 201
         
@@ -0,0 +1,281 @@
+from flask_restful import Resource, current_app
+from flask import request
+from flask_jwt_extended import get_jwt_identity
+from werkzeug.http import parse_content_range_header
+from .. import db
+from main.models import OperacionModel, UsuarioModel, SubidaModel
+from main.models.archivo import CAMPOS_ARCHIVO
+from main.auth.decorators import role_required
+from .almacenamiento import CARPETA_SUBIDAS, TAMANIO_BLOQUE, guardar_temporal, eliminar_archivos, eliminar_en_segundo_plano
+from datetime import datetime, timedelta
+import os, re, uuid, fcntl, hashlib
+
+_PATRON_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+def ruta_parcial(id_subida):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], CARPETA_SUBIDAS, f'{id_subida}.part')
+
+def _bloquear(archivo):
+    """Toma el archivo parcial para esta request; False si otra request lo está escribiendo"""
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+def _permisos(operacion):
+    """Como en ArchivoOperacion.patch: pueden adjuntar el creador y los supervisores. Devuelve
+    si puede y el valor que corresponde a modificado_por_otro"""
+    usuario_actual_id = get_jwt_identity()
+    usuario_actual = UsuarioModel.query.get(usuario_actual_id)
+
+    es_creador = int(operacion.id_usuario) == int(usuario_actual_id)
+    es_supervisor = "supervisor" == str(usuario_actual.rol)
+
+    if es_supervisor and not es_creador:
+        return True, True
+    if es_creador and not es_supervisor:
+        return True, False
+    return es_creador or es_supervisor, operacion.modificado_por_otro
+
+def limpiar_vencidas():
+    """Descarta las subidas sin terminar de más de UPLOAD_TTL segundos"""
+    limite = datetime.now() - timedelta(seconds=current_app.config['UPLOAD_TTL'])
+    ids = db.session.execute(
+        db.delete(SubidaModel).where(SubidaModel.creada < limite).returning(SubidaModel.id)
+    ).scalars().all()
+    db.session.commit()
+    for id_subida in ids:
+        try:
+            os.remove(ruta_parcial(id_subida))
+        except FileNotFoundError:
+            pass
+
+def _subida_del_usuario(id):
+    """La subida si existe y la inició el usuario actual; las de otros no se muestran"""
+    subida = SubidaModel.query.get(id)
+    if subida is None or int(subida.id_usuario) != int(get_jwt_identity()):
+        return None
+    return subida
+
+def _recibido(id_subida):
+    try:
+        return os.path.getsize(ruta_parcial(id_subida))
+    except FileNotFoundError:
+        return 0
+
+def _estado(subida, recibido=None):
+    return {
+        'id': subida.id,
+        'id_operacion': subida.id_operacion,
+        'campo': subida.campo,
+        'nombre': subida.nombre,
+        'tamanio': subida.tamanio,
+        'recibido': _recibido(subida.id) if recibido is None else recibido,
+    }
+
+def _offset_solicitado():
+    """Offset de la parte: el inicio de Content-Range (bytes inicio-fin/total) o ?offset=.
+    ValueError si no viene o no es válido"""
+    if 'Content-Range' in request.headers:
+        rango = parse_content_range_header(request.headers['Content-Range'])
+        if rango is None or rango.start is None:
+            raise ValueError('Content-Range inválido')
+        if rango.stop - rango.start != request.content_length:
+            raise ValueError('Content-Range no coincide con el tamaño de la parte')
+        return rango.start
+    offset = request.args.get('offset', type=int)
+    if offset is None or offset < 0:
+        raise ValueError('Falta el offset de la parte')
+    return offset
+
+class SubidasArchivo(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def post(self, id_operacion, campo_archivo):
+        """Inicia la subida por partes de un archivo de la operación.
+        Body: {"nombre": ..., "tipo": ..., "tamanio": bytes, "sha256": hex}"""
+        try:
+            if campo_archivo not in CAMPOS_ARCHIVO:
+                return {'message': f'Campo de archivo "{campo_archivo}" no permitido'}, 400
+
+            operacion = OperacionModel.query.get(id_operacion)
+            if not operacion:
+                return {'message': 'Operación no encontrada'}, 404
+
+            permitido, _ = _permisos(operacion)
+            if not permitido:
+                return {'message': 'No tienes permiso para editar esta operación'}, 403
+
+            datos = request.get_json(silent=True) or {}
+            nombre = datos.get('nombre')
+            tamanio = datos.get('tamanio')
+            sha256 = str(datos.get('sha256') or '').lower()
+
+            if not nombre:
+                return {'message': 'Falta el nombre del archivo'}, 400
+            if not isinstance(tamanio, int) or isinstance(tamanio, bool) or tamanio <= 0:
+                return {'message': 'El tamaño del archivo debe ser un entero positivo'}, 400
+            if tamanio > current_app.config['UPLOAD_MAX_SIZE']:
+                return {'message': 'El archivo supera el tamaño máximo permitido'}, 413
+            if not _PATRON_SHA256.match(sha256):
+                return {'message': 'Falta el SHA-256 del archivo o no es válido'}, 400
+
+            limpiar_vencidas()
+
+            subida = SubidaModel(
+                id=uuid.uuid4().hex,
+                id_operacion=id_operacion,
+                campo=campo_archivo,
+                nombre=nombre,
+                tipo=datos.get('tipo'),
+                tamanio=tamanio,
+                sha256=sha256,
+                id_usuario=int(get_jwt_identity()),
+            )
+            os.makedirs(os.path.dirname(ruta_parcial(subida.id)), exist_ok=True)
+            open(ruta_parcial(subida.id), 'wb').close()
+            db.session.add(subida)
+            db.session.commit()
+
+            respuesta = _estado(subida, recibido=0)
+            respuesta['tamanio_parte'] = current_app.config['UPLOAD_CHUNK_SIZE']
+            return respuesta, 201
+
+        except Exception as e:
+            db.session.rollback()
+            return {'message': 'Error al iniciar la subida', 'error': str(e)}, 500
+
+class Subida(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def get(self, id):
+        """Estado de la subida; recibido es el offset desde el que se retoma"""
+        subida = _subida_del_usuario(id)
+        if subida is None:
+            return {'message': 'Subida no encontrada'}, 404
+        return _estado(subida), 200
+
+    @role_required(roles=["admin", "supervisor"])
+    def put(self, id):
+        """Recibe una parte del archivo (cuerpo binario) en el offset indicado. El offset tiene
+        que ser lo recibido hasta ahora; si no, responde 409 con el offset correcto"""
+        subida = _subida_del_usuario(id)
+        if subida is None:
+            return {'message': 'Subida no encontrada'}, 404
+
+        longitud = request.content_length
+        if longitud is None:
+            return {'message': 'Falta Content-Length'}, 411
+        if longitud > current_app.config['UPLOAD_CHUNK_SIZE']:
+            return {'message': 'La parte supera el tamaño máximo permitido'}, 413
+        try:
+            offset = _offset_solicitado()
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
+        # Modo append: si la conexión se corta a mitad de la parte, lo escrito hasta ahí queda
+        # y la subida se retoma desde ese punto
+        with open(ruta_parcial(subida.id), 'ab') as archivo:
+            if not _bloquear(archivo):
+                return {'message': 'Otra parte de esta subida se está recibiendo'}, 409
+
+            recibido = os.fstat(archivo.fileno()).st_size
+            if offset != recibido:
+                return {'message': 'El offset no coincide con lo recibido', 'recibido': recibido}, 409
+            if offset + longitud > subida.tamanio:
+                return {'message': 'La parte excede el tamaño declarado del archivo', 'recibido': recibido}, 400
+
+            for bloque in iter(lambda: request.stream.read(TAMANIO_BLOQUE), b''):
+                archivo.write(bloque)
+                recibido += len(bloque)
+
+        return _estado(subida, recibido=recibido), 200
+
+    @role_required(roles=["admin", "supervisor"])
+    def delete(self, id):
+        """Cancela la subida y borra lo recibido"""
+        subida = _subida_del_usuario(id)
+        if subida is None:
+            return {'message': 'Subida no encontrada'}, 404
+        try:
+            db.session.delete(subida)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return {'message': 'Error al cancelar la subida', 'error': str(e)}, 500
+        try:
+            os.remove(ruta_parcial(id))
+        except FileNotFoundError:
+            pass
+        return {'message': 'Subida cancelada'}, 200
+
+class FinalizarSubida(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def post(self, id):
+        """Verifica el tamaño y el SHA-256 de lo recibido y lo asigna al campo de la operación en
+        la misma transacción que borra la subida. El archivo parcial se borra recién después del
+        commit: si la transacción falla, la subida sigue completa y se puede volver a finalizar"""
+        subida = _subida_del_usuario(id)
+        if subida is None:
+            return {'message': 'Subida no encontrada'}, 404
+
+        parcial = ruta_parcial(subida.id)
+        try:
+            archivo = open(parcial, 'rb')
+        except FileNotFoundError:
+            return {'message': 'No se recibió ninguna parte de la subida', 'recibido': 0}, 409
+
+        with archivo:
+            if not _bloquear(archivo):
+                return {'message': 'Otra parte de esta subida se está recibiendo'}, 409
+
+            recibido = os.fstat(archivo.fileno()).st_size
+            if recibido != subida.tamanio:
+                return {'message': 'La subida no está completa', 'recibido': recibido}, 409
+
+            hash = hashlib.sha256()
+            for bloque in iter(lambda: archivo.read(TAMANIO_BLOQUE), b''):
+                hash.update(bloque)
+            if hash.hexdigest() != subida.sha256:
+                # No se sabe qué parte llegó mal: se vuelve a empezar con la misma subida
+                os.truncate(parcial, 0)
+                return {'message': 'El SHA-256 no coincide; la subida debe reiniciarse', 'recibido': 0}, 422
+
+            ruta, creada = None, False
+            try:
+                operacion = OperacionModel.query.get(subida.id_operacion)
+                if not operacion:
+                    return {'message': 'Operación no encontrada'}, 404
+
+                permitido, modificado_por_otro = _permisos(operacion)
+                if not permitido:
+                    return {'message': 'No tienes permiso para editar esta operación'}, 403
+
+                campo = subida.campo
+                old_path = getattr(operacion, f"{campo}_path")
+
+                ruta, creada = guardar_temporal(parcial, subida.sha256, subida.tamanio)
+                setattr(operacion, f"{campo}_path", ruta)
+                setattr(operacion, f"{campo}_tipo", subida.tipo)
+                setattr(operacion, f"{campo}_nombre", subida.nombre)
+                operacion.modificado_por_otro = modificado_por_otro
+                db.session.delete(subida)
+
+                db.session.commit()
+
+            except Exception as e:
+                # El objeto se borra antes del rollback, mientras la transacción todavía tiene el
+                # lock de escritura: nadie pudo registrar esa ruta mientras tanto
+                if creada:
+                    eliminar_archivos([ruta])
+                db.session.rollback()
+                return {'message': 'Error al finalizar la subida', 'error': str(e)}, 500
+
+        eliminar_archivos([parcial])
+        if old_path:
+            eliminar_en_segundo_plano([old_path])
+
+        return {
+            'message': f'Archivo "{campo}" actualizado correctamente',
+            'archivo_actualizado': campo,
+            'modificado_por_otro': operacion.modificado_por_otro
+        }, 200
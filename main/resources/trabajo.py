@@ -0,0 +1,216 @@
+from flask_restful import Resource, current_app
+from flask import request, send_file
+from concurrent.futures import ThreadPoolExecutor
+from .. import db
+from main.models import OperacionModel
+from main.models.version import versiones_tablas
+from main.auth.decorators import role_required
+from .operacion import Operaciones
+from .exportacion import filas_exportacion, ESCRITORES, MIMETYPES
+from datetime import datetime
+import os, re, json, time, uuid, hashlib, threading
+
+# Estado de los trabajos de este proceso. Los archivos terminados quedan en EXPORT_FOLDER con
+# un nombre derivado de la clave, así que se reutilizan aunque el proceso se reinicie.
+_trabajos = {}
+_lock = threading.Lock()
+_pool = None
+
+# Archivos que genera un trabajo en EXPORT_FOLDER: {clave}.{formato} y, mientras se escribe,
+# {clave}.{formato}.{id del trabajo}.tmp. El resto de la carpeta no se toca
+_PATRON_ARCHIVO = re.compile(rf'^[0-9a-f]{{64}}\.(?:{"|".join(ESCRITORES)})(?:\.([0-9a-f]{{32}})\.tmp)?$')
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=current_app.config['EXPORT_WORKERS'], thread_name_prefix='exportacion'
+            )
+        return _pool
+
+# Veces que se vuelve a generar un archivo si los datos cambiaron mientras se escribía
+INTENTOS = 3
+
+def _clave(formato, params, versiones):
+    """Identifica el resultado de una exportación: mismo formato y filtros sobre los mismos datos"""
+    contenido = json.dumps(
+        {'formato': formato, 'filtros': params, 'versiones': versiones}, sort_keys=True
+    )
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+def _ruta(clave, formato):
+    return os.path.join(current_app.config['EXPORT_FOLDER'], f'{clave}.{formato}')
+
+def _vigente(ruta):
+    return os.path.exists(ruta) and time.time() - os.path.getmtime(ruta) < current_app.config['EXPORT_TTL']
+
+def _limpiar_vencidos():
+    """Borra los archivos cuyo TTL venció y olvida los trabajos terminados que apuntaban a ellos"""
+    with _lock:
+        activos = {id for id, trabajo in _trabajos.items() if trabajo['estado'] in ('pendiente', 'procesando')}
+    with os.scandir(current_app.config['EXPORT_FOLDER']) as entradas:
+        for entrada in entradas:
+            coincide = _PATRON_ARCHIVO.match(entrada.name)
+            if not coincide or not entrada.is_file(follow_symlinks=False) or coincide.group(1) in activos:
+                continue
+            if not _vigente(entrada.path):
+                try:
+                    os.remove(entrada.path)
+                except FileNotFoundError:
+                    pass
+    with _lock:
+        for id, trabajo in list(_trabajos.items()):
+            if trabajo['estado'] in ('terminado', 'error') and not _vigente(trabajo['ruta']):
+                del _trabajos[id]
+
+def _actualizar(id, **cambios):
+    with _lock:
+        _trabajos[id].update(cambios)
+
+def _contar_progreso(id, filas):
+    for numero, fila in enumerate(filas, start=1):
+        if numero % 1000 == 0:
+            _actualizar(id, progreso=numero)
+        yield fila
+
+def _ejecutar(app, id, formato, params):
+    """Genera el archivo del trabajo en un temporal y lo renombra al terminar, para que nunca se
+    reutilice un archivo a medio escribir. Las versiones se leen antes y después de escribirlo:
+    si no cambiaron, ninguna escritura se confirmó en el medio y el archivo se guarda con la
+    clave de esas versiones. Si cambiaron, se descarta y se vuelve a generar"""
+    with app.app_context():
+        temporal = None
+        try:
+            filtros = Operaciones()._generar_filtros(params)
+            for _ in range(INTENTOS):
+                versiones = versiones_tablas()
+                query = db.session.query(OperacionModel.id)
+                total = (query.filter(*filtros) if filtros else query).count()
+                _actualizar(id, estado='procesando', total=total, progreso=0)
+
+                clave = _clave(formato, params, versiones)
+                ruta = _ruta(clave, formato)
+                temporal = f'{ruta}.{id}.tmp'
+                ESCRITORES[formato](_contar_progreso(id, filas_exportacion(filtros)), temporal)
+                db.session.rollback()
+                if versiones_tablas() == versiones:
+                    os.replace(temporal, ruta)
+                    temporal = None
+                    _actualizar(
+                        id, estado='terminado', progreso=total, terminado=datetime.now(),
+                        ruta=ruta, clave=clave
+                    )
+                    return
+                os.remove(temporal)
+                temporal = None
+            raise RuntimeError('Los datos cambiaron durante la exportación; volver a intentar')
+        except Exception as e:
+            _actualizar(id, estado='error', error=str(e), terminado=datetime.now())
+            if temporal and os.path.exists(temporal):
+                os.remove(temporal)
+
+def _trabajo_json(id, trabajo):
+    return {
+        'id': id,
+        'estado': trabajo['estado'],
+        'formato': trabajo['formato'],
+        'filtros': trabajo['filtros'],
+        'progreso': trabajo['progreso'],
+        'total': trabajo['total'],
+        'reutilizado': trabajo['reutilizado'],
+        'creado': trabajo['creado'].strftime("%Y-%m-%d %H:%M:%S"),
+        'terminado': trabajo['terminado'].strftime("%Y-%m-%d %H:%M:%S") if trabajo['terminado'] else None,
+        'error': trabajo['error'],
+    }
+
+class TrabajosExportacion(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def post(self):
+        """Encola la exportación de las operaciones filtradas y devuelve el trabajo.
+        Si ya existe el archivo para los mismos filtros y datos, o se está generando, se reutiliza"""
+        try:
+            datos = request.get_json(silent=True) or {}
+            if not isinstance(datos, dict):
+                return {'message': 'Se esperaba un objeto con los filtros de la exportación'}, 400
+
+            formato = str(datos.get('format', 'xlsx')).lower()
+            if formato not in ESCRITORES:
+                return {'message': f"Formato inválido. Debe ser uno de: {', '.join(ESCRITORES)}"}, 400
+
+            params = {k: str(v) for k, v in datos.items() if k != 'format'}
+            Operaciones()._generar_filtros(params)
+
+            os.makedirs(current_app.config['EXPORT_FOLDER'], exist_ok=True)
+            _limpiar_vencidos()
+
+            clave = _clave(formato, params, versiones_tablas())
+            ruta = _ruta(clave, formato)
+
+            with _lock:
+                for id, trabajo in _trabajos.items():
+                    if trabajo['clave'] == clave and trabajo['estado'] in ('pendiente', 'procesando'):
+                        return _trabajo_json(id, trabajo), 202
+
+                id = uuid.uuid4().hex
+                reutilizado = _vigente(ruta)
+                _trabajos[id] = {
+                    'clave': clave,
+                    'formato': formato,
+                    'filtros': params,
+                    'ruta': ruta,
+                    'estado': 'terminado' if reutilizado else 'pendiente',
+                    'progreso': 0,
+                    'total': None,
+                    'reutilizado': reutilizado,
+                    'creado': datetime.now(),
+                    'terminado': datetime.now() if reutilizado else None,
+                    'error': None,
+                }
+                trabajo = dict(_trabajos[id])
+
+            if reutilizado:
+                return _trabajo_json(id, trabajo), 200
+
+            _executor().submit(_ejecutar, current_app._get_current_object(), id, formato, params)
+            return _trabajo_json(id, trabajo), 202
+
+        except ValueError as ve:
+            return {'message': str(ve)}, 400
+        except Exception as e:
+            return {'message': 'Error al crear la exportación', 'error': str(e)}, 500
+
+class TrabajoExportacion(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def get(self, id):
+        """Obtiene el estado y progreso de un trabajo de exportación"""
+        with _lock:
+            trabajo = dict(_trabajos[id]) if id in _trabajos else None
+        if not trabajo:
+            return {'message': 'Exportación no encontrada'}, 404
+        return _trabajo_json(id, trabajo), 200
+
+class ArchivoTrabajoExportacion(Resource):
+    @role_required(roles=["admin", "supervisor"])
+    def get(self, id):
+        """Descarga el archivo de un trabajo de exportación terminado"""
+        try:
+            with _lock:
+                trabajo = dict(_trabajos[id]) if id in _trabajos else None
+            if not trabajo:
+                return {'message': 'Exportación no encontrada'}, 404
+
+            if trabajo['estado'] != 'terminado':
+                return {'message': f"La exportación no está terminada (estado: {trabajo['estado']})"}, 409
+
+            if not _vigente(trabajo['ruta']):
+                return {'message': 'El archivo de la exportación venció'}, 410
+
+            return send_file(
+                trabajo['ruta'],
+                mimetype=MIMETYPES[trabajo['formato']],
+                as_attachment=True,
+                download_name=f"operaciones_{trabajo['creado'].strftime('%Y-%m-%d_%H-%M-%S')}.{trabajo['formato']}"
+            )
+        except Exception as e:
+            return {'message': 'Error al descargar la exportación', 'error': str(e)}, 500
@@ -0,0 +1,115 @@
+import os, tempfile
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# La configuración se lee de las variables de entorno en create_app
+_carpeta = tempfile.mkdtemp()
+os.environ.update(
+    DATABASE_PATH=_carpeta + '/',
+    DATABASE_NAME='test.db',
+    UPLOAD_FOLDER=os.path.join(_carpeta, 'uploads'),
+    JWT_SECRET_KEY='clave-de-prueba-con-largo-suficiente-para-hs256',
+    JWT_ACCESS_TOKEN_EXPIRES='3600',
+)
+
+from main import create_app, db
+from main.migraciones import migrar
+from main.models import (
+    UsuarioModel, ConceptoModel, CategoriaModel, SubcategoriaModel, PersonaModel, OperacionModel, catalogo
+)
+from flask_jwt_extended import create_access_token
+
+CANTIDAD_OPERACIONES = 120
+
+@pytest.fixture(scope='session')
+def app():
+    # create_app registra los recursos en la Api del módulo: una sola app para toda la sesión
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        migrar()
+        _cargar_datos()
+        catalogo.cargar()
+        yield app
+
+def _cargar_datos():
+    supervisor = UsuarioModel(nombre='Ana', apellido='Pérez', email='ana@test.com', rol='supervisor')
+    admin = UsuarioModel(nombre='Bruno', apellido='Gómez', email='bruno@test.com', rol='admin')
+    supervisor.plain_password = admin.plain_password = 'clave'
+    db.session.add_all([supervisor, admin])
+
+    concepto = ConceptoModel(nombre='Gastos')
+    db.session.add(concepto)
+    db.session.flush()
+    categoria = CategoriaModel(nombre='Servicios', id_concepto=concepto.id)
+    db.session.add(categoria)
+    db.session.flush()
+    luz = SubcategoriaModel(nombre='Luz', id_categoria=categoria.id)
+    agua = SubcategoriaModel(nombre='Agua', id_categoria=categoria.id)
+    edenor = PersonaModel(cuit=20123456789, razon_social='Edenor SA')
+    aysa = PersonaModel(cuit=30123456789, razon_social='Aysa')
+    db.session.add_all([luz, agua, edenor, aysa])
+    db.session.flush()
+
+    for i in range(CANTIDAD_OPERACIONES):
+        db.session.add(OperacionModel(
+            fecha=f'2024-{i % 12 + 1:02d}-{i % 27 + 1:02d}',
+            tipo='egreso' if i % 3 else 'ingreso',
+            caracter='casa' if i % 2 else 'oficina',
+            naturaleza='personal',
+            id_persona=(edenor if i % 2 else aysa).id,
+            option='boleta',
+            codigo=str(1000 + i),
+            observaciones=f'Operación {i}',
+            metodo_de_pago='efectivo',
+            monto_total=100 + i,
+            id_subcategoria=(luz if i % 4 else agua).id,
+            id_usuario=(supervisor if i % 2 else admin).id,
+        ))
+    db.session.commit()
+
+@pytest.fixture
+def usuario():
+    return UsuarioModel.query.filter_by(email='ana@test.com').one()
+
+@pytest.fixture
+def cliente(client, usuario):
+    """Cliente de pruebas con el token de la supervisora"""
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + create_access_token(identity=usuario)
+    return client
+
+@pytest.fixture
+def cliente_admin(app):
+    """Cliente de pruebas con el token del admin"""
+    admin = UsuarioModel.query.filter_by(email='bruno@test.com').one()
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + create_access_token(identity=admin)
+    return client
+
+@pytest.fixture
+def contar_consultas():
+    """contar_consultas() devuelve la lista de sentencias ejecutadas dentro del bloque with"""
+    @contextmanager
+    def contar():
+        sentencias = []
+        def registrar(conn, cursor, sentencia, parametros, context, executemany):
+            sentencias.append(sentencia)
+        event.listen(db.engine, 'before_cursor_execute', registrar)
+        try:
+            yield sentencias
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', registrar)
+    return contar
+
+@pytest.fixture
+def explicar(app):
+    """explicar(sentencia) devuelve los pasos de EXPLAIN QUERY PLAN de la sentencia"""
+    def explicar(sentencia):
+        compilada = sentencia.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+        parametros = tuple(str(compilada.params[nombre]) for nombre in compilada.positiontup)
+        return [
+            fila[-1] for fila in
+            db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compilada), parametros)
+        ]
+    return explicar
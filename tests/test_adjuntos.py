@@ -0,0 +1,30 @@
+from main import db
+from main.resources.reorganizacion import _reemplazar_rutas, _adjuntos_anteriores
+
+def _planes(sentencias):
+    """Plan de cada sentencia ejecutada; los parámetros no cambian el plan"""
+    conexion = db.session.connection()
+    return [
+        [fila[-1] for fila in conexion.exec_driver_sql('EXPLAIN QUERY PLAN ' + sentencia, ('',) * sentencia.count('?'))]
+        for sentencia in sentencias
+    ]
+
+def _sin_recorrer_operacion(planes):
+    pasos = [paso for plan in planes for paso in plan if ' operacion' in f' {paso}']
+    assert pasos
+    assert not [paso for paso in pasos if paso.startswith('SCAN operacion')], pasos
+    return pasos
+
+def test_reemplazar_rutas_usa_indices(app, contar_consultas):
+    with contar_consultas() as sentencias:
+        _reemplazar_rutas('uploads/vieja.pdf', 'uploads/objetos/ab/cd/nueva', 'vieja.pdf')
+    db.session.rollback()
+    pasos = _sin_recorrer_operacion(_planes(sentencias))
+    for campo in ('comprobante', 'archivo1', 'archivo2', 'archivo3'):
+        assert any(f'ix_operacion_{campo}_path' in paso for paso in pasos), pasos
+
+def test_adjuntos_anteriores_usa_indices(app, contar_consultas):
+    with contar_consultas() as sentencias:
+        next(_adjuntos_anteriores(10), None)
+    db.session.rollback()
+    _sin_recorrer_operacion(_planes(sentencias))
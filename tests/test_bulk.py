@@ -0,0 +1,98 @@
+import pytest
+from main import db
+from main.models import OperacionModel
+
+def _operacion(**campos):
+    return {
+        'fecha': '2023-06-15', 'tipo': 'egreso', 'caracter': 'casa', 'naturaleza': 'personal',
+        'id_persona': 1, 'option': 'boleta', 'codigo': '123', 'observaciones': 'bulk',
+        'metodo_de_pago': 'efectivo', 'monto_total': 10, 'id_subcategoria': 1, 'id_usuario': 1,
+        **campos,
+    }
+
+@pytest.fixture
+def creadas(cliente_admin):
+    """Operaciones propias del test, borradas al terminar"""
+    respuesta = cliente_admin.post('/api/operaciones/bulk', json=[_operacion() for _ in range(3)])
+    assert respuesta.status_code == 201
+    ids = [creada['id'] for creada in respuesta.json['operaciones_creadas']]
+    yield ids
+    db.session.rollback()
+    db.session.execute(db.delete(OperacionModel).where(OperacionModel.id.in_(ids)))
+    db.session.commit()
+
+def _total():
+    db.session.rollback()
+    return OperacionModel.query.count()
+
+def test_eliminar_por_id_es_exacto(cliente_admin):
+    # Con LIKE '%5%' coincidirían 5, 15, 25, 50...
+    respuesta = cliente_admin.delete('/api/operaciones/bulk?id=5&dry_run=true')
+    assert respuesta.status_code == 200
+    assert respuesta.json['cantidad'] == 1
+
+def test_eliminar_por_filtro_confirmado(cliente_admin, creadas):
+    total = _total()
+    respuesta = cliente_admin.delete(f'/api/operaciones/bulk?id={creadas[0]}&confirmar=1')
+    assert respuesta.status_code == 200
+    assert respuesta.json['operaciones_eliminadas'] == [creadas[0]]
+    assert _total() == total - 1
+
+@pytest.mark.parametrize('query', [
+    'observaciones=', 'id=', 'fecha=%20', 'id=5&id=6', 'observaciones=obs', 'q=bulk',
+    'id=abc', 'fecha=2023/06', 'tipo=egr', '', 'dry_run=true',
+])
+def test_eliminar_por_filtro_invalido(cliente_admin, query):
+    total = _total()
+    respuesta = cliente_admin.delete(f'/api/operaciones/bulk?{query}&confirmar={total}')
+    assert respuesta.status_code == 400
+    assert _total() == total
+
+def test_eliminar_por_filtro_sin_confirmar(cliente_admin, creadas):
+    total = _total()
+    filtro = 'id_usuario=1&fecha=2023-06-15&tipo=egreso'
+    assert cliente_admin.delete(f'/api/operaciones/bulk?{filtro}').status_code == 400
+    cantidad = cliente_admin.delete(f'/api/operaciones/bulk?{filtro}&dry_run=true').json['cantidad']
+    assert cantidad == len(creadas)
+
+    respuesta = cliente_admin.delete(f'/api/operaciones/bulk?{filtro}&confirmar={cantidad - 1}')
+    assert respuesta.status_code == 409
+    assert respuesta.json['cantidad'] == cantidad
+    assert _total() == total
+
+    respuesta = cliente_admin.delete(f'/api/operaciones/bulk?{filtro}&confirmar={cantidad}')
+    assert respuesta.status_code == 200
+    assert sorted(respuesta.json['operaciones_eliminadas']) == sorted(creadas)
+    assert _total() == total - cantidad
+
+def test_eliminar_por_filtro_solo_admin(cliente, creadas):
+    total = _total()
+    respuesta = cliente.delete(f'/api/operaciones/bulk?id={creadas[0]}&confirmar=1')
+    assert respuesta.status_code == 403
+    assert _total() == total
+
+@pytest.mark.parametrize('invalida', [
+    _operacion(monto_total=None),
+    _operacion(fecha='2023-02-30', tipo='otro'),
+    {key: valor for key, valor in _operacion().items() if key != 'codigo'},
+    'no es un objeto',
+])
+def test_crear_informa_los_mismos_errores_que_dry_run(cliente_admin, invalida):
+    total = _total()
+    real = cliente_admin.post('/api/operaciones/bulk', json=[invalida])
+    prueba = cliente_admin.post('/api/operaciones/bulk?dry_run=true', json=[invalida])
+    assert real.status_code == 400
+    assert real.json['errores'] == prueba.json['errores']
+    assert isinstance(real.json['errores'][0]['errores'], dict)
+    assert 'abs()' not in str(real.json)
+    assert _total() == total
+
+@pytest.mark.parametrize('datos', [[{'id': 'abc'}], [{'id': None}], [{'id': 1.5}], [{'id': True}], [{'id': 1}, {'id': '2x'}], ['identificador']])
+def test_actualizar_con_id_invalido(cliente, datos):
+    respuesta = cliente.patch('/api/operaciones/bulk', json=datos)
+    assert respuesta.status_code == 400
+
+def test_actualizar_con_id_inexistente(cliente):
+    respuesta = cliente.patch('/api/operaciones/bulk', json=[{'id': '999999', 'observaciones': 'x'}])
+    assert respuesta.status_code == 200
+    assert respuesta.json['operaciones_no_encontradas'] == ['999999']
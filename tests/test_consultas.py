@@ -0,0 +1,32 @@
+import pytest
+
+def _consultas(cliente, contar_consultas, url):
+    # La primera request carga lo que se cachea entre requests (catálogo); se cuenta la segunda
+    assert cliente.get(url).status_code == 200
+    with contar_consultas() as sentencias:
+        respuesta = cliente.get(url)
+    assert respuesta.status_code == 200
+    return len(sentencias)
+
+def test_listado_no_depende_de_per_page(cliente, contar_consultas):
+    cantidades = {
+        per_page: _consultas(cliente, contar_consultas, f'/api/operaciones?per_page={per_page}')
+        for per_page in (5, 20, 100)
+    }
+    assert len(set(cantidades.values())) == 1, cantidades
+    assert 3 <= cantidades[5] <= 5
+
+def test_listado_filtrado_no_depende_de_per_page(cliente, contar_consultas):
+    cantidades = {
+        per_page: _consultas(cliente, contar_consultas, f'/api/operaciones?tipo=egreso&per_page={per_page}')
+        for per_page in (5, 50)
+    }
+    assert len(set(cantidades.values())) == 1, cantidades
+
+@pytest.mark.parametrize('id', [1, 2, 3])
+def test_detalle(cliente, contar_consultas, id):
+    assert _consultas(cliente, contar_consultas, f'/api/operacion/{id}') == 3
+
+@pytest.mark.parametrize('filtro', ['', '?tipo=egreso', '?fecha=2024-03'])
+def test_excel_en_una_consulta(cliente, contar_consultas, filtro):
+    assert _consultas(cliente, contar_consultas, f'/api/operaciones/excel{filtro}') == 1
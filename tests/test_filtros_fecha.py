@@ -0,0 +1,43 @@
+import pytest
+from datetime import date
+from main.models import OperacionModel
+from main.resources.operacion import Operaciones
+
+FECHAS = ['2024', '2024-03', '202403', '2024-03-05', '2024-01-01:2024-02-01']
+
+def _plan(explicar, params):
+    """Pasos del plan de la consulta del listado con los filtros de params"""
+    recurso = Operaciones()
+    return explicar(recurso._query_base().filter(*recurso._generar_filtros(params)).statement)
+
+def _busqueda_en_operacion(plan):
+    return next(paso for paso in plan if ' operacion ' in f'{paso} ')
+
+@pytest.mark.parametrize('fecha', FECHAS)
+def test_filtro_fecha_usa_indice(explicar, fecha):
+    paso = _busqueda_en_operacion(_plan(explicar, {'fecha': fecha}))
+    assert paso.startswith('SEARCH operacion USING INDEX ix_operacion_fecha_id'), paso
+
+def test_filtro_fecha_combinado_usa_indice(explicar):
+    paso = _busqueda_en_operacion(_plan(explicar, {'fecha': '2024-03', 'tipo': 'egreso'}))
+    assert paso.startswith('SEARCH operacion USING'), paso
+    assert 'INDEX' in paso, paso
+
+@pytest.mark.parametrize('fecha, desde, hasta', [
+    ('2024', date(2024, 1, 1), date(2025, 1, 1)),
+    ('2024-03', date(2024, 3, 1), date(2024, 4, 1)),
+    ('202412', date(2024, 12, 1), date(2025, 1, 1)),
+    ('2024-03-05', date(2024, 3, 5), date(2024, 3, 6)),
+])
+def test_filtro_fecha_es_rango_semiabierto(cliente, fecha, desde, hasta):
+    esperadas = OperacionModel.query.filter(OperacionModel.fecha >= desde, OperacionModel.fecha < hasta).count()
+    respuesta = cliente.get(f'/api/operaciones?fecha={fecha}&per_page=500')
+    assert respuesta.status_code == 200
+    assert respuesta.json['total'] == esperadas
+    assert all(desde.isoformat() <= operacion['fecha'] < hasta.isoformat() for operacion in respuesta.json['operaciones'])
+
+@pytest.mark.parametrize('fecha', ['abc', '2025-3', '2025/03', '2024-13', '2024-02-30', 'x:2024-01-01'])
+def test_filtro_fecha_invalida(cliente, fecha):
+    respuesta = cliente.get(f'/api/operaciones?fecha={fecha}')
+    assert respuesta.status_code == 400
+    assert 'Fecha inválida' in respuesta.json['message']
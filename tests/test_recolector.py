@@ -0,0 +1,77 @@
+import os, io, hashlib
+import pytest
+from main import db
+from main.models import OperacionModel, ArchivoModel
+from main.resources.almacenamiento import CARPETA_OBJETOS, ruta_objeto, guardar_archivo
+from main.resources.recolector import (
+    reconciliar, _adjuntos_referenciados, HUERFANO_OBJETO, HUERFANO_ADJUNTO
+)
+
+def _escribir(ruta, contenido):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as archivo:
+        archivo.write(contenido)
+    # Más viejo que cualquier gracia
+    os.utime(ruta, (0, 0))
+    return ruta
+
+@pytest.fixture
+def carpeta_relativa(app, tmp_path, monkeypatch):
+    """UPLOAD_FOLDER relativa al directorio de trabajo, como en producción"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', 'uploads')
+    operacion = db.session.get(OperacionModel, 1)
+    yield operacion
+    operacion.comprobante_path = operacion.archivo1_path = None
+    db.session.commit()
+    db.session.execute(db.delete(ArchivoModel))
+    db.session.commit()
+
+def test_reconciliar_con_carpeta_relativa(carpeta_relativa):
+    operacion = carpeta_relativa
+    guardado = guardar_archivo(io.BytesIO(b'comprobante'))
+    os.utime(guardado, (0, 0))
+    anterior = _escribir(os.path.join('uploads', 'anterior.pdf'), b'adjunto anterior')
+    operacion.comprobante_path, operacion.archivo1_path = guardado, anterior
+    db.session.commit()
+
+    clave = hashlib.sha256(b'sin fila').hexdigest()
+    sin_fila = _escribir(ruta_objeto(clave), b'sin fila')
+    plana = _escribir(os.path.join('uploads', CARPETA_OBJETOS, hashlib.sha256(b'comprobante').hexdigest()), b'comprobante')
+    suelto = _escribir(os.path.join('uploads', 'suelto.pdf'), b'suelto')
+
+    encontrados = []
+    reconciliar(gracia=0, informar=lambda categoria, ruta, tamanio: encontrados.append((categoria, ruta)))
+
+    # Los archivos en uso no aparecen; una copia plana de un objeto registrado en su ruta
+    # repartida sí, porque la fila apunta a otra ruta
+    assert sorted(encontrados) == sorted([
+        (HUERFANO_OBJETO, sin_fila),
+        (HUERFANO_OBJETO, plana),
+        (HUERFANO_ADJUNTO, suelto),
+    ])
+
+def test_reconciliar_borra_solo_huerfanos(carpeta_relativa):
+    operacion = carpeta_relativa
+    guardado = guardar_archivo(io.BytesIO(b'en uso'))
+    os.utime(guardado, (0, 0))
+    operacion.comprobante_path = guardado
+    db.session.commit()
+    suelto = _escribir(os.path.join('uploads', 'suelto.pdf'), b'suelto')
+
+    reconciliar(eliminar=True, gracia=0)
+
+    assert os.path.exists(guardado)
+    assert not os.path.exists(suelto)
+
+def test_adjuntos_referenciados_usa_indices(app, contar_consultas):
+    with contar_consultas() as sentencias:
+        _adjuntos_referenciados(['uploads/a.pdf', 'uploads/b.pdf'])
+    conexion = db.session.connection()
+    pasos = [
+        fila[-1] for sentencia in sentencias
+        for fila in conexion.exec_driver_sql('EXPLAIN QUERY PLAN ' + sentencia, ('',) * sentencia.count('?'))
+    ]
+    db.session.rollback()
+    assert not [paso for paso in pasos if paso.startswith('SCAN operacion')], pasos
+    assert any('ix_operacion_comprobante_path' in paso for paso in pasos), pasos
@@ -0,0 +1,61 @@
+import os, hashlib
+import pytest
+from main import db
+from main.models import OperacionModel, ArchivoModel
+from main.resources.almacenamiento import ruta_objeto
+from main.resources.subida import ruta_parcial
+
+CONTENIDO = b'contenido de la subida por partes'
+
+@pytest.fixture
+def subida(cliente):
+    """Subida del comprobante de la operación 3 con todas sus partes recibidas"""
+    operacion = db.session.get(OperacionModel, 3)
+    anterior = operacion.comprobante_path
+    clave = hashlib.sha256(CONTENIDO).hexdigest()
+    respuesta = cliente.post('/api/operacion/3/archivo/comprobante/subidas', json={
+        'nombre': 'comprobante.pdf', 'tipo': 'pdf', 'tamanio': len(CONTENIDO), 'sha256': clave,
+    })
+    assert respuesta.status_code == 201
+    id = respuesta.json['id']
+    assert cliente.put(f'/api/subidas/{id}?offset=0', data=CONTENIDO).status_code == 200
+    yield id, clave
+    db.session.rollback()
+    operacion = db.session.get(OperacionModel, 3)
+    operacion.comprobante_path = anterior
+    db.session.commit()
+    db.session.execute(db.delete(ArchivoModel).where(ArchivoModel.hash == clave))
+    db.session.commit()
+    for ruta in (ruta_objeto(clave), ruta_parcial(id)):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+def test_finalizar(cliente, subida):
+    id, clave = subida
+    respuesta = cliente.post(f'/api/subidas/{id}/finalizar')
+    assert respuesta.status_code == 200
+    assert db.session.get(OperacionModel, 3).comprobante_path == ruta_objeto(clave)
+    with open(ruta_objeto(clave), 'rb') as archivo:
+        assert archivo.read() == CONTENIDO
+    assert not os.path.exists(ruta_parcial(id))
+
+def test_finalizar_con_commit_fallido_conserva_la_subida(cliente, subida, monkeypatch):
+    id, clave = subida
+    commit = db.session.commit
+    def fallar():
+        monkeypatch.setattr(db.session, 'commit', commit)
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(db.session, 'commit', fallar)
+
+    respuesta = cliente.post(f'/api/subidas/{id}/finalizar')
+    assert respuesta.status_code == 500
+    # Ni objeto sin registrar ni subida perdida
+    assert not os.path.exists(ruta_objeto(clave))
+    assert os.path.getsize(ruta_parcial(id)) == len(CONTENIDO)
+    assert cliente.get(f'/api/subidas/{id}').json['recibido'] == len(CONTENIDO)
+
+    respuesta = cliente.post(f'/api/subidas/{id}/finalizar')
+    assert respuesta.status_code == 200
+    assert db.session.get(OperacionModel, 3).comprobante_path == ruta_objeto(clave)
+    assert os.path.exists(ruta_objeto(clave))
+    assert not os.path.exists(ruta_parcial(id))
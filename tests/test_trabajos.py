@@ -0,0 +1,99 @@
+import os, time, uuid, hashlib
+import pytest
+from main import db
+from main.models import OperacionModel
+from main.models.version import versiones_tablas
+from main.resources import trabajo
+
+def _archivo(carpeta, nombre, viejo=True):
+    ruta = os.path.join(carpeta, nombre)
+    with open(ruta, 'w') as archivo:
+        archivo.write('x')
+    if viejo:
+        os.utime(ruta, (0, 0))
+    return ruta
+
+@pytest.fixture
+def carpeta(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_FOLDER', str(tmp_path))
+    return str(tmp_path)
+
+def test_limpiar_vencidos_solo_borra_exportaciones(carpeta, monkeypatch):
+    clave = hashlib.sha256(b'exportacion').hexdigest()
+    activo = uuid.uuid4().hex
+    monkeypatch.setitem(trabajo._trabajos, activo, {'estado': 'procesando', 'ruta': ''})
+
+    os.mkdir(os.path.join(carpeta, 'subcarpeta'))
+    os.utime(os.path.join(carpeta, 'subcarpeta'), (0, 0))
+    ajeno = _archivo(carpeta, 'notas.txt')
+    vencido = _archivo(carpeta, f'{clave}.csv')
+    vigente = _archivo(carpeta, f'{clave}.xlsx', viejo=False)
+    temporal_abandonado = _archivo(carpeta, f'{clave}.csv.{uuid.uuid4().hex}.tmp')
+    temporal_activo = _archivo(carpeta, f'{clave}.csv.{activo}.tmp')
+
+    trabajo._limpiar_vencidos()
+
+    assert os.path.isdir(os.path.join(carpeta, 'subcarpeta'))
+    assert os.path.exists(ajeno) and os.path.exists(vigente) and os.path.exists(temporal_activo)
+    assert not os.path.exists(vencido) and not os.path.exists(temporal_abandonado)
+
+def _esperar(cliente, id):
+    for _ in range(100):
+        estado = cliente.get(f'/api/operaciones/export/jobs/{id}').json['estado']
+        if estado not in ('pendiente', 'procesando'):
+            return estado
+        time.sleep(0.05)
+
+def test_crear_exportacion_con_subcarpeta(cliente, carpeta):
+    os.mkdir(os.path.join(carpeta, 'subcarpeta'))
+    os.utime(os.path.join(carpeta, 'subcarpeta'), (0, 0))
+    for _ in range(2):
+        respuesta = cliente.post('/api/operaciones/export/jobs', json={'format': 'csv'})
+        assert respuesta.status_code in (200, 202)
+        assert _esperar(cliente, respuesta.json['id']) == 'terminado'
+
+@pytest.fixture
+def trabajo_csv(app, carpeta, monkeypatch):
+    """Un trabajo registrado como lo hace el POST, para ejecutarlo en este hilo"""
+    id = uuid.uuid4().hex
+    monkeypatch.setitem(trabajo._trabajos, id, {
+        'clave': None, 'formato': 'csv', 'filtros': {}, 'ruta': None, 'estado': 'pendiente',
+        'progreso': 0, 'total': None, 'reutilizado': False, 'creado': None, 'terminado': None, 'error': None,
+    })
+    yield id
+    db.session.execute(db.update(OperacionModel).where(OperacionModel.id == 10).values(observaciones='Operación 9'))
+    db.session.commit()
+
+def _escritor_que_modifica(monkeypatch, veces):
+    """Escritor csv que confirma un cambio en una operación mientras escribe, las primeras veces"""
+    escribir, llamadas = trabajo.ESCRITORES['csv'], []
+    def escribir_y_modificar(filas, ruta):
+        llamadas.append(ruta)
+        escribir(filas, ruta)
+        if len(llamadas) <= veces:
+            db.session.execute(
+                db.update(OperacionModel).where(OperacionModel.id == 10).values(observaciones=f'cambio {len(llamadas)}')
+            )
+            db.session.commit()
+    monkeypatch.setitem(trabajo.ESCRITORES, 'csv', escribir_y_modificar)
+    return llamadas
+
+def test_exportacion_se_guarda_con_las_versiones_de_sus_datos(app, carpeta, trabajo_csv, monkeypatch):
+    llamadas = _escritor_que_modifica(monkeypatch, veces=1)
+    trabajo._ejecutar(app, trabajo_csv, 'csv', {})
+
+    resultado = trabajo._trabajos[trabajo_csv]
+    assert resultado['estado'] == 'terminado'
+    assert len(llamadas) == 2
+    assert resultado['ruta'] == trabajo._ruta(trabajo._clave('csv', {}, versiones_tablas()), 'csv')
+    with open(resultado['ruta'], encoding='utf-8') as archivo:
+        assert 'cambio 1' in archivo.read()
+    assert sorted(os.listdir(carpeta)) == [os.path.basename(resultado['ruta'])]
+
+def test_exportacion_con_datos_que_no_dejan_de_cambiar(app, carpeta, trabajo_csv, monkeypatch):
+    llamadas = _escritor_que_modifica(monkeypatch, veces=trabajo.INTENTOS)
+    trabajo._ejecutar(app, trabajo_csv, 'csv', {})
+
+    assert trabajo._trabajos[trabajo_csv]['estado'] == 'error'
+    assert len(llamadas) == trabajo.INTENTOS
+    assert os.listdir(carpeta) == []
@@ -0,0 +1,101 @@
+import random
+import pytest
+import pandas as pd
+from decimal import Decimal
+from main.models import OperacionModel, validacion
+from main.resources.operacion import Operaciones
+
+SEMILLA = 18
+CANTIDAD = 3000
+
+# Por campo, valores válidos, casi válidos y de otros tipos
+VALORES = {
+    'fecha': [
+        '2024-03-05', '2024-3-5', '2024-02-29', '2023-02-29', '2024-04-31', '2024-12-31', '0001-01-01',
+        '0000-01-01', '2024-13-01', '2024-00-10', '2024-1- 5', '2024-1-05 ', ' 2024-01-05', '24-01-05',
+        '2024/01/05', '20240105', '2024-01-05T00:00', '', 'abc', None, 20240105, 2024.0, True,
+    ],
+    'tipo': ['ingreso', 'egreso', 'EGRESO', 'Ingreso', 'egresos', ' egreso', '', None, 1],
+    'caracter': ['casa', 'oficina', 'CASA', 'Oficina ', 'otro', '', None, 0],
+    'naturaleza': ['societario', 'personal', 'PERSONAL', 'social', '', None, 3.5],
+    'option': ['factura', 'boleta', 'FACTURA', 'Boleta', 'recibo', '', None, 1],
+    'codigo': [
+        '00001-00000001', '12345-12345678', '1234-12345678', '12345-1234567', '12345-123456789',
+        '12345_12345678', '00001-00000001\n', '1000', '0', '12a', '١٢٣', '²', '-1', ' 12', '', None, 0, 1234,
+    ],
+    'metodo_de_pago': ['efectivo', 'transferencia', 'mixto', 'otro', 'EFECTIVO', 'cheque', '', None, 2],
+    'monto_total': [100, -50, 0, 10.5, Decimal('12.30'), True, float('inf'), '100', '', None, [1]],
+}
+
+def _operaciones(cantidad, semilla):
+    aleatorio = random.Random(semilla)
+    operaciones = []
+    for _ in range(cantidad):
+        operacion = {'id_persona': 1, 'id_subcategoria': 1, 'id_usuario': 1, 'observaciones': None}
+        for campo, valores in VALORES.items():
+            # Algunas operaciones no traen el campo: datos.get lo toma como None
+            if aleatorio.random() > 0.05:
+                operacion[campo] = aleatorio.choice(valores)
+        operaciones.append(operacion)
+    return operaciones
+
+def _error_constructor(datos):
+    try:
+        Operaciones._nueva_operacion(datos)
+    except Exception as e:
+        return str(e)
+    return None
+
+def _error_campo(datos, campo):
+    """Mensaje del validador del campo en una operación que ya tiene el comprobante que aceptó
+    el constructor"""
+    operacion = OperacionModel()
+    try:
+        operacion.option = datos.get('option')
+    except Exception:
+        pass
+    try:
+        setattr(operacion, campo, datos.get(campo))
+    except Exception as e:
+        return str(e)
+    return None
+
+@pytest.fixture(scope='module')
+def operaciones():
+    return _operaciones(CANTIDAD, SEMILLA)
+
+@pytest.fixture(scope='module')
+def errores(app, operaciones):
+    # Un solo lote: los mensajes se cachean por valor dentro del lote
+    return validacion.validar_operaciones(operaciones)
+
+def test_primer_error_coincide_con_el_constructor(operaciones, errores):
+    distintos = [
+        (datos, validacion.primer_error(error), _error_constructor(datos))
+        for datos, error in zip(operaciones, errores)
+        if validacion.primer_error(error) != _error_constructor(datos)
+    ]
+    assert not distintos, distintos[:5]
+
+@pytest.mark.parametrize('campo', validacion.CAMPOS_VALIDADOS)
+def test_error_por_campo_coincide_con_el_validador(operaciones, errores, campo):
+    distintos = [
+        (datos.get('option'), datos.get(campo), error.get(campo), _error_campo(datos, campo))
+        for datos, error in zip(operaciones, errores)
+        if error.get(campo) != _error_campo(datos, campo)
+    ]
+    assert not distintos, distintos[:5]
+
+def test_lote_con_valores_validos_y_invalidos_mezclados(app):
+    # El mismo valor con distinto comprobante da distinto resultado
+    errores = validacion.validar_operaciones([
+        {'fecha': '2024-01-05', 'tipo': 'egreso', 'caracter': 'casa', 'naturaleza': 'personal',
+         'option': 'boleta', 'codigo': '00001-00000001', 'metodo_de_pago': 'efectivo', 'monto_total': 10},
+        {'fecha': '2024-01-05', 'tipo': 'egreso', 'caracter': 'casa', 'naturaleza': 'personal',
+         'option': 'factura', 'codigo': '00001-00000001', 'metodo_de_pago': 'efectivo', 'monto_total': 10},
+    ])
+    assert errores == [{'codigo': 'El código de boleta debe ser numérico'}, {}]
+
+def test_lote_vacio(app):
+    assert validacion.validar_operaciones([]) == []
+    assert list(validacion.validar_lote(pd.DataFrame()).columns) == list(validacion.CAMPOS_VALIDADOS)